@@ -1,4 +1,26 @@
-from .helpers import *
-from .cte_impact import *
+import importlib
+import importlib.util
 
-__version__ = '1.3.1'
+__version__ = '1.3.8'
+
+# NOTE: the names of these modules are exported by the package, but they are imported on first use, so that importing
+# the package, e.g., to print the version, doesn't load pandas, numpy and the discovery libraries
+_EXPORTING_MODULES = ('helpers', 'cte_impact')
+
+
+def __getattr__(name: str):
+    if name.startswith('_'):
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+    # submodules, e.g., "from wta import profiling", are imported as such, without the exporting modules
+    if importlib.util.find_spec(f'{__name__}.{name}') is not None:
+        return importlib.import_module(f'{__name__}.{name}')
+
+    for module_name in _EXPORTING_MODULES:
+        module = importlib.import_module(f'{__name__}.{module_name}')
+        if hasattr(module, name):
+            value = getattr(module, name)
+            globals()[name] = value
+            return value
+
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
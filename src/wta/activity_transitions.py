@@ -1,17 +1,23 @@
 import concurrent.futures
-import multiprocessing
-from typing import Dict, Optional, Union
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Union
 
 import click
 import numpy as np
 import pandas as pd
 from tqdm import tqdm
 
-from wta import GRANULARITY_MINUTES
+from wta import GRANULARITY_MINUTES, profiling
 from wta.helpers import print_section_boundaries, convert_timestamp_columns_to_datetime, log_ids_non_nil, \
-    EventLogIDs, TRANSITION_COLUMN_KEY
+    encode_categorical_columns, decode_categorical, \
+    EventLogIDs, as_nanoseconds, NAT_NANOSECONDS
+from wta.scheduling import resolve_workers, balanced_chunks, split_large_cases, CHUNKS_PER_WORKER
+from wta.shared_log import SharedLog
 from wta.waiting_time import analysis as wt_analysis
-from wta.calendars.calendars import make as make_calendar
+from wta.waiting_time import vectorized as wt_vectorized
+from wta.waiting_time.resource_index import ResourceEventIndex
+from wta.waiting_time.window_cache import WaitingWindowCache
+from wta.calendars.calendars import make as make_calendar, compile_weekly_calendars
 
 
 CONVERT_COLUMNS = ['wt_total', 'wt_contention', 'wt_batching', 'wt_prioritization', 'wt_unavailability', 'wt_extraneous']
@@ -32,14 +38,48 @@ ORDERED_COLUMNS = [
 ]
 
 
-@print_section_boundaries('Activity Transitions Analysis')
+# State of a worker process attached to a log published into shared memory, see __shared_memory_run
+_worker_state = {}
+
+
+@print_section_boundaries('Activity Transitions Analysis', stage='transitions')
 def identify(log: pd.DataFrame, parallel_activities: Dict[str, set], parallel_run: bool = True,
-             log_ids: Optional[EventLogIDs] = None, calendar: Optional[Dict] = None) -> Optional[pd.DataFrame]:
+             log_ids: Optional[EventLogIDs] = None, calendar: Optional[Dict] = None,
+             shared_memory: bool = False, vectorized: bool = False,
+             n_workers: Optional[int] = None, partition_by_resource: bool = False) -> Optional[pd.DataFrame]:
+    """
+    Identifies activity transitions in every case of the log and analyzes their waiting time.
+
+    :param shared_memory: when running in parallel, publish the log into shared memory once and send only case IDs
+        to the workers, instead of pickling the whole log for every case.
+    :param vectorized: analyze the waiting time of all transitions of the log at once with the vectorized engine
+        instead of analyzing them case by case.
+    :param n_workers: number of worker processes of a parallel run, by default one less than the cores available to
+        the process, considering its CPU affinity and the CPU quota of its cgroup.
+    :param partition_by_resource: partition the log by resource instead of by case, so that every worker receives only
+        the events and calendar of its resources instead of the whole log. Transitions are marked in the main process
+        and the waiting time of their destinations is joined back to them.
+    """
     click.echo(f'Parallel run: {parallel_run}')
     log_ids = log_ids_non_nil(log_ids)
-    log_calendar = make_calendar_if_none(log, log_ids, calendar)
-    run_func = __multiprocess_run if parallel_run else __sequential_run
-    all_items = run_func(log, log_ids, log_calendar, parallel_activities)
+    # NOTE: the columns are converted in a shallow copy, so that the log of the caller keeps its dtypes
+    log = log.copy(deep=False)
+    # NOTE: timestamps are normalized once here, the cases and partitions of the log are never converted again
+    log = convert_timestamp_columns_to_datetime(log, log_ids)
+    log_calendar = make_calendar_if_none(log, log_ids, calendar, parallel_run, n_workers)
+    log = encode_categorical_columns(log, log_ids)
+    if vectorized:
+        click.echo('Vectorized run')
+        transitions = __vectorized_run(log, log_ids, log_calendar, parallel_activities)
+        return None if len(transitions) == 0 else transitions
+    if partition_by_resource:
+        click.echo('Resource-partitioned run')
+        run_func = __resource_partitioned_run if parallel_run else __resource_partitioned_sequential_run
+    elif parallel_run and shared_memory:
+        run_func = __shared_memory_run
+    else:
+        run_func = __multiprocess_run if parallel_run else __sequential_run
+    all_items = run_func(log, log_ids, log_calendar, parallel_activities, n_workers)
     return None if len(all_items) == 0 else process_all_items(all_items)
 
 
@@ -52,66 +92,385 @@ def process_all_items(all_items: pd.DataFrame) -> pd.DataFrame:
     return all_items[ORDERED_COLUMNS]
 
 
-def make_calendar_if_none(log, log_ids, calendar):
-    return make_calendar(log, granularity=GRANULARITY_MINUTES, log_ids=log_ids) if not calendar else calendar
+def make_calendar_if_none(log, log_ids, calendar, parallel_run=False, n_workers=None):
+    if calendar:
+        return calendar
+    with profiling.stage('calendar', rows=len(log)):
+        return make_calendar(log, granularity=GRANULARITY_MINUTES, log_ids=log_ids, parallel_run=parallel_run,
+                             n_workers=n_workers)
 
 
-def __sequential_run(log, log_ids, calendar, parallel_activities):
-    log_grouped = log.groupby(by=log_ids.case)
-    results_transitions = [identify_transitions_and_report(sort_case(case, log_ids), parallel_activities, case_id, calendar, log, log_ids)
+def __sequential_run(log, log_ids, calendar, parallel_activities, n_workers=None):
+    resource_index = ResourceEventIndex(log, log_ids)
+    weekly_calendars = compile_weekly_calendars(calendar)
+    window_cache = WaitingWindowCache()
+    log_grouped = log.groupby(by=log_ids.case, observed=True)
+    results_transitions = [identify_transitions_and_report(sort_case(case, log_ids), parallel_activities, case_id, calendar, log, log_ids,
+                                                           resource_index, weekly_calendars, window_cache)
                            for case_id, case in log_grouped]
+    profiling.add_counters(window_cache.counters())
     return concatenate_transitions_if_exists(results_transitions)
 
 
-def __multiprocess_run(log, log_ids, calendar, parallel_activities):
-    n_cores = multiprocessing.cpu_count() - 1
-    handles = []
-    log_grouped = log.groupby(by=log_ids.case)
+def __multiprocess_run(log, log_ids, calendar, parallel_activities, n_workers=None):
+    n_workers = resolve_workers(n_workers)
+    resource_index = ResourceEventIndex(log, log_ids)
+    weekly_calendars = compile_weekly_calendars(calendar)
+    cases = [(case_id, sort_case(case, log_ids)) for case_id, case in log.groupby(by=log_ids.case, observed=True)]
 
-    with concurrent.futures.ProcessPoolExecutor(max_workers=n_cores) as executor:
-        handles = [submit_task(executor, sort_case(case, log_ids), parallel_activities, case_id, calendar, log, log_ids)
-                   for case_id, case in tqdm(log_grouped, desc='Submitting tasks for concurrent execution')]
+    # NOTE: work is sent in chunks of similar number of events, so the log is pickled once per chunk, not per case
+    items = _work_items([len(case) for _, case in cases], lambda position: cases[position][1], parallel_activities,
+                        log_ids, n_workers)
+    chunks = balanced_chunks([item.size for item in items], n_workers * CHUNKS_PER_WORKER)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=n_workers) as executor:
+        handles = [executor.submit(identify_transitions_and_report_chunk, [_chunk_item(items[i], cases) for i in chunk],
+                                   parallel_activities, calendar, log, log_ids, resource_index, weekly_calendars)
+                   for chunk in tqdm(chunks, desc='Submitting tasks for concurrent execution')]
+        all_transitions = _gather_chunks(items, chunks, handles, len(cases))
 
-    all_transitions = [h.result() for h in tqdm(handles, desc='Waiting for tasks to finish') if not h.result().empty]
     return concatenate_transitions_if_exists(all_transitions)
 
 
-def sort_case(case, log_ids):
-    return case.sort_values(by=[log_ids.end_time, log_ids.start_time])
+@dataclass
+class _WorkItem:
+    """A case, or a part of the transitions of a long case, analyzed by a worker of a parallel run."""
+
+    position: int  # position of the case in the run
+    part: int  # number of the part of the case, 0 for cases analyzed as a whole
+    size: int  # number of events of the case, or transitions of the part
+    destinations: Optional[pd.Index] = None  # destination events of the part, None for cases analyzed as a whole
+    marked_case: Optional[pd.DataFrame] = None  # case with the marked transitions, for parts only
+
+
+def _work_items(case_sizes, get_case, parallel_activities, log_ids, n_workers) -> List[_WorkItem]:
+    """
+    Splits the work of a parallel run. Most cases are analyzed as a whole by a worker, but the transitions of very long
+    cases are split into parts analyzed by different workers, so that a single case doesn't keep one core busy until
+    the end of the run. The transitions of those cases are marked here, once, and sent with every part.
+    """
+    split_cases = split_large_cases(case_sizes, n_workers)
+    items = []
+    for position, size in enumerate(case_sizes):
+        if position not in split_cases:
+            items.append(_WorkItem(position, 0, size))
+            continue
+
+        case = get_case(position)
+        mark_activity_transitions(case, parallel_activities, log_ids=log_ids)
+        destinations = case.index[case[log_ids.transition_source_index].notna()]
+        n_parts = max(min(split_cases[position], len(destinations)), 1)
+        for part, part_positions in enumerate(np.array_split(np.arange(len(destinations)), n_parts)):
+            items.append(_WorkItem(position, part, len(part_positions), destinations[part_positions], case))
+    return items
+
+
+def _chunk_item(item: '_WorkItem', cases):
+    case_id, case = cases[item.position]
+    return case_id, case if item.marked_case is None else item.marked_case, item.destinations
+
+
+def identify_transitions_and_report_chunk(cases, parallel_activities, calendar, log, log_ids, resource_index=None,
+                                          weekly_calendars=None):
+    """
+    Analyzes a chunk of (case_id, case, destinations) items, see _WorkItem. Returns the transitions of every item and
+    the counters of the window cache of the chunk.
+    """
+    window_cache = WaitingWindowCache()
+    return [identify_transitions_and_report(case, parallel_activities, case_id, calendar, log, log_ids,
+                                            resource_index, weekly_calendars, window_cache)
+            if destinations is None else
+            report_transitions(case, case_id, calendar, log, log_ids, resource_index, weekly_calendars, destinations,
+                               window_cache)
+            for case_id, case, destinations in cases], window_cache.counters()
+
+
+def _gather_chunks(items, chunks, handles, n_cases):
+    """
+    Transitions of the cases processed in chunks, in the order of the cases, skipping cases without transitions. The
+    counters of the chunks are added to the current stage.
+    """
+    parts = [[] for _ in range(n_cases)]
+    for chunk, handle in zip(chunks, tqdm(handles, desc='Waiting for tasks to finish')):
+        chunk_transitions, counters = handle.result()
+        profiling.add_counters(counters)
+        for i, transitions in zip(chunk, chunk_transitions):
+            parts[items[i].position].append((items[i].part, transitions))
+
+    results = []
+    for case_parts in parts:
+        case_parts = [transitions for _, transitions in sorted(case_parts, key=lambda part: part[0])]
+        transitions = case_parts[0] if len(case_parts) == 1 else pd.concat(case_parts, ignore_index=True)
+        if not transitions.empty:
+            results.append(transitions)
+    return results
+
+
+def __vectorized_run(log, log_ids, calendar, parallel_activities):
+    transition_sources = mark_transition_sources(log, log_ids, parallel_activities)
+    return wt_vectorized.run(log, calendar, transition_sources, log_ids=log_ids)
+
+
+def __resource_partitioned_sequential_run(log, log_ids, calendar, parallel_activities, n_workers=None):
+    transition_sources = mark_transition_sources(log, log_ids, parallel_activities)
+    components = analyze_destinations(log, log_ids, calendar, transition_sources.index, parallel_run=False)
+    return join_transitions(log, log_ids, transition_sources, components)
+
+
+def __resource_partitioned_run(log, log_ids, calendar, parallel_activities, n_workers=None):
+    transition_sources = mark_transition_sources(log, log_ids, parallel_activities)
+    components = analyze_destinations(log, log_ids, calendar, transition_sources.index, parallel_run=True,
+                                      n_workers=n_workers)
+    return join_transitions(log, log_ids, transition_sources, components)
+
+
+def analyze_destinations(log, log_ids, calendar, destinations: pd.Index, parallel_run: bool = False,
+                         n_workers: Optional[int] = None) -> pd.DataFrame:
+    """
+    Waiting time components of the given destination events, indexed by their labels in the log. The log is
+    partitioned by resource and every partition, or task of a parallel run, receives only the events and calendar of
+    its resource.
+    """
+    partitions = list(_resource_partitions(log, log_ids, calendar, destinations))
+    if not parallel_run:
+        components, counters = analyze_resource_partitions_chunk(partitions, log_ids)
+        profiling.add_counters(counters)
+    else:
+        n_workers = resolve_workers(n_workers)
+        # NOTE: tasks are balanced by the number of destinations to analyze
+        chunks = balanced_chunks([len(partition_destinations) for _, partition_destinations, _ in partitions],
+                                 n_workers * CHUNKS_PER_WORKER)
+        with concurrent.futures.ProcessPoolExecutor(max_workers=n_workers) as executor:
+            handles = [executor.submit(analyze_resource_partitions_chunk, [partitions[i] for i in chunk], log_ids)
+                       for chunk in tqdm(chunks, desc='Submitting tasks for concurrent execution')]
+            components = []
+            for handle in tqdm(handles, desc='Waiting for tasks to finish'):
+                chunk_components, counters = handle.result()
+                profiling.add_counters(counters)
+                components.extend(chunk_components)
+
+    if len(components) == 0:
+        return wt_analysis.run_destinations(pd.Index([], dtype=log.index.dtype), log, calendar, log_ids=log_ids)
+    return pd.concat(components)
+
+
+def mark_transition_sources(log, log_ids, parallel_activities) -> pd.Series:
+    """
+    Labels of the sources of the transitions to every destination event of the log, indexed by the labels of the
+    destinations, in the order the cases are reported.
+    """
+    transition_sources = []
+    for _, case in log.groupby(by=log_ids.case, observed=True):
+        case = sort_case(case, log_ids)
+        mark_activity_transitions(case, parallel_activities, log_ids=log_ids)
+        transition_sources.append(case[log_ids.transition_source_index].dropna())
+
+    transition_sources = pd.concat(transition_sources) if transition_sources else pd.Series(dtype=float)
+    return transition_sources.astype(log.index.dtype)
+
+
+def _resource_partitions(log, log_ids, calendar, destinations):
+    """
+    Yields the events of every resource, the destinations among them and the calendar of the resource. Events
+    without resource make a partition of their own.
+    """
+    is_destination = log.index.isin(destinations)
+    for resource, positions in log.groupby(by=log_ids.resource, sort=False, dropna=False,
+                                           observed=True).indices.items():
+        if not is_destination[positions].any():
+            continue
+        partition = log.iloc[positions].copy()
+        resource_calendar = {resource: calendar[resource]} if not pd.isna(resource) and resource in calendar else {}
+        yield partition, partition.index[is_destination[positions]], resource_calendar
+
 
+def analyze_resource_partition(partition, destinations, resource_calendar, log_ids,
+                               window_cache=None) -> pd.DataFrame:
+    """Waiting time components of the destination events of a resource, given only the events of that resource."""
+    return wt_analysis.run_destinations(destinations, partition, resource_calendar, log_ids=log_ids,
+                                        resource_index=ResourceEventIndex(partition, log_ids),
+                                        weekly_calendars=compile_weekly_calendars(resource_calendar),
+                                        window_cache=window_cache)
 
-def submit_task(executor, case, parallel_activities, case_id, calendar, log, log_ids):
-    return executor.submit(identify_transitions_and_report, case, parallel_activities, case_id, calendar, log, log_ids)
+
+def analyze_resource_partitions_chunk(partitions, log_ids):
+    """
+    Analyzes a chunk of (partition, destinations, resource calendar) items, see _resource_partitions. Returns the
+    components of every partition and the counters of the window cache of the chunk.
+    """
+    window_cache = WaitingWindowCache()
+    return [analyze_resource_partition(partition, destinations, resource_calendar, log_ids, window_cache)
+            for partition, destinations, resource_calendar in partitions], window_cache.counters()
+
+
+def join_transitions(log, log_ids, transition_sources, components) -> Optional[pd.DataFrame]:
+    """
+    Joins the waiting time components of every destination, see analyze_destinations, back to its transition, in the
+    order of the transition sources, see mark_transition_sources.
+    """
+    if len(transition_sources) == 0:
+        return None
+
+    components = components.reindex(transition_sources.index)
+    sources = log.loc[transition_sources.values]
+    destinations = log.loc[transition_sources.index]
+    transitions = pd.DataFrame({
+        'source_activity': decode_categorical(sources[log_ids.activity]).array,
+        'source_resource': decode_categorical(sources[log_ids.resource]).fillna('NA').array,
+        'destination_activity': decode_categorical(destinations[log_ids.activity]).array,
+        'destination_resource': decode_categorical(destinations[log_ids.resource]).fillna('NA').array,
+        'start_time': sources[log_ids.start_time].array,
+        'end_time': sources[log_ids.end_time].array,
+        'case_id': decode_categorical(destinations[log_ids.case]).array,
+    })
+    for column in components.columns:
+        transitions[column] = components[column].array
+    return transitions
+
+
+def __shared_memory_run(log, log_ids, calendar, parallel_activities, n_workers=None):
+    n_workers = resolve_workers(n_workers)
+    case_positions = log.groupby(by=log_ids.case, observed=True).indices
+    case_ids = list(case_positions)
+    resource_index = ResourceEventIndex(log, log_ids)
+    weekly_calendars = compile_weekly_calendars(calendar)
+
+    # NOTE: only the parts of long cases are sent with their marked case, other cases are attached from shared memory
+    items = _work_items([len(case_positions[case_id]) for case_id in case_ids],
+                        lambda position: sort_case(log.iloc[case_positions[case_ids[position]]], log_ids),
+                        parallel_activities, log_ids, n_workers)
+    chunks = balanced_chunks([item.size for item in items], n_workers * CHUNKS_PER_WORKER)
+
+    shared_log = SharedLog.publish(log)
+    try:
+        with concurrent.futures.ProcessPoolExecutor(
+                max_workers=n_workers,
+                initializer=attach_shared_log,
+                initargs=(shared_log, log_ids, calendar, parallel_activities, resource_index,
+                          weekly_calendars)) as executor:
+            handles = [executor.submit(identify_transitions_and_report_shared_chunk,
+                                       [(case_ids[items[i].position], items[i].marked_case, items[i].destinations)
+                                        for i in chunk])
+                       for chunk in tqdm(chunks, desc='Submitting tasks for concurrent execution')]
+            all_transitions = _gather_chunks(items, chunks, handles, len(case_ids))
+    finally:
+        shared_log.close()
+        shared_log.unlink()
+
+    return concatenate_transitions_if_exists(all_transitions)
+
+
+def attach_shared_log(shared_log: SharedLog, log_ids, calendar, parallel_activities, resource_index, weekly_calendars):
+    """Initializer of the worker processes, attaches to the shared log once per process."""
+    log = shared_log.attach()
+    _worker_state.update({
+        'shared_log': shared_log,  # keeps the shared memory blocks open while the log is in use
+        'log': log,
+        'case_positions': log.groupby(by=log_ids.case, observed=True).indices,
+        'log_ids': log_ids,
+        'calendar': calendar,
+        'parallel_activities': parallel_activities,
+        'resource_index': resource_index,
+        'weekly_calendars': weekly_calendars,
+    })
+
+
+def identify_transitions_and_report_shared(case_id, window_cache=None):
+    log = _worker_state['log']
+    log_ids = _worker_state['log_ids']
+    case = sort_case(log.iloc[_worker_state['case_positions'][case_id]], log_ids)
+    return identify_transitions_and_report(case, _worker_state['parallel_activities'], case_id,
+                                           _worker_state['calendar'], log, log_ids, _worker_state['resource_index'],
+                                           _worker_state['weekly_calendars'], window_cache)
+
+
+def report_transitions_shared(case, case_id, destinations, window_cache=None):
+    return report_transitions(case, case_id, _worker_state['calendar'], _worker_state['log'], _worker_state['log_ids'],
+                              _worker_state['resource_index'], _worker_state['weekly_calendars'], destinations,
+                              window_cache)
+
+
+def identify_transitions_and_report_shared_chunk(cases):
+    """
+    Analyzes a chunk of (case_id, marked case, destinations) items, see _WorkItem. Returns the transitions of every
+    item and the counters of the window cache of the chunk.
+    """
+    window_cache = WaitingWindowCache()
+    return [identify_transitions_and_report_shared(case_id, window_cache) if destinations is None else
+            report_transitions_shared(case, case_id, destinations, window_cache)
+            for case_id, case, destinations in cases], window_cache.counters()
+
+
+def sort_case(case, log_ids):
+    return case.sort_values(by=[log_ids.end_time, log_ids.start_time])
 
 
 def concatenate_transitions_if_exists(results_transitions):
     return pd.concat(results_transitions, ignore_index=True) if results_transitions else None
 
 
-def identify_transitions_and_report(case, parallel_activities, case_id, log_calendar, log, log_ids):
-    case = convert_timestamp_columns_to_datetime(case, log_ids)
-    log = convert_timestamp_columns_to_datetime(log, log_ids)
+def identify_transitions_and_report(case, parallel_activities, case_id, log_calendar, log, log_ids, resource_index=None,
+                                    weekly_calendars=None, window_cache=None):
+    """Identifies and analyzes the transitions of the case, the timestamps of the log must be normalized."""
     mark_activity_transitions(case, parallel_activities, log_ids=log_ids)
-    transitions = wt_analysis.run(case, log_calendar, log, log_ids=log_ids)
+    transitions = wt_analysis.run(case, log_calendar, log, log_ids=log_ids, resource_index=resource_index,
+                                  weekly_calendars=weekly_calendars, window_cache=window_cache)
+    transitions['case_id'] = case_id
+    return transitions
+
+
+def report_transitions(case, case_id, log_calendar, log, log_ids, resource_index=None, weekly_calendars=None,
+                       destinations=None, window_cache=None):
+    """
+    Analyzes the waiting time of the transitions already marked in the case, or only of the transitions to the
+    destinations if given.
+    """
+    transitions = wt_analysis.run(case, log_calendar, log, log_ids=log_ids, resource_index=resource_index,
+                                  weekly_calendars=weekly_calendars, destinations=destinations,
+                                  window_cache=window_cache)
     transitions['case_id'] = case_id
     return transitions
 
 
 def mark_activity_transitions(case, parallel_activities, log_ids):
-    case[log_ids.transition_source_index] = np.NAN
-    reversed_index = list(reversed(case.index))
-    for i in range(len(reversed_index)):
-        non_concurrent_previous_event_found = False
-        index = reversed_index[i]
-        current_event = case.loc[index]
-        parallel_activities_for_current_event = parallel_activities.get(current_event[log_ids.activity], [])
-        previous_event_index_delta = i + 1
-        while not non_concurrent_previous_event_found and previous_event_index_delta <= len(reversed_index) - 1:
-            previous_event_index = reversed_index[previous_event_index_delta]
-            previous_event = case.loc[previous_event_index]
-            overlapping_activity_instances = previous_event[log_ids.end_time] > current_event[log_ids.start_time]
-            if previous_event[log_ids.activity] in parallel_activities_for_current_event or overlapping_activity_instances:
-                previous_event_index_delta += 1
-            else:
-                case.at[index, TRANSITION_COLUMN_KEY] = previous_event_index
-                non_concurrent_previous_event_found = True
+    """
+    Marks the source of the transition to every event of the case in the transition_source_index column: the closest
+    previous event that ended before the event started and is not of a parallel activity.
+
+    Previous events are the ones before in the case, which is expected to be sorted by end time as sort_case() does.
+    Then, the events that ended before an event started are a prefix of the case, found with a binary search, and the
+    closest previous event of a non-parallel activity is a running maximum of positions computed once per activity.
+    """
+    activities, activity_names = pd.factorize(case[log_ids.activity])
+    starts = as_nanoseconds(case[log_ids.start_time])
+    ends = as_nanoseconds(case[log_ids.end_time])
+    positions = np.arange(len(case))
+
+    # NOTE: events without end time are sorted last and never overlap with other events, the same as events without
+    # start time, so they are not limited by the binary search
+    with_end = np.count_nonzero(ends != NAT_NANOSECONDS)
+    sorted_by_end = (ends[with_end:] == NAT_NANOSECONDS).all() and (np.diff(ends[:with_end]) >= 0).all()
+    if sorted_by_end:
+        ended_before = np.searchsorted(ends[:with_end], starts, 'right')
+        ended_before[starts == NAT_NANOSECONDS] = with_end
+        ended_before = np.minimum(ended_before, positions)
+
+    sources = np.full(len(case), -1)
+    for activity in np.unique(activities):
+        selected = np.flatnonzero(activities == activity)
+        parallel = parallel_activities.get(activity_names[activity], []) if activity >= 0 else []
+        parallel_codes = [code for code, name in enumerate(activity_names) if name in parallel]
+        eligible = ~np.isin(activities, parallel_codes)
+        # last_eligible[q] is the position of the last event before q of a non-parallel activity, -1 if none
+        last_eligible = np.concatenate([[-1], np.maximum.accumulate(np.where(eligible, positions, -1))])
+        if sorted_by_end:
+            in_tail = last_eligible[selected] >= with_end
+            sources[selected] = np.where(in_tail, last_eligible[selected], last_eligible[ended_before[selected]])
+        else:
+            for position in selected:
+                overlapping = (ends > starts[position]) & (ends != NAT_NANOSECONDS) & \
+                              (starts[position] != NAT_NANOSECONDS)
+                candidates = np.flatnonzero(eligible[:position] & ~overlapping[:position])
+                sources[position] = candidates[-1] if len(candidates) > 0 else -1
+
+    labels = case.index.to_numpy()
+    case[log_ids.transition_source_index] = np.where(sources >= 0, labels[np.maximum(sources, 0)], np.NAN)
@@ -0,0 +1,2 @@
+from .generator import LogShape, generate_log
+from .scenarios import SCENARIOS, ScenarioResult, run_benchmarks
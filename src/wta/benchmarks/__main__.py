@@ -0,0 +1,41 @@
+import json
+from pathlib import Path
+from typing import Optional, Tuple
+
+import click
+
+from wta.benchmarks import LogShape, SCENARIOS, run_benchmarks
+
+
+@click.command()
+@click.option('-o', '--output_path', default=None, type=Path,
+              help='Path to a JSON file where the results will be saved. They are printed if not set.')
+@click.option('-s', '--scenario', 'scenarios', multiple=True, type=click.Choice(list(SCENARIOS)),
+              help='Scenario to run. Can be repeated. All scenarios are run if not set.')
+@click.option('-r', '--repeats', default=3, show_default=True, type=int,
+              help='Number of times every scenario is run, the best time is reported.')
+@click.option('--cases', default=LogShape.n_cases, show_default=True, type=int)
+@click.option('--events_per_case', default=LogShape.events_per_case, show_default=True, type=int)
+@click.option('--resources', default=LogShape.n_resources, show_default=True, type=int)
+@click.option('--batch_rate', default=LogShape.batch_rate, show_default=True, type=float)
+@click.option('--overlap', default=LogShape.overlap, show_default=True, type=float)
+@click.option('--calendar', default=LogShape.calendar, show_default=True, type=click.Choice(['24/7', 'office']))
+@click.option('--seed', default=LogShape.seed, show_default=True, type=int)
+def main(output_path: Optional[Path], scenarios: Tuple[str, ...], repeats: int, cases: int, events_per_case: int,
+         resources: int, batch_rate: float, overlap: float, calendar: str, seed: int):
+    """Runs the benchmark scenarios on a synthetic event log."""
+    shape = LogShape(n_cases=cases, events_per_case=events_per_case, n_resources=resources, batch_rate=batch_rate,
+                     overlap=overlap, calendar=calendar, seed=seed)
+    results = run_benchmarks(shape, scenarios=scenarios or None, repeats=repeats)
+
+    if output_path is None:
+        click.echo(json.dumps(results, indent=2))
+        return
+
+    with output_path.open('w') as f:
+        json.dump(results, f, indent=2)
+    click.echo(f'Saving benchmark results to {output_path}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+from dataclasses import dataclass, asdict
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from wta.helpers import EventLogIDs, log_ids_non_nil
+
+WORKDAY_SECONDS = 8 * 60 * 60
+WORKDAY_START = pd.Timedelta(hours=9)
+
+
+@dataclass
+class LogShape:
+    """Parameters of a synthetic event log, see generate_log."""
+
+    n_cases: int = 1000
+    events_per_case: int = 10
+    n_resources: int = 20
+    batch_rate: float = 0.1  # fraction of events processed in batches with events of other cases
+    batch_size: int = 3  # number of events in a batch
+    overlap: float = 0.1  # probability of an event starting before the previous one in the case ends
+    calendar: str = '24/7'  # '24/7' or 'office', i.e., Monday to Friday from 9:00 to 17:00 UTC
+    mean_arrival_seconds: float = 30 * 60  # mean time between the arrival of two cases
+    mean_waiting_seconds: float = 60 * 60  # mean time between two consecutive events of a case
+    mean_processing_seconds: float = 20 * 60
+    seed: int = 42
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+def generate_log(shape: Optional[LogShape] = None, log_ids: Optional[EventLogIDs] = None) -> pd.DataFrame:
+    """
+    Generates an event log with the given shape. The same shape, including the seed, always produces the same log.
+
+    Cases arrive with exponential inter-arrival times and follow the same sequence of activities, each one executed by
+    a random resource after an exponential waiting time. Overlapping events start during the previous event of their
+    case, which makes them look concurrent. Batched events of the same activity are aligned to start at the same time
+    on the same resource. With the office calendar, times are laid out only over working hours.
+    """
+    shape = shape or LogShape()
+    log_ids = log_ids_non_nil(log_ids)
+    rng = np.random.default_rng(shape.seed)
+
+    n_events = shape.n_cases * shape.events_per_case
+    cases = np.repeat(np.arange(shape.n_cases), shape.events_per_case)
+    positions = np.tile(np.arange(shape.events_per_case), shape.n_cases)
+
+    # working time offsets in seconds, computed within each case from its arrival
+    arrivals = np.cumsum(rng.exponential(shape.mean_arrival_seconds, shape.n_cases))
+    waiting = rng.exponential(shape.mean_waiting_seconds, n_events)
+    processing = rng.exponential(shape.mean_processing_seconds, n_events) + 1
+    overlapping = (rng.random(n_events) < shape.overlap) & (positions > 0)
+
+    starts = np.empty(n_events)
+    ends = np.empty(n_events)
+    for position in range(shape.events_per_case):
+        current = positions == position
+        if position == 0:
+            starts[current] = arrivals + waiting[current]
+        else:
+            previous_starts, previous_ends = starts[np.flatnonzero(current) - 1], ends[np.flatnonzero(current) - 1]
+            starts[current] = np.where(overlapping[current],
+                                       previous_starts + (previous_ends - previous_starts) * rng.random(current.sum()),
+                                       previous_ends + waiting[current])
+        ends[current] = starts[current] + processing[current]
+
+    activities = np.array([f'Activity {i}' for i in range(shape.events_per_case)])[positions]
+    resources = np.array([f'Resource {i}' for i in range(shape.n_resources)])[
+        rng.integers(0, shape.n_resources, n_events)]
+
+    _align_batches(rng, shape, activities, resources, starts, ends, processing)
+
+    origin = pd.Timestamp('2023-01-02', tz='UTC')  # a Monday
+    log = pd.DataFrame({
+        log_ids.case: cases,
+        log_ids.activity: activities,
+        log_ids.resource: resources,
+        log_ids.start_time: _to_timestamps(starts, origin, shape.calendar),
+        log_ids.end_time: _to_timestamps(ends, origin, shape.calendar),
+    })
+    return log.sort_values(by=[log_ids.case, log_ids.start_time, log_ids.end_time], ignore_index=True)
+
+
+def _align_batches(rng: np.random.Generator, shape: LogShape, activities: np.ndarray, resources: np.ndarray,
+                   starts: np.ndarray, ends: np.ndarray, processing: np.ndarray):
+    """Groups the sampled batched events by activity and makes every group start together on the same resource."""
+    batched = np.flatnonzero(rng.random(len(starts)) < shape.batch_rate)
+    if len(batched) == 0:
+        return
+
+    # events of the same activity are batched in the order of their start time
+    batched = batched[np.lexsort((starts[batched], activities[batched]))]
+    batch_activities = activities[batched]
+    new_activity = np.ones(len(batched), dtype=bool)
+    new_activity[1:] = batch_activities[1:] != batch_activities[:-1]
+    rank = np.arange(len(batched)) - np.maximum.accumulate(np.where(new_activity, np.arange(len(batched)), 0))
+    batch_ids = np.cumsum(new_activity | (rank % shape.batch_size == 0))
+
+    batch_starts = pd.Series(starts[batched]).groupby(batch_ids).transform('max').to_numpy()
+    batch_resources = pd.Series(resources[batched]).groupby(batch_ids).transform('first').to_numpy()
+    # NOTE: an event can only be delayed by its batch, so the events after it in the case may overlap with it
+    starts[batched] = batch_starts
+    ends[batched] = batch_starts + processing[batched]
+    resources[batched] = batch_resources
+
+
+def _to_timestamps(seconds: np.ndarray, origin: pd.Timestamp, calendar: str) -> pd.Series:
+    seconds = np.round(seconds)
+    if calendar == '24/7':
+        return pd.Series(origin + pd.to_timedelta(seconds, unit='s'))
+    if calendar != 'office':
+        raise ValueError(f'Unknown calendar shape: {calendar}')
+
+    # working seconds are laid out over working days of 8 hours, from Monday to Friday
+    workdays, seconds_in_day = np.divmod(seconds, WORKDAY_SECONDS)
+    weeks, weekday = np.divmod(workdays, 5)
+    days = weeks * 7 + weekday
+    return pd.Series(origin + WORKDAY_START + pd.to_timedelta(days, unit='D')
+                     + pd.to_timedelta(seconds_in_day, unit='s'))
@@ -0,0 +1,205 @@
+import platform
+import subprocess
+import sys
+from dataclasses import dataclass, asdict
+from typing import Callable, Dict, List, Optional, Iterable
+
+import numpy as np
+import pandas as pd
+
+from batch_processing_discovery.discovery import discover_batches
+from wta import activity_transitions, profiling
+from wta.benchmarks.generator import LogShape, generate_log
+from wta.calendars.calendars import make as make_calendar
+from wta.helpers import EventLogIDs, GRANULARITY_MINUTES, add_enabled_timestamp, compute_batch_activation_times, \
+    parallel_activities_with_heuristic_oracle, log_ids_non_nil
+from wta.profiling import Profiler
+from wta.transitions_report import TransitionsReport
+
+REPORT_KEYS = ['source_activity', 'source_resource', 'destination_activity', 'destination_resource']
+WAITING_TIME_COLUMNS = ['wt_total', 'wt_contention', 'wt_batching', 'wt_prioritization', 'wt_unavailability',
+                        'wt_extraneous']
+
+
+@dataclass
+class ScenarioResult:
+    """Measurements of a scenario, the times are the best of the repeats."""
+
+    name: str
+    rows: int  # number of events, transitions for the report, or processes started, processed by the scenario
+    repeats: int
+    wall_time: float  # seconds
+    cpu_time: float  # seconds
+    peak_rss_bytes: Optional[int]
+    throughput: float  # rows per second of wall time
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+class BenchmarkLog:
+    """
+    Synthetic event log prepared as main.run does before the analysis: with enabled times, batches, waiting times,
+    parallel activities and a calendar. The preparation isn't part of the measurements, and the scenarios that need
+    the outputs of other stages compute them once, lazily.
+    """
+
+    def __init__(self, shape: LogShape, log_ids: Optional[EventLogIDs] = None):
+        self.shape = shape
+        self.log_ids = log_ids_non_nil(log_ids)
+
+        log = generate_log(shape, self.log_ids)
+        log.sort_values(by=[self.log_ids.end_time, self.log_ids.start_time, self.log_ids.activity], inplace=True)
+        add_enabled_timestamp(log, self.log_ids)
+        self.log = compute_batch_activation_times(discover_batches(log, self.log_ids), self.log_ids)
+        self.log[self.log_ids.wt_total] = self.log[self.log_ids.start_time] - self.log[self.log_ids.enabled_time]
+
+        self._parallel_activities = None
+        self._calendar = None
+        self._transitions = None
+
+    @property
+    def parallel_activities(self) -> Dict[str, set]:
+        if self._parallel_activities is None:
+            self._parallel_activities = parallel_activities_with_heuristic_oracle(self.log, log_ids=self.log_ids)
+        return self._parallel_activities
+
+    @property
+    def calendar(self) -> dict:
+        if self._calendar is None:
+            self._calendar = make_calendar(self.log, granularity=GRANULARITY_MINUTES, log_ids=self.log_ids)
+        return self._calendar
+
+    @property
+    def transitions(self) -> pd.DataFrame:
+        if self._transitions is None:
+            self._transitions = identify_transitions(self, parallel_run=False)
+        return self._transitions
+
+
+def identify_transitions(log: BenchmarkLog, parallel_run: bool, vectorized: bool = False,
+                         partition_by_resource: bool = False) -> pd.DataFrame:
+    return activity_transitions.identify(log.log.copy(), log.parallel_activities, parallel_run, log_ids=log.log_ids,
+                                         calendar=log.calendar, vectorized=vectorized,
+                                         partition_by_resource=partition_by_resource)
+
+
+def build_transitions_report(log: BenchmarkLog) -> TransitionsReport:
+    # transitions are grouped by activities and resources, as the report expects
+    transitions = log.transitions.copy()
+    transitions[WAITING_TIME_COLUMNS] = transitions[WAITING_TIME_COLUMNS].apply(pd.to_timedelta, unit='s')
+    transitions['case_id'] = transitions['case_id'].astype(str)
+    grouped = transitions.groupby(REPORT_KEYS)
+    report = grouped[WAITING_TIME_COLUMNS].sum()
+    report['frequency'] = grouped.size()
+    report['cases'] = grouped['case_id'].agg(','.join)
+    return TransitionsReport(report.reset_index(), log.log, log.log_ids)
+
+
+@dataclass
+class Scenario:
+    run: Callable[[BenchmarkLog], object]
+    prepare: Callable[[BenchmarkLog], int]  # computes the inputs of the scenario and returns the rows it processes
+    uses_log: bool = True  # the synthetic log is generated only if a scenario to run uses it
+
+
+def _startup_scenario(code: str) -> Scenario:
+    """Times a fresh interpreter running the given code, so that modules cached by this process aren't reused."""
+    # NOTE: the CPU time of the scenario is the one of this process, the wall time includes the whole subprocess
+    return Scenario(lambda log: subprocess.run([sys.executable, '-c', code], check=True, stdout=subprocess.DEVNULL),
+                    lambda log: 1, uses_log=False)
+
+
+def _prepare_transitions(log: BenchmarkLog) -> int:
+    _ = log.parallel_activities, log.calendar
+    return len(log.log)
+
+
+def _batched_enabled_times(n_batches: int, batch_size: int, seed: int, log_ids: EventLogIDs) -> pd.DataFrame:
+    """Enabled times of batches of the given size in random order, with one event in every batch_size + 1 unbatched."""
+    rng = np.random.default_rng(seed)
+    n_events = n_batches * batch_size
+    enabled = pd.Timestamp('2023-01-02', tz='UTC') + pd.to_timedelta(rng.integers(0, 10 ** 7, n_events), unit='s')
+    batch_ids = np.repeat(np.arange(n_batches, dtype=float), batch_size)
+    batch_ids[::batch_size + 1] = np.nan
+    return pd.DataFrame({log_ids.enabled_time: enabled, log_ids.batch_id: rng.permutation(batch_ids)})
+
+
+def _batch_activation_times_scenario(n_batches: int) -> Scenario:
+    """
+    Computes the batch activation times of a log with the given number of batches, independent of the shape of the
+    synthetic log. The sizes of the sweep grow tenfold, so a steady throughput across them shows linear scaling.
+    """
+    batched = {}
+
+    def prepare(log: BenchmarkLog) -> int:
+        batched['log'] = _batched_enabled_times(n_batches, log.shape.batch_size, log.shape.seed, log.log_ids)
+        return len(batched['log'])
+
+    return Scenario(lambda log: compute_batch_activation_times(batched['log'].copy(), log.log_ids), prepare)
+
+
+BATCH_SWEEP = [10_000, 100_000, 1_000_000]  # number of batches of the batch activation times sweep
+
+SCENARIOS: Dict[str, Scenario] = {
+    'transitions_sequential': Scenario(lambda log: identify_transitions(log, parallel_run=False), _prepare_transitions),
+    'transitions_parallel': Scenario(lambda log: identify_transitions(log, parallel_run=True), _prepare_transitions),
+    'transitions_vectorized': Scenario(lambda log: identify_transitions(log, parallel_run=False, vectorized=True),
+                                       _prepare_transitions),
+    'transitions_resource_partitioned': Scenario(
+        lambda log: identify_transitions(log, parallel_run=True, partition_by_resource=True), _prepare_transitions),
+    'calendar': Scenario(lambda log: make_calendar(log.log, granularity=GRANULARITY_MINUTES, log_ids=log.log_ids),
+                         lambda log: len(log.log)),
+    'batch_activation_times': Scenario(lambda log: compute_batch_activation_times(log.log.copy(), log.log_ids),
+                                       lambda log: len(log.log)),
+    **{f'batch_activation_times_{n_batches}': _batch_activation_times_scenario(n_batches) for n_batches in BATCH_SWEEP},
+    'transitions_report': Scenario(build_transitions_report, lambda log: len(log.transitions)),
+    'import_wta': _startup_scenario('import wta'),
+    'cli_version': _startup_scenario('from wta.cli import main; main(["--version"])'),
+}
+
+
+def run_benchmarks(shape: Optional[LogShape] = None, scenarios: Optional[Iterable[str]] = None,
+                   repeats: int = 3) -> dict:
+    """
+    Runs the scenarios on a synthetic log of the given shape and returns the results, together with the shape and the
+    environment, as a dictionary ready to be saved as JSON.
+    """
+    from wta import __version__
+
+    shape = shape or LogShape()
+    scenarios = list(scenarios or SCENARIOS)
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        raise ValueError(f'Unknown benchmark scenarios: {sorted(unknown)}')
+
+    log = BenchmarkLog(shape) if any(SCENARIOS[name].uses_log for name in scenarios) else None
+    results: List[ScenarioResult] = []
+    for name in scenarios:
+        rows = SCENARIOS[name].prepare(log)
+        profiler = Profiler()
+        with profiler.activate():
+            for _ in range(repeats):
+                with profiling.stage(name, rows=rows):
+                    SCENARIOS[name].run(log)
+
+        # NOTE: nested stages of the analysis are recorded too, only the outer ones are the repeats of the scenario
+        runs = [metrics for metrics in profiler.stages if metrics.name == name]
+        best = min(runs, key=lambda metrics: metrics.wall_time)
+        results.append(ScenarioResult(
+            name=name,
+            rows=rows,
+            repeats=repeats,
+            wall_time=best.wall_time,
+            cpu_time=best.cpu_time,
+            peak_rss_bytes=max(metrics.peak_rss_bytes or 0 for metrics in runs) or None,
+            throughput=rows / best.wall_time if best.wall_time > 0 else float('inf'),
+        ))
+
+    return {
+        'version': __version__,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'shape': shape.to_dict(),
+        'scenarios': [result.to_dict() for result in results],
+    }
@@ -0,0 +1,139 @@
+import functools
+import hashlib
+import importlib.metadata
+import json
+import os
+from pathlib import Path
+from typing import Any, Callable, Optional, Union
+
+import pandas as pd
+
+DEFAULT_CACHE_SIZE_BYTES = 1024 ** 3  # 1 GiB
+
+_FRAME_SUFFIX = '.pkl'
+_JSON_SUFFIX = '.json'
+
+# distributions of the libraries the stages run, by module; Prosimos is installed under either name
+_DEPENDENCIES = {
+    'batch_processing_discovery': ('batch-processing-discovery',),
+    'start_time_estimator': ('start-time-estimator',),
+    'prosimos': ('prosimos', 'diffresbp-simulator'),
+}
+
+
+class StageCache:
+    """
+    Content-addressed on-disk cache for the outputs of the preprocessing stages of a run: enabled times, batch
+    discovery, the concurrency oracle and calendar mining. An entry is keyed by the stage name, a hash of the log
+    columns the stage reads and the parameters of the stage, so any change in the log or the parameters leads to a
+    different entry. DataFrames are stored with pickle, other outputs as JSON.
+
+    When the entries take more than max_size_bytes, the least recently used ones are removed.
+    """
+
+    def __init__(self, cache_dir: Path, max_size_bytes: int = DEFAULT_CACHE_SIZE_BYTES):
+        self.cache_dir = Path(cache_dir)
+        self.max_size_bytes = max_size_bytes
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def key(stage: str, log: pd.DataFrame, params: Optional[dict] = None) -> str:
+        """
+        Hashes the stage name, the parameters and the content of the log, including its index and column names, and the
+        versions of the tool and of the libraries the stages run, so that upgrading any of them invalidates the entries.
+        """
+        from wta import __version__
+
+        digest = hashlib.sha256()
+        digest.update(json.dumps({'stage': stage, 'version': __version__, 'dependencies': _dependency_versions(),
+                                  'params': params or {}, 'columns': [str(column) for column in log.columns]},
+                                 sort_keys=True, default=str).encode())
+        digest.update(pd.util.hash_pandas_object(log.index, index=False).to_numpy().tobytes())
+        for column in log.columns:
+            digest.update(str(log[column].dtype).encode())
+            digest.update(pd.util.hash_pandas_object(log[column], index=False).to_numpy().tobytes())
+        return f'{stage}-{digest.hexdigest()}'
+
+    def get(self, key: str) -> Optional[Union[pd.DataFrame, Any]]:
+        """Returns the cached output for the key, None if there is none."""
+        path = self._path(key)
+        if path is None:
+            return None
+        os.utime(path)  # marks the entry as recently used
+        if path.suffix == _FRAME_SUFFIX:
+            return pd.read_pickle(path)
+        with path.open('r') as f:
+            return json.load(f)
+
+    def put(self, key: str, value: Union[pd.DataFrame, Any]):
+        """Stores the output for the key and evicts the least recently used entries if the cache is too big."""
+        if isinstance(value, pd.DataFrame):
+            path = self.cache_dir / (key + _FRAME_SUFFIX)
+            tmp_path = path.with_name(path.name + '.tmp')
+            value.to_pickle(tmp_path)
+        else:
+            path = self.cache_dir / (key + _JSON_SUFFIX)
+            tmp_path = path.with_name(path.name + '.tmp')
+            with tmp_path.open('w') as f:
+                json.dump(value, f)
+        # NOTE: written to a temporary file first, so that interrupted runs don't leave broken entries behind
+        tmp_path.replace(path)
+        self.evict()
+
+    def cached(self, stage: str, log: pd.DataFrame, params: Optional[dict], compute: Callable[[], Any]) -> Any:
+        """Returns the cached output of the stage for the log and parameters, computing and storing it if missing."""
+        key = self.key(stage, log, params)
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def size(self) -> int:
+        return sum(path.stat().st_size for path in self._entries())
+
+    def evict(self):
+        """Removes the least recently used entries until the cache fits into max_size_bytes."""
+        entries = sorted(self._entries(), key=lambda path: path.stat().st_mtime)
+        total = sum(path.stat().st_size for path in entries)
+        for path in entries:
+            if total <= self.max_size_bytes:
+                break
+            total -= path.stat().st_size
+            path.unlink(missing_ok=True)
+
+    def clear(self):
+        for path in self._entries():
+            path.unlink(missing_ok=True)
+
+    def _entries(self):
+        return [path for path in self.cache_dir.iterdir() if path.suffix in (_FRAME_SUFFIX, _JSON_SUFFIX)]
+
+    def _path(self, key: str) -> Optional[Path]:
+        for suffix in (_FRAME_SUFFIX, _JSON_SUFFIX):
+            path = self.cache_dir / (key + suffix)
+            if path.exists():
+                return path
+        return None
+
+
+def cached_stage(cache: Optional[StageCache], stage: str, log: pd.DataFrame, params: Optional[dict],
+                 compute: Callable[[], Any]) -> Any:
+    """Runs the stage through the cache if there is one, otherwise just computes it."""
+    if cache is None:
+        return compute()
+    return cache.cached(stage, log, params, compute)
+
+
+@functools.lru_cache(maxsize=None)
+def _dependency_versions() -> dict:
+    versions = {}
+    for module, distributions in _DEPENDENCIES.items():
+        versions[module] = None
+        for distribution in distributions:
+            try:
+                versions[module] = importlib.metadata.version(distribution)
+                break
+            except importlib.metadata.PackageNotFoundError:
+                continue
+    return versions
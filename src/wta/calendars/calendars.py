@@ -1,13 +1,35 @@
-from typing import Optional
+import concurrent.futures
+import datetime
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
 
+import numpy as np
 import pandas as pd
 from bpdfr_simulation_engine.resource_calendar import CalendarFactory
 
 from wta.helpers import GRANULARITY_MINUTES, log_ids_non_nil, EventLogIDs
+from wta.scheduling import resolve_workers
 from wta.calendars.intervals import Interval, prosimos_interval_to_interval
 
 UNDIFFERENTIATED_RESOURCE_POOL_KEY = "undifferentiated_resource_pool"
 
+DAY_NANOSECONDS = 24 * 60 * 60 * 1_000_000_000
+WEEK_NANOSECONDS = 7 * DAY_NANOSECONDS
+EPOCH_WEEKDAY = 3  # 1970-01-01 is a Thursday
+
+# Attributes of CalendarFactory and of its kpi_calendar that _register_timestamps fills in, as laid out by the Prosimos
+# revision the project depends on, see _has_expected_layout
+FACTORY_ATTRIBUTES = frozenset({'from_datetime', 'kpi_calendar', 'minutes_x_granule', 'to_datetime'})
+KPI_CALENDAR_ATTRIBUTES = frozenset({
+    'active_granules_in_calendar', 'active_res_task_weekdays', 'active_res_task_weekdays_granules',
+    'active_weekdays_in_calendar', 'confidence_denominator_sum', 'confidence_numerator_sum', 'g_discarded',
+    'is_joint_resource', 'joint_to_task', 'max_resource_freq', 'max_resource_task_freq', 'minutes_x_granule',
+    'observed_weekdays', 'res_active_granules_weekdays', 'res_active_weekdays', 'res_count_events_in_calendar',
+    'res_count_events_in_log', 'res_enabled_task_granules', 'res_granules_frequency', 'res_task_weekdays_granules_freq',
+    'resource_freq', 'resource_task_freq', 'shared_task_granules', 'task_enabled_in_granule', 'task_events_count',
+    'task_events_in_calendar', 'total_events_in_calendar', 'total_events_in_log', 'total_granules',
+})
+
 
 def make(event_log: pd.DataFrame,
          granularity=GRANULARITY_MINUTES,
@@ -15,7 +37,9 @@ def make(event_log: pd.DataFrame,
          desired_support=0.7,
          min_participation=0.0001,
          differentiated=True,
-         log_ids: Optional[EventLogIDs] = None) -> dict:
+         log_ids: Optional[EventLogIDs] = None,
+         parallel_run: bool = False,
+         n_workers: Optional[int] = None) -> dict:
     """
     Creates a calendar for the given event log using Prosimos. If the amount of event is too low, the results are not
     trustworthy. It's recommended to build a resource calendar for the whole resource pool instead of a single resource.
@@ -28,22 +52,51 @@ def make(event_log: pd.DataFrame,
     :param min_participation: The minimum participation.
     :param differentiated: Whether to mine differentiated calendars for each resource or to use a single resource pool for all resources.
     :param log_ids: The event log IDs to use.
+    :param parallel_run: Whether to mine the calendars of the resources in parallel processes.
+    :param n_workers: The number of worker processes of a parallel run, by default one less than the available cores.
     :return: the calendar dictionary with the resource names as keys and the working time intervals as values.
     """
     log_ids = log_ids_non_nil(log_ids)
 
     calendar_factory = CalendarFactory(granularity)
-    for (index, event) in event_log.iterrows():
-        if differentiated:
-            resource = event[log_ids.resource]
-        else:
-            resource = UNDIFFERENTIATED_RESOURCE_POOL_KEY
-        activity = event[log_ids.activity]
-        start_time = event[log_ids.start_time]
-        end_time = event[log_ids.end_time]
-        calendar_factory.check_date_time(resource, activity, start_time)
-        calendar_factory.check_date_time(resource, activity, end_time)
-    calendar_candidates = calendar_factory.build_weekly_calendars(min_confidence, desired_support, min_participation)
+    register_events(calendar_factory, event_log, differentiated=differentiated, log_ids=log_ids)
+    return build(calendar_factory, min_confidence, desired_support, min_participation, parallel_run, n_workers)
+
+
+def register_events(calendar_factory: CalendarFactory, event_log: pd.DataFrame, differentiated=True,
+                    log_ids: Optional[EventLogIDs] = None):
+    """
+    Registers the timestamps of the events in the calendar factory. A log can be registered in parts, e.g., the
+    partitions of a log too large to be loaded at once, as long as all the events of a resource are in the same part,
+    and the calendar built from the factory is the same as the one of the whole log, see build.
+
+    The statistics are filled in at once when the factory has the layout _register_timestamps was written for, and
+    event by event with CalendarFactory.check_date_time() otherwise.
+    """
+    log_ids = log_ids_non_nil(log_ids)
+
+    if differentiated:
+        resources = event_log[log_ids.resource]
+    else:
+        resources = pd.Series(UNDIFFERENTIATED_RESOURCE_POOL_KEY, index=event_log.index)
+    register = _register_timestamps if _has_expected_layout(calendar_factory) else _check_date_times
+    register(calendar_factory, resources, event_log[log_ids.activity], event_log[log_ids.start_time],
+             event_log[log_ids.end_time])
+
+
+def build(calendar_factory: CalendarFactory,
+          min_confidence=0.1,
+          desired_support=0.7,
+          min_participation=0.0001,
+          parallel_run: bool = False,
+          n_workers: Optional[int] = None) -> dict:
+    """Builds the calendar of the events registered in the calendar factory, see make for the parameters."""
+    if parallel_run and _has_expected_layout(calendar_factory):
+        calendar_candidates = _build_weekly_calendars_in_parallel(calendar_factory, min_confidence, desired_support,
+                                                                  min_participation, n_workers)
+    else:
+        calendar_candidates = calendar_factory.build_weekly_calendars(min_confidence, desired_support,
+                                                                      min_participation)
     calendar = {}
     for resource_id in calendar_candidates:
         if calendar_candidates[resource_id] is not None:
@@ -51,6 +104,180 @@ def make(event_log: pd.DataFrame,
     return calendar
 
 
+def _has_expected_layout(calendar_factory: CalendarFactory) -> bool:
+    """
+    Whether the calendar factory and its statistics have exactly the attributes filled in by _register_timestamps and
+    read by _build_weekly_calendars_in_parallel. Another revision of Prosimos can lay them out differently, and then
+    only its public API is used.
+    """
+    kpi = getattr(calendar_factory, 'kpi_calendar', None)
+    return set(vars(calendar_factory)) == FACTORY_ATTRIBUTES and kpi is not None \
+        and set(vars(kpi)) == KPI_CALENDAR_ATTRIBUTES
+
+
+def _check_date_times(calendar_factory: CalendarFactory, resources: pd.Series, activities: pd.Series,
+                      start_times: pd.Series, end_times: pd.Series):
+    """Registers the start and end timestamps of every event, in log order, with CalendarFactory.check_date_time()."""
+    for resource, activity, start_time, end_time in zip(resources, activities, start_times, end_times):
+        calendar_factory.check_date_time(resource, activity, start_time)
+        calendar_factory.check_date_time(resource, activity, end_time)
+
+
+def _register_timestamps(calendar_factory: CalendarFactory, resources: pd.Series, activities: pd.Series,
+                         start_times: pd.Series, end_times: pd.Series):
+    """
+    Registers the start and end timestamps of all events in the calendar factory at once. It fills in the same
+    statistics as calling CalendarFactory.check_date_time() for the start and the end of every event in log order,
+    including the insertion order of the dictionaries, but counting the timestamps by resource, activity, weekday and
+    granule with groupby instead of updating the statistics timestamp by timestamp. The statistics of the activities
+    and weekdays are added to the ones registered before, so that a log can be registered in parts by resource.
+    """
+    kpi = calendar_factory.kpi_calendar
+
+    # start and end timestamps interleaved in the order check_date_time() would see them
+    timestamps = pd.concat([start_times, end_times], ignore_index=True)
+    timestamps = timestamps.take(np.arange(len(timestamps)).reshape(2, -1).T.ravel()).reset_index(drop=True)
+    if not pd.api.types.is_datetime64_any_dtype(timestamps):
+        timestamps = pd.to_datetime(timestamps, utc=True)
+    if len(timestamps) == 0:
+        return
+
+    date_codes, date_names = pd.factorize(timestamps.dt.strftime('%Y-%m-%d'), use_na_sentinel=False)
+    activity_codes, activity_names = pd.factorize(np.repeat(activities.to_numpy(dtype=object), 2),
+                                                  use_na_sentinel=False)
+    frame = pd.DataFrame({
+        'resource': np.repeat(resources.to_numpy(dtype=object), 2),
+        'activity': np.repeat(activities.to_numpy(dtype=object), 2),
+        'granule': (timestamps.dt.hour * 60 + timestamps.dt.minute) // calendar_factory.minutes_x_granule,
+        'weekday': timestamps.dt.weekday,
+    })
+    date_names = np.asarray(date_names, dtype=object)
+    activity_names = np.asarray(activity_names, dtype=object)
+
+    calendar_factory.from_datetime = min(calendar_factory.from_datetime, timestamps.min())
+    calendar_factory.to_datetime = max(calendar_factory.to_datetime, timestamps.max())
+
+    def groups(keys: List[str], with_activities: bool = False) -> list:
+        """Returns the key, the number of timestamps and the set of dates of every group, and optionally the set of
+        activities, in the order of their first appearance, which reproduces the insertion order of
+        check_date_time()."""
+        group = frame.groupby(keys, sort=False, dropna=False).ngroup().to_numpy()
+        n_groups = group.max() + 1
+        first_rows = np.unique(group, return_index=True)[1]
+        key_values = list(frame[keys].iloc[first_rows].itertuples(index=False, name=None))
+
+        def distinct(values: np.ndarray, names: np.ndarray) -> List[set]:
+            pairs = np.unique(group * len(names) + values)
+            bounds = np.searchsorted(pairs // len(names), np.arange(n_groups + 1))
+            return [set(names[pairs[bounds[i]:bounds[i + 1]] % len(names)]) for i in range(n_groups)]
+
+        columns = [np.bincount(group, minlength=n_groups).tolist(), distinct(date_codes, date_names)]
+        if with_activities:
+            columns.append(distinct(activity_codes, activity_names))
+        return list(zip(key_values, *columns))
+
+    for (resource,), count, _ in groups(['resource']):
+        kpi.resource_freq[resource] = count
+        kpi.resource_task_freq[resource] = {}
+        kpi.res_active_weekdays[resource] = {}
+        kpi.res_active_granules_weekdays[resource] = {}
+        kpi.res_granules_frequency[resource] = {}
+        kpi.active_res_task_weekdays[resource] = {}
+        kpi.active_res_task_weekdays_granules[resource] = {}
+        kpi.shared_task_granules[resource] = {}
+        kpi.res_task_weekdays_granules_freq[resource] = {}
+        kpi.g_discarded[resource] = []
+        kpi.res_count_events_in_calendar[resource] = 0
+        kpi.res_count_events_in_log[resource] = count
+        kpi.active_granules_in_calendar[resource] = set()
+        kpi.active_weekdays_in_calendar[resource] = set()
+        kpi.confidence_numerator_sum[resource] = 0
+        kpi.confidence_denominator_sum[resource] = 0
+        kpi.is_joint_resource[resource] = False
+
+    for (activity,), count, _ in groups(['activity']):
+        kpi.task_events_count[activity] = kpi.task_events_count.get(activity, 0) + count
+        kpi.task_events_in_calendar[activity] = 0
+        kpi.max_resource_task_freq.setdefault(activity, 0)
+
+    for (weekday,), _, dates in groups(['weekday']):
+        kpi.observed_weekdays[weekday] = kpi.observed_weekdays.get(weekday, set()) | dates
+
+    for (resource, activity), count, _ in groups(['resource', 'activity']):
+        kpi.resource_task_freq[resource][activity] = count
+        kpi.active_res_task_weekdays[resource][activity] = {}
+        kpi.active_res_task_weekdays_granules[resource][activity] = {}
+        kpi.res_task_weekdays_granules_freq[resource][activity] = {}
+        kpi.max_resource_task_freq[activity] = max(kpi.max_resource_task_freq[activity], count)
+
+    for (resource, activity, weekday), _, dates in groups(['resource', 'activity', 'weekday']):
+        kpi.active_res_task_weekdays[resource][activity][weekday] = dates
+        kpi.active_res_task_weekdays_granules[resource][activity][weekday] = {}
+
+    for (resource, activity, weekday, granule), _, dates in groups(['resource', 'activity', 'weekday', 'granule']):
+        kpi.active_res_task_weekdays_granules[resource][activity][weekday][granule] = dates
+
+    for (resource, activity, granule, weekday), count, _ in groups(['resource', 'activity', 'granule', 'weekday']):
+        kpi.res_task_weekdays_granules_freq[resource][activity].setdefault(granule, {})[weekday] = count
+
+    for (resource, weekday), _, dates in groups(['resource', 'weekday']):
+        kpi.res_active_weekdays[resource][weekday] = dates
+
+    for (resource, granule, weekday), count, dates, activities in groups(['resource', 'granule', 'weekday'],
+                                                                         with_activities=True):
+        kpi.res_active_granules_weekdays[resource].setdefault(granule, {})[weekday] = dates
+        kpi.res_granules_frequency[resource].setdefault(granule, {})[weekday] = count
+        kpi.shared_task_granules[resource].setdefault(granule, {})[weekday] = activities
+
+    kpi.max_resource_freq = max(kpi.max_resource_freq, max(kpi.resource_freq.values()))
+    kpi.total_events_in_log += len(timestamps)
+
+
+def _build_weekly_calendars_in_parallel(calendar_factory: CalendarFactory, min_confidence: float,
+                                        desired_support: float, min_participation: float,
+                                        n_workers: Optional[int] = None) -> dict:
+    """
+    Same as CalendarFactory.build_weekly_calendars(), but the calendars of the resources are built in worker processes.
+    The calendar of a resource depends only on the statistics of that resource, so each worker gets a copy of the
+    factory once and builds the calendars of a share of the resources.
+    """
+    resources = list(calendar_factory.kpi_calendar.shared_task_granules)
+    n_workers = max(min(resolve_workers(n_workers), len(resources)), 1)
+    chunks = [resources[i::n_workers] for i in range(n_workers)]
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=n_workers,
+                                                initializer=_attach_calendar_factory,
+                                                initargs=(calendar_factory,)) as executor:
+        handles = [executor.submit(_build_resource_calendars, chunk, min_confidence, desired_support,
+                                   min_participation)
+                   for chunk in chunks]
+        built = {}
+        for handle in handles:
+            built.update(handle.result())
+
+    return {resource: built[resource] for resource in resources}
+
+
+# Calendar factory of a worker process, see _build_weekly_calendars_in_parallel
+_worker_calendar_factory = {}
+
+
+def _attach_calendar_factory(calendar_factory: CalendarFactory):
+    _worker_calendar_factory['factory'] = calendar_factory
+    calendar_factory.kpi_calendar.reset_calendar_info()
+
+
+def _build_resource_calendars(resources: list, min_confidence: float, desired_support: float,
+                              min_participation: float) -> dict:
+    calendar_factory = _worker_calendar_factory['factory']
+    kpi = calendar_factory.kpi_calendar
+    return {
+        resource: calendar_factory.build_resource_calendar(resource, min_confidence, desired_support)
+        if kpi.resource_participation_ratio(resource) >= min_participation else None
+        for resource in resources
+    }
+
+
 def resource_working_hours_as_intervals(resource: str, calendar: dict) -> [Interval]:
     """
     Computes the working time intervals of a resource.
@@ -65,3 +292,94 @@ def resource_working_hours_as_intervals(resource: str, calendar: dict) -> [Inter
 
     new_intervals = [prosimos_interval_to_interval(interval) for interval in intervals]
     return new_intervals
+
+
+@dataclass
+class WeeklyCalendar:
+    """
+    Working hours of a resource compiled into disjoint intervals in nanoseconds since Monday 00:00, with the working
+    time accumulated before each interval. The working time until any instant is the number of whole weeks since the
+    epoch times the weekly working time plus a binary search within the week, so the off-duty time in a window of any
+    length takes constant time instead of walking the window day by day.
+
+    Instants are int64 nanoseconds since the epoch, the working hours are applied to them as UTC wall time.
+    """
+
+    starts: np.ndarray
+    ends: np.ndarray
+    worked_before: np.ndarray  # working time before each interval since the beginning of the week
+    per_week: int  # working time in a whole week
+
+    @staticmethod
+    def from_prosimos(intervals: List[dict]) -> 'WeeklyCalendar':
+        """Compiles the working hours of a resource from the calendar generated by Prosimos."""
+        bounds = []
+        for interval in map(prosimos_interval_to_interval, intervals):
+            day = interval.left_day.value * DAY_NANOSECONDS
+            bounds.append((day + _time_to_nanoseconds(interval._left_time),
+                           day + _time_to_nanoseconds(interval._right_time)))
+
+        # NOTE: overlapping and adjacent intervals are merged, so that off-duty gaps are never empty
+        starts, ends = [], []
+        for start, end in sorted(bounds):
+            if end <= start:
+                continue
+            if starts and start <= ends[-1]:
+                ends[-1] = max(ends[-1], end)
+            else:
+                starts.append(start)
+                ends.append(end)
+
+        starts = np.array(starts, dtype=np.int64)
+        ends = np.array(ends, dtype=np.int64)
+        lengths = ends - starts
+        worked_before = np.concatenate([[0], np.cumsum(lengths)[:-1]]).astype(np.int64)
+        return WeeklyCalendar(starts, ends, worked_before, int(lengths.sum()))
+
+    def working_time_before(self, instants: np.ndarray) -> np.ndarray:
+        """Working time from the epoch until the given instants."""
+        since_monday = instants + EPOCH_WEEKDAY * DAY_NANOSECONDS
+        weeks, within_week = np.divmod(since_monday, WEEK_NANOSECONDS)
+        if len(self.starts) == 0:
+            return np.zeros(len(instants), dtype=np.int64)
+        current = np.searchsorted(self.starts, within_week, 'right') - 1
+        started = current >= 0
+        current = np.maximum(current, 0)
+        within_interval = np.clip(within_week - self.starts[current], 0, self.ends[current] - self.starts[current])
+        return weeks * self.per_week + np.where(started, self.worked_before[current] + within_interval, 0)
+
+    def off_duty_time(self, lefts: np.ndarray, rights: np.ndarray) -> np.ndarray:
+        """Time outside the working hours in each window [left, right)."""
+        return (rights - lefts) - (self.working_time_before(rights) - self.working_time_before(lefts))
+
+    def off_duty_intervals(self, left: int, right: int) -> List[Tuple[int, int]]:
+        """Maximal intervals outside the working hours within the window [left, right), in chronological order."""
+        if left >= right:
+            return []
+        if len(self.starts) == 0:
+            return [(left, right)]
+
+        # working intervals of every week the window touches, clipped to the window
+        first_week = (left + EPOCH_WEEKDAY * DAY_NANOSECONDS) // WEEK_NANOSECONDS
+        last_week = (right + EPOCH_WEEKDAY * DAY_NANOSECONDS) // WEEK_NANOSECONDS
+        week_starts = np.arange(first_week, last_week + 1) * WEEK_NANOSECONDS - EPOCH_WEEKDAY * DAY_NANOSECONDS
+        working_starts = np.clip((week_starts[:, None] + self.starts).ravel(), left, right)
+        working_ends = np.clip((week_starts[:, None] + self.ends).ravel(), left, right)
+
+        # gaps between consecutive working intervals and the window boundaries
+        gap_starts = np.concatenate([[left], working_ends])
+        gap_ends = np.concatenate([working_starts, [right]])
+        kept = gap_starts < gap_ends
+        return list(zip(gap_starts[kept].tolist(), gap_ends[kept].tolist()))
+
+
+def compile_weekly_calendars(calendar: dict) -> Dict[str, WeeklyCalendar]:
+    """
+    Compiles the working hours of every resource of the calendar generated by Prosimos, including the undifferentiated
+    resource pool if the calendar has it. It's meant to be done once per run and shared by all detectors.
+    """
+    return {resource: WeeklyCalendar.from_prosimos(intervals) for resource, intervals in calendar.items()}
+
+
+def _time_to_nanoseconds(time: datetime.time) -> int:
+    return ((time.hour * 60 + time.minute) * 60 + time.second) * 1_000_000_000 + time.microsecond * 1000
@@ -1,20 +1,62 @@
 import json
 from pathlib import Path
-from typing import Optional
+from typing import Optional, Sequence, Tuple, TYPE_CHECKING
 
 import click
 
-from wta import EventLogIDs
-from wta.main import run
+from wta import profiling
+from wta.profiling import Profiler
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+    from wta.helpers import EventLogIDs
+
+# NOTE: pandas and the analysis are imported only when a log is analyzed, so that --version and --help are fast
 
 
 @click.command()
 @click.option('-l', '--log_path', default=None, required=False, type=Path,
-              help='Path to an event log in XES-format.')
+              help='Path to an event log in CSV, Parquet or Feather format.')
 @click.option('-o', '--output_dir', default='./', show_default=True, type=Path,
               help='Path to an output directory where statistics will be saved.')
+@click.option('-f', '--output_format', default='csv', show_default=True, type=click.Choice(['csv', 'parquet']),
+              help='Format of the transitions report, besides the JSON one.')
 @click.option('-p', '--parallel/--no-parallel', is_flag=True, default=True, show_default=True,
               help='Run the tool using all available cores in parallel.')
+@click.option('-w', '--workers', default=None, type=click.IntRange(min=1),
+              help='Number of worker processes of a parallel run. By default, one less than the cores available to '
+                   'the tool, considering its CPU affinity and container CPU limits.')
+@click.option('-s', '--shared_memory/--no-shared_memory', is_flag=True, default=False, show_default=True,
+              help='In a parallel run, publish the event log into shared memory once instead of sending it to every '
+                   'task.')
+@click.option('-r', '--partition_by_resource/--no-partition_by_resource', is_flag=True, default=False,
+              show_default=True,
+              help='Partition the event log by resource instead of by case, so that every task receives only the '
+                   'events and calendar of its resources instead of the whole log.')
+@click.option('-e', '--vectorized/--no-vectorized', is_flag=True, default=False, show_default=True,
+              help='Analyze the waiting time of all transitions at once with the vectorized engine instead of case by '
+                   'case.')
+@click.option('-k', '--cache_dir', default=None, type=Path,
+              help='Path to a directory where enabled times, batches, parallel activities and calendars are cached '
+                   'between runs on the same event log.')
+@click.option('-i', '--state_dir', default=None, type=Path,
+              help='Path to a directory where the state of the analysis is saved. If it holds the state of a previous '
+                   'run on the same event log, only the events affected by the events appended since then are '
+                   'analyzed again.')
+@click.option('-b', '--memory_budget', default=None, type=click.IntRange(min=1),
+              help='Memory budget of the analysis in megabytes. When set, the event log is read in chunks and '
+                   'partitioned on disk by case and by resource, so that logs larger than the memory can be analyzed.')
+@click.option('-d', '--spill_dir', default=None, type=Path,
+              help='Path to a directory where the partitions of an out-of-core run are written. By default, the '
+                   'temporary directory of the system.')
+@click.option('-t', '--metrics_path', default=None, type=Path,
+              help='Path to a JSON file where the wall time, CPU time, peak memory, rows and counters, e.g., hits of '
+                   'the waiting window cache, of every stage of the run will be saved.')
+@click.option('-P', '--profile', 'profile_stages', multiple=True,
+              type=click.Choice(['read', 'preprocessing', 'enabled_times', 'batching', 'concurrency_oracle',
+                                 'calendar', 'transitions', 'report']),
+              help='Run the stage under cProfile and save its stats to <output_dir>/<stage>.prof. Can be repeated.')
 @click.option('-c', '--columns_path', default=None, type=click.Path(exists=True, path_type=Path),
               help="Path to a JSON file containing column mappings for the event log. Only the following keys"
                    "are accepted: case, activity, resource, start_timestamp, end_timestamp.")
@@ -25,7 +67,18 @@ from wta.main import run
 def main(
         log_path: Path,
         output_dir: Path,
+        output_format: str,
         parallel: bool,
+        workers: Optional[int],
+        shared_memory: bool,
+        partition_by_resource: bool,
+        vectorized: bool,
+        cache_dir: Optional[Path],
+        state_dir: Optional[Path],
+        memory_budget: Optional[int],
+        spill_dir: Optional[Path],
+        metrics_path: Optional[Path],
+        profile_stages: Tuple[str, ...],
         columns_path: Optional[Path],
         columns_json: Optional[str],
         version: bool):
@@ -36,26 +89,82 @@ def main(
 
     log_ids = _column_mapping(columns_path, columns_json)
 
-    _run(log_path, parallel, log_ids, output_dir)
+    _run(log_path, parallel, log_ids, output_dir, shared_memory=shared_memory, vectorized=vectorized,
+         cache_dir=cache_dir, output_format=output_format, metrics_path=metrics_path, profile_stages=profile_stages,
+         n_workers=workers, partition_by_resource=partition_by_resource, state_dir=state_dir,
+         memory_budget=memory_budget * 1024 ** 2 if memory_budget is not None else None, spill_dir=spill_dir)
 
 
 def _run(
         log_path: Path,
         parallel_run: bool,
-        log_ids: EventLogIDs,
+        log_ids: 'EventLogIDs',
+        output_dir: Path,
+        shared_memory: bool = False,
+        vectorized: bool = False,
+        cache_dir: Optional[Path] = None,
+        output_format: str = 'csv',
+        metrics_path: Optional[Path] = None,
+        profile_stages: Sequence[str] = (),
+        n_workers: Optional[int] = None,
+        partition_by_resource: bool = False,
+        state_dir: Optional[Path] = None,
+        memory_budget: Optional[int] = None,
+        spill_dir: Optional[Path] = None,
+):
+    profiler = Profiler(cprofile_stages=profile_stages, profile_dir=output_dir)
+    with profiler.activate():
+        _run_and_save(log_path, parallel_run, log_ids, output_dir, shared_memory, vectorized, cache_dir,
+                      output_format, n_workers, partition_by_resource, state_dir, memory_budget, spill_dir)
+
+    if metrics_path is not None:
+        print(f'Saving stage metrics to {metrics_path}')
+        profiler.to_json(metrics_path)
+
+
+def _run_and_save(
+        log_path: Path,
+        parallel_run: bool,
+        log_ids: 'EventLogIDs',
         output_dir: Path,
+        shared_memory: bool,
+        vectorized: bool,
+        cache_dir: Optional[Path],
+        output_format: str,
+        n_workers: Optional[int],
+        partition_by_resource: bool,
+        state_dir: Optional[Path],
+        memory_budget: Optional[int],
+        spill_dir: Optional[Path],
 ):
-    report = run(log_path, parallel_run, log_ids)
+    from wta.main import run
+
+    report = run(log_path, parallel_run, log_ids, shared_memory=shared_memory, vectorized=vectorized,
+                 cache_dir=cache_dir, n_workers=n_workers, partition_by_resource=partition_by_resource,
+                 state_dir=state_dir, memory_budget=memory_budget, spill_dir=spill_dir)
 
     if report is None:
         return
 
+    with profiling.stage('report', rows=len(report)):
+        _save_report(report, log_path, output_dir, output_format)
+
+
+def _save_report(report: 'pd.DataFrame', log_path: Path, output_dir: Path, output_format: str):
     output_dir.mkdir(parents=True, exist_ok=True)
     output_path = output_dir / (log_path.stem + '_transitions_report')
-    csv_path = output_path.with_suffix('.csv')
+    if output_format == 'parquet':
+        from wta.helpers import write_parquet
+
+        parquet_path = output_path.with_suffix('.parquet')
 
-    print(f'Saving transitions report to {csv_path}')
-    report.to_csv(csv_path, index=False)
+        print(f'Saving transitions report to {parquet_path}')
+        write_parquet(report, parquet_path)
+    else:
+        csv_path = output_path.with_suffix('.csv')
+
+        print(f'Saving transitions report to {csv_path}')
+        report.to_csv(csv_path, index=False)
 
     json_path = output_path.with_suffix('.json')
 
@@ -63,7 +172,9 @@ def _run(
     report.to_json(json_path)
 
 
-def _column_mapping(columns_path: Optional[Path], columns_json: Optional[str]) -> Optional[EventLogIDs]:
+def _column_mapping(columns_path: Optional[Path], columns_json: Optional[str]) -> Optional['EventLogIDs']:
+    from wta.helpers import EventLogIDs
+
     log_ids: Optional[EventLogIDs] = None
 
     if columns_path is not None:
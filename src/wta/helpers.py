@@ -1,15 +1,14 @@
+import functools
 import json
-import time
 from dataclasses import dataclass
 from pathlib import Path
 from typing import Optional, Dict, List, Tuple
 
 import click
+import numpy as np
 import pandas as pd
 
-from start_time_estimator.concurrency_oracle import HeuristicsConcurrencyOracle
-from start_time_estimator.config import Configuration, ConcurrencyOracleType, ResourceAvailabilityType, \
-    ConcurrencyThresholds, ReEstimationMethod
+from wta import profiling
 
 END_TIMESTAMP_KEY = 'time:timestamp'
 ACTIVITY_KEY = 'concept:name'
@@ -35,6 +34,9 @@ PROCESSING_TIME_TOTAL_KEY = 'pt_total'
 
 GRANULARITY_MINUTES = 15
 
+NAT_NANOSECONDS = np.iinfo(np.int64).min  # representation of NaT in int64 nanosecond arrays
+UTC_TIMESTAMP_DTYPE = pd.DatetimeTZDtype('ns', 'UTC')  # dtype of the timestamp columns of a loaded log
+
 
 @dataclass
 class EventLogIDs:
@@ -107,26 +109,43 @@ default_log_ids = EventLogIDs(
     resource=RESOURCE_KEY,
 )
 
-default_configuration = Configuration(
-    log_ids=default_log_ids,
-    concurrency_oracle_type=ConcurrencyOracleType.HEURISTICS,
-    resource_availability_type=ResourceAvailabilityType.SIMPLE,
-    concurrency_thresholds=ConcurrencyThresholds(df=0.9, l2l=0.9)
-)
 
+def __getattr__(name: str):
+    # NOTE: start_time_estimator is imported on first use, like in the functions below
+    if name == 'default_configuration':
+        from start_time_estimator.config import Configuration, ConcurrencyOracleType, ResourceAvailabilityType, \
+            ConcurrencyThresholds
 
-def parallel_activities_with_heuristic_oracle(log: pd.DataFrame, log_ids: Optional[EventLogIDs] = None) -> Dict[
-    str, set]:
-    log_ids = log_ids_non_nil(log_ids)
+        globals()[name] = Configuration(
+            log_ids=default_log_ids,
+            concurrency_oracle_type=ConcurrencyOracleType.HEURISTICS,
+            resource_availability_type=ResourceAvailabilityType.SIMPLE,
+            concurrency_thresholds=ConcurrencyThresholds(df=0.9, l2l=0.9)
+        )
+        return globals()[name]
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
 
-    config = Configuration(
-        log_ids=log_ids,
+
+def heuristic_oracle_configuration(log_ids: Optional[EventLogIDs] = None):
+    """Configuration of the heuristic concurrency oracle that discovers the parallel activities of a log."""
+    from start_time_estimator.config import Configuration, ConcurrencyOracleType, ResourceAvailabilityType, \
+        ConcurrencyThresholds, ReEstimationMethod
+
+    return Configuration(
+        log_ids=log_ids_non_nil(log_ids),
         re_estimation_method=ReEstimationMethod.MODE,
         concurrency_oracle_type=ConcurrencyOracleType.HEURISTICS,
         resource_availability_type=ResourceAvailabilityType.SIMPLE,
         bot_resources={"Start", "End"},
         concurrency_thresholds=ConcurrencyThresholds(df=0.9, l2l=0.9)
     )
+
+
+def parallel_activities_with_heuristic_oracle(log: pd.DataFrame, log_ids: Optional[EventLogIDs] = None) -> Dict[
+    str, set]:
+    from start_time_estimator.concurrency_oracle import HeuristicsConcurrencyOracle
+
+    config = heuristic_oracle_configuration(log_ids)
     oracle = HeuristicsConcurrencyOracle(log, config)
     return oracle.concurrency
 
@@ -171,13 +190,25 @@ def timezone_aware_subtraction(df1: pd.DataFrame, df2: pd.DataFrame,
     return df1[df1_col_name].dt.tz_convert(tz='UTC') - df2[df2_col_name].dt.tz_convert(tz='UTC')
 
 
-def add_enabled_timestamp(log: pd.DataFrame, log_ids: Optional[EventLogIDs] = None):
+def add_enabled_timestamp(log: pd.DataFrame, log_ids: Optional[EventLogIDs] = None,
+                          concurrency: Optional[Dict[str, set]] = None):
+    """
+    Adds the enabled time of every event to the log. The concurrency relations between activities are discovered from
+    the log with the heuristic oracle, unless they are given, e.g., discovered from the whole log when the log is a
+    partition of it.
+    """
+    from start_time_estimator.concurrency_oracle import ConcurrencyOracle, HeuristicsConcurrencyOracle
+    from start_time_estimator.config import Configuration
+
     log_ids = log_ids_non_nil(log_ids)
     configuration = Configuration(
         log_ids=log_ids,
         consider_start_times=True,
     )
-    oracle = HeuristicsConcurrencyOracle(log, configuration)
+    if concurrency is None:
+        oracle = HeuristicsConcurrencyOracle(log, configuration)
+    else:
+        oracle = ConcurrencyOracle(concurrency, configuration)
     oracle.add_enabled_times(log)
 
 
@@ -196,25 +227,71 @@ def read_csv(log_path: Path, log_ids: Optional[EventLogIDs] = None, utc: bool =
     return log
 
 
-def print_section_boundaries(title: Optional[str] = None):
-    """Decorator that pretty-prints the result of the analysis"""
+COLUMNAR_LOG_SUFFIXES = ('.parquet', '.feather', '.arrow')
 
-    def decorator(func):
-        def wrapper(*args, **kwargs):
-            click.echo('\n' + '-' * 80)
-            if title:
-                click.echo(title)
-            else:
-                click.echo(func.__name__)
-            click.echo('-' * 80)
 
-            start = time.time()
-            result = func(*args, **kwargs)
-            end = time.time()
-            click.echo(f'Elapsed time: {end - start} seconds')
+def read_log(log_path: Path, log_ids: Optional[EventLogIDs] = None, utc: bool = True) -> pd.DataFrame:
+    """
+    Reads an event log from CSV, Parquet or Feather depending on the file extension. Columnar logs are read with only
+    the columns mapped in log_ids, which also keeps their types, so timestamps don't have to be parsed from strings.
+    """
+    log_path = Path(log_path)
+    if log_path.suffix.lower() not in COLUMNAR_LOG_SUFFIXES:
+        return read_csv(log_path, log_ids=log_ids, utc=utc)
+
+    log_ids = log_ids_non_nil(log_ids)
+
+    try:
+        import pyarrow.dataset
+    except ImportError as e:
+        raise ImportError('Reading Parquet and Feather logs requires pyarrow, install it with `pip install pyarrow`') \
+            from e
 
-            click.echo('-' * 80)
-            return result
+    # NOTE: only the schema is read here, the columns that aren't mapped are never loaded
+    file_format = 'parquet' if log_path.suffix.lower() == '.parquet' else 'feather'
+    dataset = pyarrow.dataset.dataset(log_path, format=file_format)
+    columns = [column for column in _mapped_columns(log_ids) if column in dataset.schema.names]
+    log = dataset.to_table(columns=columns).to_pandas()
+
+    log = convert_timestamp_columns_to_datetime(log, log_ids, utc=utc)
+    for column in [WAITING_TIME_TOTAL_KEY, WAITING_TIME_BATCHING_KEY]:
+        if column in log.columns:
+            log[column] = pd.to_timedelta(log[column])
+
+    return log
+
+
+def write_parquet(df: pd.DataFrame, path: Path):
+    """Writes a log or a transitions report to a compressed Parquet file, keeping the column types."""
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError as e:
+        raise ImportError('Writing Parquet files requires pyarrow, install it with `pip install pyarrow`') from e
+
+    df.to_parquet(path, index=False, compression='zstd')
+
+
+def _mapped_columns(log_ids: EventLogIDs) -> List[str]:
+    """Columns of a log mapped in log_ids, in the order of the mapping, without duplicates."""
+    columns = [log_ids.case, log_ids.activity, log_ids.resource, log_ids.start_time, log_ids.end_time,
+               log_ids.enabled_time, log_ids.batch_id, log_ids.batch_type, log_ids.batch_instance_enabled,
+               log_ids.wt_total, log_ids.wt_batching]
+    return list(dict.fromkeys(columns))
+
+
+def print_section_boundaries(title: Optional[str] = None, stage: Optional[str] = None):
+    """
+    Decorator that pretty-prints the result of the analysis and records the decorated function as a stage of the
+    active profiler, see wta.profiling. The stage is named after the stage argument, the title or the function, and
+    its rows are the length of the first DataFrame argument.
+    """
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            rows = next((len(arg) for arg in args if isinstance(arg, pd.DataFrame)), None)
+            with profiling.stage(stage or title or func.__name__, rows=rows, title=title or func.__name__):
+                return func(*args, **kwargs)
 
         return wrapper
 
@@ -226,17 +303,68 @@ def convert_timestamp_columns_to_datetime(
         log_ids: EventLogIDs,
         time_columns: Tuple[str] = None,
         utc: bool = True) -> pd.DataFrame:
-    """Converts the timestamp columns of the event log to datetime."""
+    """
+    Converts the timestamp columns of the event log to datetime. With utc, the timestamps are normalized to UTC with
+    nanosecond resolution, i.e., int64 nanoseconds since the epoch, which the analysis relies on. It's meant to be done
+    once, when the log is loaded, and columns that are already normalized are left as they are.
+    """
 
     if not time_columns:
         time_columns = [log_ids.start_time, log_ids.end_time, log_ids.enabled_time, log_ids.batch_instance_enabled]
     for column in time_columns:
-        if column in event_log.columns:
+        if column in event_log.columns and not (utc and is_normalized_timestamps(event_log[column])):
             event_log[column] = pd.to_datetime(event_log[column], utc=utc)
 
     return event_log
 
 
+def encode_categorical_columns(
+        event_log: pd.DataFrame,
+        log_ids: EventLogIDs,
+        columns: Tuple[str] = None) -> pd.DataFrame:
+    """
+    Encodes the case, activity and resource columns of the event log as categoricals: integer codes, with the values
+    kept once in the dtype. The log takes less memory and is cheaper to pickle, and equality filters and groupbys on
+    these columns work on the codes. Categories are sorted, so groupbys keep the order of the values. Columns that
+    are already categorical are left as they are, see decode_categorical for the outputs.
+    """
+
+    if not columns:
+        columns = [log_ids.case, log_ids.activity, log_ids.resource]
+    for column in columns:
+        if column in event_log.columns and not isinstance(event_log[column].dtype, pd.CategoricalDtype):
+            event_log[column] = event_log[column].astype('category')
+
+    return event_log
+
+
+def decode_categorical(values: pd.Series) -> pd.Series:
+    """Values of a column encoded by encode_categorical_columns, with the dtype they had before the encoding."""
+    if not isinstance(values.dtype, pd.CategoricalDtype):
+        return values
+    dtype = values.cat.categories.dtype
+    return values.astype(object if values.isna().any() else dtype)
+
+
+def is_normalized_timestamps(timestamps: pd.Series) -> bool:
+    """Whether the timestamps are UTC datetimes with nanosecond resolution, see convert_timestamp_columns_to_datetime."""
+    return timestamps.dtype == UTC_TIMESTAMP_DTYPE
+
+
+def as_nanoseconds(timestamps: pd.Series) -> np.ndarray:
+    """Returns the timestamps as int64 nanoseconds since the epoch in UTC, NaT is represented by NAT_NANOSECONDS."""
+    if not pd.api.types.is_datetime64_any_dtype(timestamps):
+        timestamps = pd.to_datetime(timestamps, utc=True)
+    return timestamps.to_numpy(dtype='datetime64[ns]').view(np.int64)
+
+
+def nanoseconds_to_seconds(durations: np.ndarray) -> np.ndarray:
+    """Converts int64 nanosecond durations to seconds the same way as pd.Timedelta.total_seconds() does."""
+    seconds = (durations // 1000) / 1e6
+    seconds[durations == NAT_NANOSECONDS] = np.nan
+    return seconds
+
+
 def log_ids_non_nil(log_ids: Optional[EventLogIDs]) -> EventLogIDs:
     """Returns non-nil event log columns."""
 
@@ -254,14 +382,13 @@ def get_total_processing_time(log: pd.DataFrame, log_ids: Optional[EventLogIDs]
 
 
 def compute_batch_activation_times(event_log: pd.DataFrame, log_ids: EventLogIDs) -> pd.DataFrame:
-    event_log[log_ids.batch_instance_enabled] = pd.NaT
-    batch_events = event_log[~pd.isna(event_log[log_ids.batch_id])]
-    for (batch_key,), batch_instance in batch_events.groupby([log_ids.batch_id]):
-        mask = event_log[log_ids.batch_id].eq(batch_key)
-        event_log.loc[
-            mask,
-            log_ids.batch_instance_enabled
-        ] = batch_instance[log_ids.enabled_time].max()
+    """
+    Sets the enablement time of the batch instance of every event, i.e., the latest enabled time among the events of
+    the batch instance, with a single grouped transform. Events outside batches get NaT.
+    """
+    event_log[log_ids.batch_instance_enabled] = event_log \
+        .groupby(log_ids.batch_id, sort=False, dropna=True)[log_ids.enabled_time] \
+        .transform('max')
     return event_log
 
 
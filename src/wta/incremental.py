@@ -0,0 +1,268 @@
+import json
+from dataclasses import dataclass, asdict
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import click
+import numpy as np
+import pandas as pd
+
+from wta import activity_transitions
+from wta.helpers import EventLogIDs, log_ids_non_nil, print_section_boundaries, as_nanoseconds, NAT_NANOSECONDS, \
+    convert_timestamp_columns_to_datetime
+from wta.waiting_time.resource_index import ResourceEventIndex
+
+STATE_VERSION = 1  # bumped when the layout of the state changes, states of other versions are ignored
+
+_LOG_FILE = 'log.pkl'
+_CALENDAR_FILE = 'calendar.json'
+_PARALLEL_ACTIVITIES_FILE = 'parallel_activities.json'
+_META_FILE = 'state.json'
+
+
+@dataclass
+class AnalysisState:
+    """
+    State of a run kept for the next incremental run on the same, grown, log: the enriched log with the source of the
+    transition to every destination event and its waiting time components, the calendar and the parallel activities.
+    """
+
+    log: pd.DataFrame
+    calendar: dict
+    parallel_activities: Dict[str, List[str]]
+
+    def save(self, state_dir: Path, log_ids: EventLogIDs):
+        state_dir = Path(state_dir)
+        state_dir.mkdir(parents=True, exist_ok=True)
+        # NOTE: the metadata is written last, so that an interrupted save leaves a state that is ignored
+        (state_dir / _META_FILE).unlink(missing_ok=True)
+        self.log.to_pickle(state_dir / _LOG_FILE)
+        _write_json(state_dir / _CALENDAR_FILE, self.calendar)
+        _write_json(state_dir / _PARALLEL_ACTIVITIES_FILE, self.parallel_activities)
+        _write_json(state_dir / _META_FILE, _state_meta(log_ids))
+
+    @staticmethod
+    def load(state_dir: Path, log_ids: EventLogIDs) -> Optional['AnalysisState']:
+        """Loads the state, None if there is none or it was saved by another version or with other column names."""
+        state_dir = Path(state_dir)
+        meta_path = state_dir / _META_FILE
+        if not meta_path.exists():
+            return None
+        with meta_path.open('r') as f:
+            if json.load(f) != _state_meta(log_ids):
+                return None
+
+        with (state_dir / _CALENDAR_FILE).open('r') as f:
+            calendar = json.load(f)
+        with (state_dir / _PARALLEL_ACTIVITIES_FILE).open('r') as f:
+            parallel_activities = json.load(f)
+        return AnalysisState(pd.read_pickle(state_dir / _LOG_FILE), calendar, parallel_activities)
+
+
+@print_section_boundaries('Incremental Activity Transitions Analysis', stage='transitions')
+def identify(log: pd.DataFrame, parallel_activities: Dict[str, set], calendar: dict, state_dir: Path,
+             parallel_run: bool = True, log_ids: Optional[EventLogIDs] = None,
+             n_workers: Optional[int] = None) -> Optional[pd.DataFrame]:
+    """
+    Identifies activity transitions and analyzes their waiting time as activity_transitions.identify does, reusing the
+    state of the previous run saved in state_dir, and saves the state of this run there.
+
+    Transitions are marked again only in the cases with new events, or in every case if the parallel activities
+    changed. The waiting time of a destination event is analyzed again only if the event is new, any of the columns
+    the analysis reads changed, e.g., its enabled time or batch, the calendar of its resource changed, or a new or
+    changed event of its resource was processed during its waiting time. The waiting time of the other events is
+    taken from the state, so the result is the same as the one of a full run.
+    """
+    log_ids = log_ids_non_nil(log_ids)
+    # NOTE: the columns are converted in a shallow copy, so that the log of the caller keeps its dtypes
+    log = log.copy(deep=False)
+    log = convert_timestamp_columns_to_datetime(log, log_ids)
+    parallel_activities = {activity: sorted(parallel) for activity, parallel in parallel_activities.items()}
+    calendar = json.loads(json.dumps(calendar))  # same types as the calendar loaded from the state
+    previous = AnalysisState.load(state_dir, log_ids)
+    if previous is None:
+        click.echo('No previous state, analyzing all events')
+        columns = log.columns.union([log_ids.transition_source_index] + _component_columns(log_ids), sort=False)
+        previous = AnalysisState(log.iloc[:0].reindex(columns=columns), {}, {})
+
+    matches = match_events(previous.log, log, log_ids)
+    transition_sources = _transition_sources(previous, log, log_ids, parallel_activities, matches)
+
+    destinations = transition_sources.index
+    changed = affected_destinations(previous, log, calendar, destinations, log_ids, matches)
+    click.echo(f'Analyzing {len(changed)} of {len(destinations)} destination events')
+    components = pd.concat([
+        _previous_components(previous, log, destinations.difference(changed, sort=False), log_ids, matches),
+        activity_transitions.analyze_destinations(log, log_ids, calendar, changed, parallel_run, n_workers),
+    ])
+
+    state_log = log.copy()
+    state_log[log_ids.transition_source_index] = transition_sources
+    for column in _component_columns(log_ids):
+        state_log[column] = components[column]
+    AnalysisState(state_log, calendar, parallel_activities).save(state_dir, log_ids)
+
+    transitions = activity_transitions.join_transitions(log, log_ids, transition_sources, components)
+    return None if transitions is None else activity_transitions.process_all_items(transitions)
+
+
+def match_events(previous_log: pd.DataFrame, log: pd.DataFrame, log_ids: EventLogIDs) -> pd.Series:
+    """
+    Labels of the events of the previous log matching the events of the log, indexed by the labels of the events of
+    the log, NaN for new events. Events match if they have the same case, activity, resource and timestamps, repeated
+    events are matched in order.
+    """
+
+    def keyed(frame: pd.DataFrame) -> pd.DataFrame:
+        keys = frame[_key_columns(log_ids)].copy()
+        keys['occurrence'] = keys.groupby(_key_columns(log_ids), sort=False, dropna=False).cumcount()
+        keys['label'] = frame.index
+        return keys
+
+    merged = keyed(log).merge(keyed(previous_log), how='left', on=_key_columns(log_ids) + ['occurrence'],
+                              suffixes=('', '_previous'))
+    return pd.Series(merged['label_previous'].to_numpy(), index=merged['label'].to_numpy())
+
+
+def affected_destinations(previous: AnalysisState, log: pd.DataFrame, calendar: dict, destinations: pd.Index,
+                          log_ids: EventLogIDs, matches: Optional[pd.Series] = None) -> pd.Index:
+    """Destination events whose waiting time has to be analyzed again, see identify."""
+    if matches is None:
+        matches = match_events(previous.log, log, log_ids)
+
+    # destinations of the previous run, the only ones with waiting time components in the state
+    previous_destinations = previous.log.index[previous.log[log_ids.transition_source_index].notna()] \
+        if log_ids.transition_source_index in previous.log.columns else previous.log.index[:0]
+    matched = matches.notna().to_numpy() & matches.isin(previous_destinations).to_numpy()
+    changed = pd.Series(~matched, index=log.index)
+
+    # events whose columns read by the analysis changed
+    current_rows = log.index[matches.notna().to_numpy()]
+    previous_rows = pd.Index(matches.dropna().to_numpy(), dtype=previous.log.index.dtype)
+    modified = ~_same_values(_analysis_columns(log, log_ids, matches), current_rows, previous_rows,
+                             _analysis_columns(previous.log, log_ids, None))
+    changed.loc[current_rows[modified]] = True
+
+    # events of the resources with another calendar
+    resources = log[log_ids.resource].dropna().unique()
+    recalendared = [resource for resource in resources if calendar.get(resource) != previous.calendar.get(resource)]
+    changed |= log[log_ids.resource].isin(recalendared)
+
+    # events whose waiting time overlaps with the processing of new, removed or modified events of their resource
+    touched = pd.concat([
+        log.loc[log.index[matches.isna().to_numpy()].append(current_rows[modified]), _span_columns(log_ids)],
+        previous.log.loc[previous.log.index.difference(previous_rows).append(previous_rows[modified]),
+                         _span_columns(log_ids)],
+    ], ignore_index=True)
+    if len(touched) > 0:
+        touched_index = ResourceEventIndex(touched, log_ids)
+        codes = pd.Index(touched_index.resources).get_indexer(log[log_ids.resource])
+        lower, upper = touched_index.candidate_ranges(codes, as_nanoseconds(log[log_ids.enabled_time]),
+                                                      as_nanoseconds(log[log_ids.start_time]))
+        # NOTE: with a running maximum of end times, a non-empty range means that some touched event overlaps
+        changed |= pd.Series(lower < upper, index=log.index)
+
+    return destinations[changed.loc[destinations].to_numpy()]
+
+
+def _transition_sources(previous: AnalysisState, log: pd.DataFrame, log_ids: EventLogIDs,
+                        parallel_activities: Dict[str, List[str]], matches: pd.Series) -> pd.Series:
+    """
+    Sources of the transitions of the log, see activity_transitions.mark_transition_sources. The ones of the cases
+    whose events are all matched to the previous log are taken from the state, other cases are marked again.
+    """
+    if parallel_activities != previous.parallel_activities or \
+            log_ids.transition_source_index not in previous.log.columns:
+        return activity_transitions.mark_transition_sources(log, log_ids, parallel_activities)
+
+    matched_labels = matches.dropna().astype(previous.log.index.dtype)
+    new_cases = log.loc[matches.isna().to_numpy(), log_ids.case]
+    removed_cases = previous.log.loc[previous.log.index.difference(matched_labels.to_numpy()), log_ids.case]
+    marked_cases = log[log_ids.case].isin(pd.concat([new_cases, removed_cases]).unique())
+
+    # previous sources of the unchanged cases, translated to the labels of the log
+    labels = pd.Series(matched_labels.index, index=matched_labels.to_numpy())
+    previous_sources = previous.log[log_ids.transition_source_index]
+    destinations = log.index[(~marked_cases & matches.notna()).to_numpy()]
+    destinations = destinations[previous_sources.loc[matches.loc[destinations].to_numpy()].notna().to_numpy()]
+    reused = pd.Series(labels.loc[previous_sources.loc[matches.loc[destinations].to_numpy()].to_numpy()].to_numpy(),
+                       index=destinations)
+
+    marked = activity_transitions.mark_transition_sources(log[marked_cases], log_ids, parallel_activities)
+    transition_sources = pd.concat([reused, marked]).astype(log.index.dtype)
+    return transition_sources.iloc[_report_order(log, transition_sources.index, log_ids)]
+
+
+def _report_order(log: pd.DataFrame, destinations: pd.Index, log_ids: EventLogIDs) -> np.ndarray:
+    """
+    Order in which the destinations are reported, as in activity_transitions.mark_transition_sources: by case, then by
+    end and start time with missing times last, then by position in the log.
+    """
+    rows = log.loc[destinations]
+    cases = pd.factorize(rows[log_ids.case], sort=True)[0]
+    ends = as_nanoseconds(rows[log_ids.end_time])
+    starts = as_nanoseconds(rows[log_ids.start_time])
+    last = np.iinfo(np.int64).max
+    ends[ends == NAT_NANOSECONDS] = last
+    starts[starts == NAT_NANOSECONDS] = last
+    return np.lexsort((log.index.get_indexer(destinations), starts, ends, cases))
+
+
+def _previous_components(previous: AnalysisState, log: pd.DataFrame, destinations: pd.Index, log_ids: EventLogIDs,
+                         matches: pd.Series) -> pd.DataFrame:
+    previous_destinations = matches.loc[destinations].astype(previous.log.index.dtype).to_numpy()
+    components = previous.log.loc[previous_destinations, _component_columns(log_ids)]
+    components.index = destinations
+    components.insert(0, log_ids.wt_total, log.loc[destinations, log_ids.wt_total])
+    return components
+
+
+def _same_values(current: pd.DataFrame, current_rows: pd.Index, previous_rows: pd.Index,
+                 previous: pd.DataFrame) -> np.ndarray:
+    """Whether the rows have the same values in the columns of both frames, considering missing values equal."""
+    same = np.ones(len(current_rows), dtype=bool)
+    for column in current.columns.intersection(previous.columns):
+        current_values = current.loc[current_rows, column].reset_index(drop=True)
+        previous_values = previous.loc[previous_rows, column].reset_index(drop=True)
+        same &= ((current_values == previous_values) | (current_values.isna() & previous_values.isna())).to_numpy()
+    return same
+
+
+def _analysis_columns(log: pd.DataFrame, log_ids: EventLogIDs, matches: Optional[pd.Series]) -> pd.DataFrame:
+    """
+    Columns of the events read by the waiting time analysis. Batches are compared by the smallest label of their events in
+    the previous log instead of their ID, since batch IDs are numbered again by every run.
+    """
+    columns = [log_ids.resource, log_ids.start_time, log_ids.end_time, log_ids.enabled_time,
+               log_ids.batch_instance_enabled, log_ids.wt_total]
+    frame = log[[column for column in columns if column in log.columns]].copy()
+    if log_ids.batch_id in log.columns:
+        # events are identified by their label in the previous log, if matched
+        identities = pd.Series(log.index, index=log.index) if matches is None else \
+            matches.fillna(pd.Series(-1 - np.arange(len(log)), index=log.index))
+        frame[log_ids.batch_id] = identities.groupby(log[log_ids.batch_id].to_numpy()).transform('min')
+    return frame
+
+
+def _key_columns(log_ids: EventLogIDs) -> List[str]:
+    return [log_ids.case, log_ids.activity, log_ids.resource, log_ids.start_time, log_ids.end_time]
+
+
+def _span_columns(log_ids: EventLogIDs) -> List[str]:
+    return [log_ids.resource, log_ids.start_time, log_ids.end_time]
+
+
+def _component_columns(log_ids: EventLogIDs) -> List[str]:
+    return [log_ids.wt_batching, log_ids.wt_prioritization, log_ids.wt_contention, log_ids.wt_unavailability,
+            log_ids.wt_extraneous]
+
+
+def _state_meta(log_ids: EventLogIDs) -> dict:
+    from wta import __version__
+
+    return {'state_version': STATE_VERSION, 'version': __version__, 'log_ids': asdict(log_ids)}
+
+
+def _write_json(path: Path, value):
+    with path.open('w') as f:
+        json.dump(value, f)
@@ -4,10 +4,11 @@ from typing import Optional, List, Callable, Dict, Union
 import click
 import pandas as pd
 
-from batch_processing_discovery.discovery import discover_batches
-from wta import log_ids_non_nil, activity_transitions, EventLogIDs, read_csv, \
+from wta import log_ids_non_nil, activity_transitions, EventLogIDs, read_log, \
     parallel_activities_with_heuristic_oracle, add_enabled_timestamp, compute_batch_activation_times, \
-    print_section_boundaries
+    print_section_boundaries, GRANULARITY_MINUTES
+from wta import profiling, incremental, out_of_core
+from wta.cache import StageCache, cached_stage
 from wta.transitions_report import TransitionsReport
 
 REPORT_INDEX_COLUMNS = ['source_activity', 'source_resource', 'destination_activity', 'destination_resource']
@@ -18,42 +19,122 @@ def run(log_path: Path,
         log_ids: Optional[EventLogIDs] = None,
         preprocessing_funcs: Optional[List[Callable]] = None,
         calendar: Optional[Dict] = None,
-        group_results: bool = True) -> Union[TransitionsReport, Optional[pd.DataFrame]]:
+        group_results: bool = True,
+        shared_memory: bool = False,
+        vectorized: bool = False,
+        cache_dir: Optional[Path] = None,
+        n_workers: Optional[int] = None,
+        partition_by_resource: bool = False,
+        state_dir: Optional[Path] = None,
+        memory_budget: Optional[int] = None,
+        spill_dir: Optional[Path] = None) -> Union[TransitionsReport, Optional[pd.DataFrame]]:
     """
     Entry point for the project. It starts the main analysis which identifies activity transitions, and then uses them
     to analyze different types of waiting time.
+
+    When shared_memory is set, the parallel run publishes the log into shared memory once instead of sending it to
+    every task. When vectorized is set, the waiting time of all transitions is analyzed at once with the vectorized
+    engine instead of case by case. n_workers sets the number of worker processes of a parallel run, by default one
+    less than the cores available to the process. When partition_by_resource is set, the log is partitioned by resource
+    instead of by case, and every task receives only the events and calendar of its resources.
+
+    The log is read from CSV, Parquet or Feather depending on the extension of log_path, see read_log.
+
+    When cache_dir is set, the enabled times, the batches, the parallel activities and the calendar are stored in the
+    directory, keyed by the content of the log and the parameters, and reused by later runs on the same log.
+
+    When state_dir is set, the transitions are analyzed incrementally: the state of the previous run saved in the
+    directory is reused for the events not affected by the events appended to the log since then, see
+    wta.incremental.identify, and the state of this run is saved there. The result is the same as the one of a full
+    run.
+
+    When memory_budget is set, in bytes, the log is analyzed out of core: it is read in chunks and partitioned on disk,
+    in spill_dir if set, so that the events held in memory at once take about that much, see wta.out_of_core.run. The
+    result is the same as the one of a run in memory.
+
+    The stages of the run are recorded by the active wta.profiling.Profiler, if any.
     """
     log_ids = log_ids_non_nil(log_ids)
 
-    log = read_csv(log_path, log_ids=log_ids)
+    if memory_budget is not None:
+        if (preprocessing_funcs or cache_dir is not None or state_dir is not None or vectorized or shared_memory
+                or partition_by_resource):
+            raise ValueError('An out-of-core run does not support preprocessing functions, the cache, the incremental '
+                             'state, the vectorized engine, shared memory or the partitioning by resource')
+        return out_of_core.run(log_path, log_ids=log_ids, memory_budget=memory_budget, spill_dir=spill_dir,
+                               calendar=calendar, parallel_run=parallel_run, n_workers=n_workers)
+
+    if state_dir is not None and (shared_memory or vectorized or partition_by_resource):
+        raise ValueError('An incremental run does not support shared memory, the vectorized engine or the '
+                         'partitioning by resource')
+
+    with profiling.stage('read') as metrics:
+        log = read_log(log_path, log_ids=log_ids)
+        metrics.rows = len(log)
+
+    with profiling.stage('preprocessing', rows=len(log)):
+        # preprocess event log
+        if preprocessing_funcs is not None:
+            for preprocess_func in preprocessing_funcs:
+                click.echo(f'Preprocessing [{preprocess_func.__name__}]')
+                log = preprocess_func(log)
 
-    # preprocess event log
-    if preprocessing_funcs is not None:
-        for preprocess_func in preprocessing_funcs:
-            click.echo(f'Preprocessing [{preprocess_func.__name__}]')
-            log = preprocess_func(log)
+        # discarding unnecessary columns
+        log = log[[log_ids.case, log_ids.activity, log_ids.resource, log_ids.start_time, log_ids.end_time]]
 
-    # discarding unnecessary columns
-    log = log[[log_ids.case, log_ids.activity, log_ids.resource, log_ids.start_time, log_ids.end_time]]
+        # NOTE: sorting by end time is important for concurrency oracle that is run during batching analysis
+        log.sort_values(by=[log_ids.end_time, log_ids.start_time, log_ids.activity], inplace=True)
 
-    # NOTE: sorting by end time is important for concurrency oracle that is run during batching analysis
-    log.sort_values(by=[log_ids.end_time, log_ids.start_time, log_ids.activity], inplace=True)
+    cache = StageCache(cache_dir) if cache_dir is not None else None
 
-    add_enabled_timestamp(log, log_ids)
+    log = cached_stage(cache, 'enabled_times', log, None, lambda: _add_enabled_timestamp(log, log_ids))
 
-    log = _batch_discovery(log, log_ids)
+    log = cached_stage(cache, 'batches', log, None, lambda: _batch_discovery(log.copy(), log_ids))
 
     # total waiting time
     log[log_ids.wt_total] = log[log_ids.start_time] - log[log_ids.enabled_time]
 
-    parallel_activities = parallel_activities_with_heuristic_oracle(log, log_ids=log_ids)
+    oracle_columns = [log_ids.case, log_ids.activity, log_ids.resource, log_ids.start_time, log_ids.end_time]
+    parallel_activities = cached_stage(
+        cache, 'parallel_activities', log[oracle_columns], None,
+        lambda: _parallel_activities(log, log_ids))
+    parallel_activities = {activity: set(parallel) for activity, parallel in parallel_activities.items()}
+
+    if calendar is None and cache is not None:
+        calendar_columns = [log_ids.resource, log_ids.activity, log_ids.start_time, log_ids.end_time]
+        calendar = cached_stage(
+            cache, 'calendar', log[calendar_columns], {'granularity': GRANULARITY_MINUTES},
+            lambda: activity_transitions.make_calendar_if_none(log, log_ids, None, parallel_run, n_workers))
+
+    if state_dir is not None:
+        calendar = activity_transitions.make_calendar_if_none(log, log_ids, calendar, parallel_run, n_workers)
+        return incremental.identify(log, parallel_activities, calendar, state_dir, parallel_run, log_ids=log_ids,
+                                    n_workers=n_workers)
+
     transitions_data = activity_transitions.identify(log, parallel_activities, parallel_run, log_ids=log_ids,
-                                                     calendar=calendar)
+                                                     calendar=calendar, shared_memory=shared_memory,
+                                                     vectorized=vectorized, n_workers=n_workers,
+                                                     partition_by_resource=partition_by_resource)
 
     return transitions_data
 
 
-@print_section_boundaries('Batch Analysis')
+def _add_enabled_timestamp(log: pd.DataFrame, log_ids: EventLogIDs) -> pd.DataFrame:
+    with profiling.stage('enabled_times', rows=len(log)):
+        log = log.copy()
+        add_enabled_timestamp(log, log_ids)
+        return log
+
+
+def _parallel_activities(log: pd.DataFrame, log_ids: EventLogIDs) -> Dict[str, List[str]]:
+    with profiling.stage('concurrency_oracle', rows=len(log)):
+        return {activity: sorted(parallel) for activity, parallel in
+                parallel_activities_with_heuristic_oracle(log, log_ids=log_ids).items()}
+
+
+@print_section_boundaries('Batch Analysis', stage='batching')
 def _batch_discovery(log: pd.DataFrame, log_ids: EventLogIDs) -> pd.DataFrame:
+    from batch_processing_discovery.discovery import discover_batches
+
     log = discover_batches(log, log_ids)
     return compute_batch_activation_times(log, log_ids)
@@ -0,0 +1,335 @@
+import math
+import tempfile
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple, TYPE_CHECKING
+
+import click
+import numpy as np
+import pandas as pd
+
+from wta import activity_transitions, profiling
+from wta.calendars import calendars
+from wta.helpers import EventLogIDs, log_ids_non_nil, convert_timestamp_columns_to_datetime, add_enabled_timestamp, \
+    compute_batch_activation_times, print_section_boundaries, heuristic_oracle_configuration, GRANULARITY_MINUTES, \
+    COLUMNAR_LOG_SUFFIXES
+
+if TYPE_CHECKING:
+    from start_time_estimator.config import ConcurrencyThresholds
+
+DEFAULT_MEMORY_BUDGET_BYTES = 1024 ** 3  # 1 GiB
+
+# NOTE: the analysis of a partition holds several copies of its events, e.g., the batched log and the resource slices
+WORKING_SET_FACTOR = 4
+# in-memory size of an event with the analyzed columns, used to size the chunks in which the log is read
+ESTIMATED_EVENT_BYTES = 400
+
+_CHUNKS = 'chunks'  # the log as read, chunk by chunk
+_CASES = 'cases'  # events partitioned by case
+_MARKED = 'marked'  # events partitioned by case, with enabled times and the sources of their transitions
+_RESOURCES = 'resources'  # events partitioned by resource
+_ENRICHED = 'enriched'  # events partitioned by resource, with batches and total waiting times
+_COMPONENTS = 'components'  # waiting time components of the destination events, partitioned by case
+
+
+class PartitionStore:
+    """
+    Partitions of a log stored on disk with pickle. A partition is made of pieces written separately, e.g., one per
+    chunk of the log, and is read back as a whole, with its events in the order of the log.
+    """
+
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+
+    def write(self, name: str, frame: pd.DataFrame, partitions: np.ndarray, piece: int):
+        """Writes the events of the frame as pieces of the partitions given by their partition numbers."""
+        for partition, positions in pd.Series(partitions).groupby(partitions, sort=False).indices.items():
+            path = self._partition_dir(name, partition) / f'{piece:08d}.pkl'
+            path.parent.mkdir(parents=True, exist_ok=True)
+            frame.iloc[positions].to_pickle(path)
+
+    def read(self, name: str, partition: int) -> Optional[pd.DataFrame]:
+        """The events of the partition sorted by their labels, which number the events of the log, None if empty."""
+        paths = sorted(self._partition_dir(name, partition).glob('*.pkl'))
+        if not paths:
+            return None
+        return pd.concat([pd.read_pickle(path) for path in paths]).sort_index(kind='stable')
+
+    def remove(self, name: str, partition: int):
+        for path in self._partition_dir(name, partition).glob('*.pkl'):
+            path.unlink()
+
+    def _partition_dir(self, name: str, partition: int) -> Path:
+        return self.directory / name / str(partition)
+
+
+def run(log_path: Path,
+        log_ids: Optional[EventLogIDs] = None,
+        memory_budget: int = DEFAULT_MEMORY_BUDGET_BYTES,
+        spill_dir: Optional[Path] = None,
+        calendar: Optional[dict] = None,
+        parallel_run: bool = False,
+        n_workers: Optional[int] = None) -> Optional[pd.DataFrame]:
+    """
+    Runs the analysis of main.run on a log that doesn't have to fit in memory. The log is read in chunks and
+    partitioned on disk by case, to discover the parallel activities, add the enabled times and mark the transitions,
+    and then by resource, to discover the batches and the calendar and analyze the waiting time of the destination
+    events. The transitions of every case partition are joined with their waiting time at the end and merged in the
+    order of a run in memory, with the same result.
+
+    The memory budget, in bytes, bounds the events held at once: the number of partitions is chosen so that the
+    analysis of a partition takes about that much memory. A partition holds whole cases or whole resources, so a single
+    case or resource larger than the budget still takes more. The partitions are written to a temporary directory in
+    spill_dir, by default the one of the system, which is removed at the end.
+
+    Parallel activities are discovered with the heuristic oracle from the counts of directly-follows relations of all
+    partitions, see _heuristic_concurrency, so they are the same as the ones discovered from the whole log.
+    """
+    log_ids = log_ids_non_nil(log_ids)
+    if spill_dir is not None:
+        Path(spill_dir).mkdir(parents=True, exist_ok=True)
+
+    with tempfile.TemporaryDirectory(prefix='wta-', dir=spill_dir) as directory:
+        store = PartitionStore(Path(directory))
+        n_partitions = _partition_log(log_path, log_ids, store, memory_budget)
+        click.echo(f'Out-of-core run: {n_partitions} partitions by case and by resource in {directory}')
+
+        parallel_activities = _parallel_activities(store, n_partitions, log_ids)
+        _add_enabled_times_and_transitions(store, n_partitions, log_ids, parallel_activities)
+        calendar = _batches_and_calendar(store, n_partitions, log_ids, calendar, parallel_run, n_workers)
+        return _identify_transitions(store, n_partitions, log_ids, calendar, parallel_run, n_workers)
+
+
+def _partition_log(log_path: Path, log_ids: EventLogIDs, store: PartitionStore, memory_budget: int) -> int:
+    """
+    Reads the log in chunks and writes its events partitioned by case, labeled by their position in the log. Returns
+    the number of partitions, chosen from the size of the events once they are all read.
+    """
+    chunk_rows = max(memory_budget // (WORKING_SET_FACTOR * ESTIMATED_EVENT_BYTES), 1)
+    with profiling.stage('read') as metrics:
+        n_events, n_bytes, n_chunks = 0, 0, 0
+        for chunk in _read_chunks(log_path, log_ids, chunk_rows):
+            chunk.index = pd.RangeIndex(n_events, n_events + len(chunk))
+            convert_timestamp_columns_to_datetime(chunk, log_ids)
+            n_events += len(chunk)
+            n_bytes += int(chunk.memory_usage(deep=True).sum())
+            store.write(_CHUNKS, chunk, np.zeros(len(chunk), dtype=np.int64), n_chunks)
+            n_chunks += 1
+        metrics.rows = n_events
+
+        n_partitions = max(math.ceil(n_bytes * WORKING_SET_FACTOR / memory_budget), 1)
+        for piece in range(n_chunks):
+            path = store.directory / _CHUNKS / '0' / f'{piece:08d}.pkl'
+            chunk = pd.read_pickle(path)
+            store.write(_CASES, chunk, _partition_numbers(chunk[log_ids.case], n_partitions), piece)
+            path.unlink()
+
+    return n_partitions
+
+
+def _read_chunks(log_path: Path, log_ids: EventLogIDs, chunk_rows: int) -> Iterator[pd.DataFrame]:
+    """Reads the analyzed columns of the log from CSV, Parquet or Feather in chunks of at most chunk_rows events."""
+    columns = [log_ids.case, log_ids.activity, log_ids.resource, log_ids.start_time, log_ids.end_time]
+    log_path = Path(log_path)
+    if log_path.suffix.lower() not in COLUMNAR_LOG_SUFFIXES:
+        with pd.read_csv(log_path, usecols=columns, chunksize=chunk_rows) as reader:
+            for chunk in reader:
+                yield chunk[columns]
+        return
+
+    try:
+        import pyarrow.dataset
+    except ImportError as e:
+        raise ImportError('Reading Parquet and Feather logs requires pyarrow, install it with `pip install pyarrow`') \
+            from e
+
+    file_format = 'parquet' if log_path.suffix.lower() == '.parquet' else 'feather'
+    dataset = pyarrow.dataset.dataset(log_path, format=file_format)
+    for batch in dataset.to_batches(columns=columns, batch_size=chunk_rows):
+        yield batch.to_pandas()
+
+
+def _partition_numbers(values: pd.Series, n_partitions: int) -> np.ndarray:
+    # NOTE: values are hashed as strings, since a chunk can read the same case or resource IDs with another type
+    hashes = pd.util.hash_pandas_object(values.astype(str), index=False).to_numpy()
+    return (hashes % np.uint64(n_partitions)).astype(np.int64)
+
+
+def _read_sorted(store: PartitionStore, name: str, partition: int, log_ids: EventLogIDs) -> Optional[pd.DataFrame]:
+    """Events of the partition in the order main.run sorts the log in."""
+    events = store.read(name, partition)
+    if events is None:
+        return None
+    return events.sort_values(by=[log_ids.end_time, log_ids.start_time, log_ids.activity], kind='stable')
+
+
+def _parallel_activities(store: PartitionStore, n_partitions: int, log_ids: EventLogIDs) -> Dict[str, set]:
+    with profiling.stage('concurrency_oracle') as metrics:
+        activities, follows, loops = {}, Counter(), Counter()
+        metrics.rows = 0
+        for partition in range(n_partitions):
+            cases = _read_sorted(store, _CASES, partition, log_ids)
+            if cases is None:
+                continue
+            metrics.rows += len(cases)
+            activities.update(dict.fromkeys(cases[log_ids.activity].unique()))
+            partition_follows, partition_loops = _directly_follows_counts(cases, log_ids)
+            follows.update(partition_follows)
+            loops.update(partition_loops)
+        thresholds = heuristic_oracle_configuration(log_ids).concurrency_thresholds
+        return _heuristic_concurrency(list(activities), follows, loops, thresholds)
+
+
+def _directly_follows_counts(cases: pd.DataFrame, log_ids: EventLogIDs) -> Tuple[Counter, Counter]:
+    """
+    Number of times an activity directly follows another one in the cases, and number of length-2 loops (A, B, A),
+    counted as the heuristic concurrency oracle of start_time_estimator counts them.
+    """
+    cases = cases[cases[log_ids.case].notna()]
+    codes = pd.factorize(cases[log_ids.case])[0]
+    order = np.argsort(codes, kind='stable')
+    codes = codes[order]
+    activities = cases[log_ids.activity].to_numpy(dtype=object)[order]
+
+    same_case = codes[1:] == codes[:-1]
+    follows = Counter(zip(activities[:-1][same_case], activities[1:][same_case]))
+
+    in_loop = np.flatnonzero(same_case[:-1] & same_case[1:] & (activities[:-2] == activities[2:]))
+    # NOTE: the oracle skips the loops whose first activity is falsy, e.g., an empty name
+    in_loop = in_loop[np.array([bool(activity) for activity in activities[in_loop]], dtype=bool)]
+    loops = Counter(zip(activities[in_loop], activities[in_loop + 1]))
+    return follows, loops
+
+
+def _heuristic_concurrency(activities: List[str], follows: Counter, loops: Counter,
+                           thresholds: 'ConcurrencyThresholds') -> Dict[str, set]:
+    """
+    Concurrency relations between the activities as HeuristicsConcurrencyOracle establishes them from the
+    directly-follows and length-2 loop counts, see _directly_follows_counts, with the thresholds of the oracle that
+    discovers the parallel activities of a log in memory, see helpers.heuristic_oracle_configuration.
+
+    NOTE: HeuristicsConcurrencyOracle counts the relations of a log it holds in memory and can't be given the counts
+    of the partitions, so the dependency measures are computed here as in its _get_heuristics_matrices, and
+    test_out_of_core checks both give the same parallel activities.
+    """
+
+    def l1l_dependency(activity) -> float:
+        count = follows[(activity, activity)]
+        return count / (count + 1)
+
+    concurrency = {}
+    for a in activities:
+        concurrency[a] = set()
+        for b in activities:
+            ab, ba = follows[(a, b)], follows[(b, a)]
+            if a == b or ab == 0 or ba == 0:
+                continue
+            df_dependency = (ab - ba) / (ab + ba + 1)
+            l2l_dependency = 0
+            if l1l_dependency(a) < thresholds.l1l and l1l_dependency(b) < thresholds.l1l:
+                aba, bab = loops[(a, b)], loops[(b, a)]
+                l2l_dependency = (aba + bab) / (aba + bab + 1)
+            if l2l_dependency < thresholds.l2l and abs(df_dependency) < thresholds.df:
+                concurrency[a].add(b)
+    return concurrency
+
+
+def _add_enabled_times_and_transitions(store: PartitionStore, n_partitions: int, log_ids: EventLogIDs,
+                                       parallel_activities: Dict[str, set]):
+    """
+    Adds the enabled times of the events of every case partition and marks the sources of their transitions. The
+    marked cases are kept for the final join, and their events are partitioned by resource.
+    """
+    with profiling.stage('enabled_times') as metrics:
+        metrics.rows = 0
+        for partition in range(n_partitions):
+            cases = _read_sorted(store, _CASES, partition, log_ids)
+            if cases is None:
+                continue
+            metrics.rows += len(cases)
+            add_enabled_timestamp(cases, log_ids, concurrency=parallel_activities)
+            cases[log_ids.transition_source_index] = \
+                activity_transitions.mark_transition_sources(cases, log_ids, parallel_activities)
+
+            store.write(_MARKED, cases, np.full(len(cases), partition), 0)
+            store.write(_RESOURCES, cases, _partition_numbers(cases[log_ids.resource], n_partitions), partition)
+            store.remove(_CASES, partition)
+
+
+@print_section_boundaries('Batch Analysis', stage='batching')
+def _batches_and_calendar(store: PartitionStore, n_partitions: int, log_ids: EventLogIDs, calendar: Optional[dict],
+                          parallel_run: bool, n_workers: Optional[int]) -> dict:
+    """
+    Discovers the batches of every resource partition and sets the total waiting time of its events. The calendar, if
+    not given, is built from the events of all partitions.
+    """
+    from batch_processing_discovery.discovery import discover_batches
+    from bpdfr_simulation_engine.resource_calendar import CalendarFactory
+
+    calendar_factory = CalendarFactory(GRANULARITY_MINUTES)
+    batch_offset = 0
+    for partition in range(n_partitions):
+        events = _read_sorted(store, _RESOURCES, partition, log_ids)
+        if events is None:
+            continue
+        events = compute_batch_activation_times(discover_batches(events, log_ids), log_ids)
+        # NOTE: batches are numbered by partition, they are numbered again to be unique in the log
+        events[log_ids.batch_id] += batch_offset
+        if events[log_ids.batch_id].notna().any():
+            batch_offset = int(events[log_ids.batch_id].max()) + 1
+        events[log_ids.wt_total] = events[log_ids.start_time] - events[log_ids.enabled_time]
+        if not calendar:
+            calendars.register_events(calendar_factory, events, log_ids=log_ids)
+
+        store.write(_ENRICHED, events, np.full(len(events), partition), 0)
+        store.remove(_RESOURCES, partition)
+
+    if calendar:
+        return calendar
+    with profiling.stage('calendar'):
+        return calendars.build(calendar_factory, parallel_run=parallel_run, n_workers=n_workers)
+
+
+@print_section_boundaries('Out-of-core Activity Transitions Analysis', stage='transitions')
+def _identify_transitions(store: PartitionStore, n_partitions: int, log_ids: EventLogIDs, calendar: dict,
+                          parallel_run: bool, n_workers: Optional[int]) -> Optional[pd.DataFrame]:
+    """
+    Analyzes the waiting time of the destination events of every resource partition, and joins the components with
+    the transitions of every case partition. The transitions are merged in the order of activity_transitions.identify:
+    by case, and by the order of their destinations in the log.
+    """
+    for partition in range(n_partitions):
+        events = store.read(_ENRICHED, partition)
+        if events is None:
+            continue
+        destinations = events.index[events[log_ids.transition_source_index].notna()]
+        components = activity_transitions.analyze_destinations(events, log_ids, calendar, destinations, parallel_run,
+                                                               n_workers)
+        store.write(_COMPONENTS, components,
+                    _partition_numbers(events.loc[components.index, log_ids.case], n_partitions), partition)
+        store.remove(_ENRICHED, partition)
+
+    order_columns = ['_destination_end', '_destination_start', '_destination_activity', '_destination_label']
+    all_transitions = []
+    for partition in range(n_partitions):
+        cases = store.read(_MARKED, partition)
+        components = store.read(_COMPONENTS, partition)
+        if cases is None or components is None:
+            continue
+        transition_sources = cases[log_ids.transition_source_index].dropna().astype(cases.index.dtype)
+        transitions = activity_transitions.join_transitions(cases, log_ids, transition_sources, components)
+        destinations = cases.loc[transition_sources.index]
+        for column, values in zip(order_columns, [destinations[log_ids.end_time], destinations[log_ids.start_time],
+                                                  destinations[log_ids.activity], destinations.index]):
+            transitions[column] = np.asarray(values)
+        all_transitions.append(transitions)
+        store.remove(_MARKED, partition)
+        store.remove(_COMPONENTS, partition)
+
+    if not all_transitions:
+        return None
+    transitions = pd.concat(all_transitions, ignore_index=True) \
+        .sort_values(by=['case_id'] + order_columns, kind='stable') \
+        .drop(columns=order_columns) \
+        .reset_index(drop=True)
+    return activity_transitions.process_all_items(transitions)
@@ -0,0 +1,139 @@
+import cProfile
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, asdict, field
+from pathlib import Path
+from typing import Optional, List, Iterable, Iterator, Dict
+
+import click
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+
+@dataclass
+class StageMetrics:
+    """Performance data of a stage of a run."""
+
+    name: str
+    wall_time: float = 0.0  # seconds
+    cpu_time: float = 0.0  # seconds, including the worker processes that finished during the stage
+    peak_rss_bytes: Optional[int] = None  # peak resident set size of the process or its workers so far
+    rows: Optional[int] = None  # number of events or transitions processed by the stage, if known
+    counters: Dict[str, int] = field(default_factory=dict)  # e.g., cache hits and misses, see add_counters
+
+
+class Profiler:
+    """
+    Collects the metrics of the stages run while it's active, see stage. The stages listed in cprofile_stages are
+    also run under cProfile, and their stats are dumped to profile_dir as <stage>.prof files.
+    """
+
+    stages: List[StageMetrics]
+
+    def __init__(self, cprofile_stages: Optional[Iterable[str]] = None, profile_dir: Optional[Path] = None):
+        self.stages = []
+        self.cprofile_stages = set(cprofile_stages or [])
+        self.profile_dir = Path(profile_dir) if profile_dir is not None else Path('.')
+
+    @contextmanager
+    def activate(self) -> Iterator['Profiler']:
+        global _active_profiler
+        previous, _active_profiler = _active_profiler, self
+        try:
+            yield self
+        finally:
+            _active_profiler = previous
+
+    def to_dict(self) -> dict:
+        # NOTE: counters are left out of the stages without them
+        return {'stages': [{key: value for key, value in asdict(metrics).items() if key != 'counters' or value}
+                           for metrics in self.stages]}
+
+    def to_json(self, filepath: Path):
+        with Path(filepath).open('w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+
+_active_profiler: Optional[Profiler] = None
+_cprofile_running = False
+_open_stages: List[StageMetrics] = []  # stages of the active profiler being measured, the innermost last
+
+
+@contextmanager
+def stage(name: str, rows: Optional[int] = None, title: Optional[str] = None) -> Iterator[StageMetrics]:
+    """
+    Measures the wall time, CPU time and peak memory of the block and records them as a stage of the active profiler,
+    if any. When a title is given, it's printed with the elapsed time around the block. The yielded metrics can be
+    updated, e.g., with the number of rows once they are known.
+    """
+    global _cprofile_running
+
+    metrics = StageMetrics(name=name, rows=rows)
+    profiler = _active_profiler
+    if profiler is not None:
+        profiler.stages.append(metrics)
+        _open_stages.append(metrics)
+
+    if title is not None:
+        click.echo('\n' + '-' * 80)
+        click.echo(title)
+        click.echo('-' * 80)
+
+    # NOTE: only one cProfile profiler can be enabled at a time, nested stages are covered by the outer one
+    cprofile = None
+    if profiler is not None and name in profiler.cprofile_stages and not _cprofile_running:
+        cprofile = cProfile.Profile()
+        _cprofile_running = True
+        cprofile.enable()
+
+    start_wall, start_cpu = time.perf_counter(), _cpu_time()
+    try:
+        yield metrics
+    finally:
+        if profiler is not None:
+            _open_stages.remove(metrics)
+        metrics.wall_time = time.perf_counter() - start_wall
+        metrics.cpu_time = _cpu_time() - start_cpu
+        metrics.peak_rss_bytes = _peak_rss_bytes()
+
+        if cprofile is not None:
+            cprofile.disable()
+            _cprofile_running = False
+            profiler.profile_dir.mkdir(parents=True, exist_ok=True)
+            cprofile.dump_stats(profiler.profile_dir / f'{name}.prof')
+
+        if title is not None:
+            click.echo(f'Elapsed time: {metrics.wall_time} seconds')
+            click.echo('-' * 80)
+
+
+def add_counters(counters: Dict[str, int]):
+    """
+    Adds the counters to the innermost stage being measured by the active profiler, if any. Worker processes have no
+    active profiler, so the counters of their work are added by the main process, once it gets them back.
+    """
+    if not _open_stages or _active_profiler is None:
+        return
+    metrics = _open_stages[-1]
+    for name, value in counters.items():
+        metrics.counters[name] = metrics.counters.get(name, 0) + value
+
+
+def _cpu_time() -> float:
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+
+def _peak_rss_bytes() -> Optional[int]:
+    if resource is None:
+        return None
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    # NOTE: ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
@@ -0,0 +1,141 @@
+import heapq
+import math
+import os
+from pathlib import Path, PurePosixPath
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+CGROUP_ROOT = Path('/sys/fs/cgroup')
+PROC_SELF_CGROUP = Path('/proc/self/cgroup')
+
+CHUNKS_PER_WORKER = 4  # more chunks than workers, so that workers that finish early pick up the remaining ones
+
+MIN_SPLIT_CASE_EVENTS = 1000  # cases with fewer events are never split, see split_large_cases
+
+
+def available_cpu_count(cgroup_root: Path = CGROUP_ROOT, proc_cgroup: Path = PROC_SELF_CGROUP) -> int:
+    """
+    Number of cores the process can actually use: the cores it's allowed to run on, limited by the CPU quota of its
+    cgroup, e.g., the CPU limit of a container, which os.cpu_count() and multiprocessing.cpu_count() ignore. The cgroup
+    of the process is read from proc_cgroup, and the lowest quota of that cgroup and its ancestors applies.
+    """
+    if hasattr(os, 'sched_getaffinity'):
+        count = len(os.sched_getaffinity(0))
+    else:
+        count = os.cpu_count() or 1
+
+    quota = _cgroup_cpu_quota(cgroup_root, proc_cgroup)
+    if quota is not None:
+        count = min(count, max(math.ceil(quota), 1))
+
+    return max(count, 1)
+
+
+def default_workers(cgroup_root: Path = CGROUP_ROOT, proc_cgroup: Path = PROC_SELF_CGROUP) -> int:
+    """Number of worker processes of a parallel run: one core is left for the main process, if there are several."""
+    return max(available_cpu_count(cgroup_root, proc_cgroup) - 1, 1)
+
+
+def resolve_workers(n_workers: Optional[int]) -> int:
+    if n_workers is None:
+        return default_workers()
+    if n_workers < 1:
+        raise ValueError(f'The number of workers must be positive, got {n_workers}')
+    return n_workers
+
+
+def balanced_chunks(sizes: Sequence[int], n_chunks: int) -> List[List[int]]:
+    """
+    Splits the items into at most n_chunks chunks of similar total size, using the longest processing time first rule:
+    items are taken from the largest to the smallest and added to the chunk with the smallest total so far. Returns
+    the positions of the items in every chunk, largest chunks first, so that they are the first to be submitted.
+    """
+    n_chunks = max(min(n_chunks, len(sizes)), 1) if len(sizes) > 0 else 0
+    chunks = [[] for _ in range(n_chunks)]
+    totals = [(0, i) for i in range(n_chunks)]  # heap of (total size, chunk)
+    for position in sorted(range(len(sizes)), key=lambda i: sizes[i], reverse=True):
+        total, chunk = heapq.heappop(totals)
+        chunks[chunk].append(position)
+        heapq.heappush(totals, (total + sizes[position], chunk))
+
+    chunk_totals = [sum(sizes[position] for position in chunk) for chunk in chunks]
+    return [chunk for _, chunk in sorted(zip(chunk_totals, chunks), key=lambda item: -item[0]) if chunk]
+
+
+def split_large_cases(case_sizes: Sequence[int], n_workers: int) -> Dict[int, int]:
+    """
+    Cases of a parallel run that should be split into parts analyzed by different workers, as a dictionary from the
+    position of the case to the number of parts. A case is split when it has more events than the share of a chunk,
+    i.e., when it would keep a worker busy for longer than the others, and at least MIN_SPLIT_CASE_EVENTS events.
+    """
+    if n_workers < 2 or len(case_sizes) == 0:
+        return {}
+    n_chunks = n_workers * CHUNKS_PER_WORKER
+    part_size = max(MIN_SPLIT_CASE_EVENTS, math.ceil(sum(case_sizes) / n_chunks))
+    return {position: min(math.ceil(size / part_size), n_chunks)
+            for position, size in enumerate(case_sizes) if size > part_size}
+
+
+def _cgroup_cpu_quota(cgroup_root: Path, proc_cgroup: Path) -> Optional[float]:
+    """
+    CPU quota of the cgroup of the process in cores, None if there is no limit or it can't be read. In a nested
+    hierarchy, e.g., a systemd slice or a container without its own cgroup namespace, the quota of the cgroup or of any
+    of its ancestors can be the one that limits the process, so the lowest one is taken.
+    """
+    v2_path, v1_path = _own_cgroup_paths(proc_cgroup)
+
+    # cgroup v2: "<quota> <period>", or "max <period>" without a limit
+    v2_files = [directory / 'cpu.max' for directory in _cgroup_ancestors(cgroup_root, v2_path)]
+    v2_files = [path for path in v2_files if path.exists()]
+    if v2_files:
+        return _lowest_quota(_read_cpu_max(path) for path in v2_files)
+
+    # cgroup v1: the quota is -1 without a limit
+    return _lowest_quota(_read_cfs_quota(directory)
+                         for directory in _cgroup_ancestors(cgroup_root / 'cpu', v1_path))
+
+
+def _own_cgroup_paths(proc_cgroup: Path) -> Tuple[str, str]:
+    """
+    Paths of the cgroup of the process in the v2 hierarchy and in the v1 cpu hierarchy, from lines like "0::<path>"
+    and "<id>:cpu,cpuacct:<path>". The root is assumed if they can't be read.
+    """
+    v2_path, v1_path = '/', '/'
+    try:
+        for line in proc_cgroup.read_text().splitlines():
+            hierarchy_id, controllers, path = line.split(':', 2)
+            if hierarchy_id == '0' and controllers == '':
+                v2_path = path
+            elif 'cpu' in controllers.split(','):
+                v1_path = path
+    except (OSError, ValueError):
+        pass
+    return v2_path, v1_path
+
+
+def _cgroup_ancestors(cgroup_root: Path, path: str) -> Iterator[Path]:
+    """Directories of the cgroup at the path and of its ancestors, up to the root of the hierarchy."""
+    parts = [part for part in PurePosixPath(path).parts if part not in ('/', '.', '..')]
+    for depth in range(len(parts), -1, -1):
+        yield cgroup_root.joinpath(*parts[:depth])
+
+
+def _read_cpu_max(path: Path) -> Optional[float]:
+    try:
+        quota, period = path.read_text().split()[:2]
+        return None if quota == 'max' else int(quota) / int(period)
+    except (OSError, ValueError):
+        return None
+
+
+def _read_cfs_quota(directory: Path) -> Optional[float]:
+    try:
+        quota = int((directory / 'cpu.cfs_quota_us').read_text())
+        period = int((directory / 'cpu.cfs_period_us').read_text())
+        return None if quota <= 0 or period <= 0 else quota / period
+    except (OSError, ValueError):
+        return None
+
+
+def _lowest_quota(quotas: Iterator[Optional[float]]) -> Optional[float]:
+    quotas = [quota for quota in quotas if quota is not None]
+    return min(quotas) if quotas else None
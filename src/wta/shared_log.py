@@ -0,0 +1,119 @@
+from dataclasses import dataclass
+from multiprocessing import shared_memory
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+
+
+@dataclass
+class SharedColumn:
+    """Description of a log column stored in a shared memory block."""
+
+    name: Optional[str]  # name of the column in the log, None for the index
+    block_name: str  # name of the shared memory block with the column values
+    dtype: str  # NumPy dtype of the values stored in the block
+    length: int  # number of values in the block
+    tz: Optional[str] = None  # timezone of timestamp columns, values are stored in UTC
+    categories: Optional[pd.Index] = None  # unique values of categorical and object columns, stored as codes
+
+
+class SharedLog:
+    """
+    Event log which columns are published once into shared memory blocks. The instance only keeps the names of the
+    blocks and the dictionaries of object columns, so it is cheap to pickle and can be sent to worker processes, which
+    attach to the blocks by name instead of receiving a pickled copy of the whole log.
+
+    Numeric, boolean, datetime and timedelta columns are stored as they are. Other columns, e.g., case IDs, activities
+    and resources, are stored as the integer codes of a pd.Categorical. Attaching doesn't copy the values of any column:
+    numeric and timestamp columns, in their timezone, are views of the blocks, and categorical columns are made of the
+    codes in the blocks and of their categories. Only the categories and the descriptions of the columns are copied into
+    every process. Object columns are attached as categoricals, see helpers.decode_categorical for their values.
+    """
+
+    columns: List[SharedColumn]
+    index: SharedColumn
+
+    def __init__(self, columns: List[SharedColumn], index: SharedColumn):
+        self.columns = columns
+        self.index = index
+        self._blocks: List[shared_memory.SharedMemory] = []
+
+    def __getstate__(self):
+        # NOTE: blocks are process-local handles, other processes attach to them by name
+        return {'columns': self.columns, 'index': self.index}
+
+    def __setstate__(self, state):
+        self.columns = state['columns']
+        self.index = state['index']
+        self._blocks = []
+
+    @staticmethod
+    def publish(log: pd.DataFrame) -> 'SharedLog':
+        """Copies the columns of the log into new shared memory blocks. The caller is responsible for unlinking them."""
+        shared_log = SharedLog([], None)
+        try:
+            shared_log.index = shared_log._share(None, pd.Series(log.index))
+            shared_log.columns = [shared_log._share(name, log[name]) for name in log.columns]
+        except BaseException:
+            shared_log.close()
+            shared_log.unlink()
+            raise
+        return shared_log
+
+    def attach(self) -> pd.DataFrame:
+        """Attaches to the shared memory blocks and returns the log backed by them."""
+        index = pd.Index(self._read(self.index), copy=False)
+        # NOTE: without copy=False, the columns would be copied into the blocks of the DataFrame
+        log = pd.DataFrame({column.name: self._read(column) for column in self.columns}, copy=False)
+        log.index = index
+        return log
+
+    def close(self):
+        """Closes the blocks opened by this process, the log returned by attach() must not be used afterwards."""
+        for block in self._blocks:
+            block.close()
+
+    def unlink(self):
+        """Releases the shared memory blocks. It must be called once, by the process that published the log."""
+        unlinked = set()
+        for block in self._blocks:
+            if block.name in unlinked:
+                continue
+            block.unlink()
+            unlinked.add(block.name)
+        self._blocks = []
+
+    def _share(self, name: Optional[str], series: pd.Series) -> SharedColumn:
+        tz = None
+        categories = None
+
+        if isinstance(series.dtype, pd.DatetimeTZDtype):
+            tz = str(series.dt.tz)
+            values = series.dt.tz_convert('UTC').dt.tz_localize(None).to_numpy()
+        elif isinstance(series.dtype, np.dtype) and series.dtype.kind in 'biufcmM':
+            values = series.to_numpy()
+        else:
+            # NOTE: codes are stored with the dtype pd.Categorical chooses for them, so that attaching doesn't cast them
+            categorical = series.array if isinstance(series.dtype, pd.CategoricalDtype) else pd.Categorical(series)
+            values = categorical.codes
+            categories = categorical.categories
+
+        block = shared_memory.SharedMemory(create=True, size=max(values.nbytes, 1))
+        self._blocks.append(block)
+        np.ndarray(values.shape, dtype=values.dtype, buffer=block.buf)[:] = values
+
+        return SharedColumn(name=name, block_name=block.name, dtype=values.dtype.str, length=len(values), tz=tz,
+                            categories=categories)
+
+    def _read(self, column: SharedColumn) -> pd.Series:
+        block = shared_memory.SharedMemory(name=column.block_name)
+        self._blocks.append(block)
+        values = np.ndarray((column.length,), dtype=np.dtype(column.dtype), buffer=block.buf)
+
+        if column.tz is not None:
+            # NOTE: timestamps are stored in UTC, as DatetimeArray keeps them whatever the timezone
+            values = pd.arrays.DatetimeArray(values, dtype=pd.DatetimeTZDtype(tz=column.tz), copy=False)
+        elif column.categories is not None:
+            values = pd.Categorical.from_codes(values, dtype=pd.CategoricalDtype(column.categories))
+        return pd.Series(values, name=column.name, copy=False)
@@ -1,7 +1,10 @@
+import gzip
+import itertools
 import json
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import List, Dict, Any, IO, Iterable, Iterator
 
+import numpy as np
 import pandas as pd
 
 from wta import EventLogIDs, get_total_processing_time, CTEImpactAnalysis, calculate_cte_impact
@@ -108,22 +111,22 @@ class TransitionsReport:
         pt_total_column = 'pt_total'
         cte_impact_column = 'cte_impact'
 
-        per_case_wt = pd.DataFrame(columns=[case_column, wt_total_column, pt_total_column, cte_impact_column])
+        # NOTE: we deliberately don't use log_ids for keys below, because the downstream backend service parses
+        # the JSON and expects the keys to be well known before. log_ids is used for only accessing data in the log.
 
-        for (case_id, case_log) in log.groupby(by=log_ids.case):
-            case_pt = (case_log[log_ids.end_time] - case_log[log_ids.start_time]).sum()
-            case_wt = case_log[log_ids.wt_total].sum()
-            case_cte = case_pt / (case_pt + case_wt)
+        # NOTE: durations are summed as timedeltas and converted to seconds after, as the loop over cases used to do
+        per_case = pd.DataFrame({
+            pt_total_column: log[log_ids.end_time] - log[log_ids.start_time],
+            wt_total_column: log[log_ids.wt_total],
+        }).groupby(log[log_ids.case], sort=True).sum().apply(lambda column: column.dt.total_seconds())
 
-            # NOTE: we deliberately don't use log_ids for keys below, because the downstream backend service parses
-            # the JSON and expects the keys to be well known before. log_ids is used for only accessing data in the log.
-
-            per_case_wt = pd.concat([per_case_wt, pd.DataFrame({
-                case_column: [case_id],
-                wt_total_column: [case_wt.total_seconds()],
-                pt_total_column: [case_pt.total_seconds()],
-                cte_impact_column: [case_cte]
-            })], ignore_index=True)
+        per_case_wt = pd.DataFrame({
+            case_column: per_case.index,
+            wt_total_column: per_case[wt_total_column].to_numpy(),
+            pt_total_column: per_case[pt_total_column].to_numpy(),
+            cte_impact_column: (per_case[pt_total_column] / (per_case[pt_total_column] + per_case[wt_total_column]))
+            .to_numpy(),
+        })
 
         # Converting case_id to string to avoid JSON serialization error
         per_case_wt[case_column] = per_case_wt[case_column].astype(str)
@@ -131,76 +134,136 @@ class TransitionsReport:
         self.per_case_wt = per_case_wt
 
     def __regroup_report(self, log_ids) -> List[Dict[str, Any]]:
-        new_report = []
-
         # NOTE: all times should be in seconds, not pd.Timedelta objects
-        for (activities, report) in self.transitions_report.groupby(by=['source_activity', 'target_activity']):
-            wt_by_resource = []
-
-            for (resources, resources_report) in report.groupby(by=['source_resource', 'target_resource']):
-                cte_impact_total = \
-                    self.total_pt / (self.total_pt + self.total_wt - resources_report[log_ids.wt_total].sum())
-                cte_impact = calculate_cte_impact(resources_report, self.total_pt, self.total_wt, log_ids=log_ids)
-
-                case_freq = len(resources_report['cases'].apply(lambda x: x.split(',')).explode().unique()) / self.num_cases
-
-                wt_by_resource.append({
-                    'source_resource': resources[0],
-                    'target_resource': resources[1],
-                    'case_freq': case_freq,
-                    'total_freq': resources_report['frequency'].sum(),
-                    'total_wt': resources_report[log_ids.wt_total].sum(),
-                    'batching_wt': resources_report[log_ids.wt_batching].sum(),
-                    'prioritization_wt': resources_report[log_ids.wt_prioritization].sum(),
-                    'contention_wt': resources_report[log_ids.wt_contention].sum(),
-                    'unavailability_wt': resources_report[log_ids.wt_unavailability].sum(),
-                    'extraneous_wt': resources_report[log_ids.wt_extraneous].sum(),
-                    'cte_impact_total': cte_impact_total,
-                    'cte_impact': cte_impact.to_dict(),
-                })
-
-            cte_impact_total = \
-                self.total_pt / (self.total_pt + self.total_wt - report[log_ids.wt_total].sum())
-            cte_impact = calculate_cte_impact(report, self.total_pt, self.total_wt, log_ids=log_ids)
-
-            case_freq = len(report['cases'].apply(lambda x: x.split(',')).explode().unique()) / self.num_cases
-
-            new_report.append({
-                'source_activity': activities[0],
-                'target_activity': activities[1],
-                'case_freq': case_freq,
-                'total_freq': report['frequency'].sum(),
-                'total_wt': report[log_ids.wt_total].sum(),
-                'batching_wt': report[log_ids.wt_batching].sum(),
-                'prioritization_wt': report[log_ids.wt_prioritization].sum(),
-                'contention_wt': report[log_ids.wt_contention].sum(),
-                'unavailability_wt': report[log_ids.wt_unavailability].sum(),
-                'extraneous_wt': report[log_ids.wt_extraneous].sum(),
-                'cte_impact_total': cte_impact_total,
-                'cte_impact': cte_impact.to_dict(),
-                'wt_by_resource': wt_by_resource,
+        activity_keys = ['source_activity', 'target_activity']
+        resource_keys = activity_keys + ['source_resource', 'target_resource']
+
+        by_activities = self.__aggregate(activity_keys, log_ids)
+        by_resources = self.__aggregate(resource_keys, log_ids)
+
+        new_report = [{
+            'source_activity': activities[0],
+            'target_activity': activities[1],
+            **stats,
+            'wt_by_resource': [],
+        } for activities, stats in zip(by_activities.index, self.__group_stats(by_activities))]
+
+        # NOTE: both aggregations are sorted by their keys, so resource pairs are appended in the order of groupby
+        owners = by_activities.index.get_indexer(by_resources.index.droplevel(['source_resource', 'target_resource']))
+        for owner, resources, stats in zip(owners, by_resources.index, self.__group_stats(by_resources)):
+            new_report[owner]['wt_by_resource'].append({
+                'source_resource': resources[2],
+                'target_resource': resources[3],
+                **stats,
             })
 
         return new_report
 
-    def to_json(self, filepath: Path):
-        with filepath.open('w') as f:
-            data = {
-                'num_cases': self.num_cases,
-                'num_activities': self.num_activities,
-                'num_activity_instances': self.num_activity_instances,
-                'num_transitions': self.num_transitions,
-                'num_transition_instances': self.num_transition_instances,
-                'total_pt': self.total_pt,
-                'total_wt': self.total_wt,
-                'total_batching_wt': self.total_batching_wt,
-                'total_prioritization_wt': self.total_prioritization_wt,
-                'total_contention_wt': self.total_contention_wt,
-                'total_unavailability_wt': self.total_unavailability_wt,
-                'total_extraneous_wt': self.total_extraneous_wt,
-                'process_cte': self.process_cte,
-                'cte_impact': self.cte_impact.to_dict(),
-                'report': self.report,
-                'per_case_wt': self.per_case_wt.to_dict(orient='records'),
-            }
-            f.write(json.dumps(data))
+    def __aggregate(self, keys: List[str], log_ids: EventLogIDs) -> pd.DataFrame:
+        """
+        Sums frequencies and waiting times of the transitions grouped by the keys, counts the distinct cases of every
+        group, and computes the CTE impacts of all groups at once.
+        """
+        report = self.transitions_report
+        wt_columns = [log_ids.wt_total, log_ids.wt_batching, log_ids.wt_prioritization, log_ids.wt_contention,
+                      log_ids.wt_unavailability, log_ids.wt_extraneous]
+
+        grouped = report.groupby(by=keys, sort=True)
+        aggregated = grouped[['frequency'] + wt_columns].sum()
+        aggregated.columns = ['total_freq', 'total_wt', 'batching_wt', 'prioritization_wt', 'contention_wt',
+                              'unavailability_wt', 'extraneous_wt']
+
+        # distinct cases per group, from the (group, case) pairs of integer codes instead of sets of strings
+        group_codes = grouped.ngroup().to_numpy()
+        row_cases = report['cases'].str.split(',')
+        case_codes, case_ids = pd.factorize(np.fromiter(itertools.chain.from_iterable(row_cases), dtype=object,
+                                                        count=int(row_cases.str.len().sum())))
+        pair_groups = np.repeat(group_codes, row_cases.str.len().to_numpy())
+        grouped_pairs = pair_groups >= 0  # rows with missing keys aren't part of any group
+        pairs = np.unique(pair_groups[grouped_pairs].astype(np.int64) * max(len(case_ids), 1)
+                          + case_codes[grouped_pairs])
+        distinct_cases = np.bincount(pairs // max(len(case_ids), 1), minlength=len(aggregated))
+        aggregated['case_freq'] = distinct_cases / self.num_cases
+
+        # CTE impact of removing the waiting time of the group, total and by cause
+        total_time = self.total_pt + self.total_wt
+        aggregated['cte_impact_total'] = self.total_pt / (total_time - aggregated['total_wt'])
+        for impact, column in [('batching_impact', 'batching_wt'), ('contention_impact', 'contention_wt'),
+                               ('prioritization_impact', 'prioritization_wt'),
+                               ('unavailability_impact', 'unavailability_wt'),
+                               ('extraneous_impact', 'extraneous_wt')]:
+            aggregated[impact] = self.total_pt / (total_time - aggregated[column])
+
+        return aggregated
+
+    @staticmethod
+    def __group_stats(aggregated: pd.DataFrame) -> List[Dict[str, Any]]:
+        """Entries of the regrouped report for the aggregated groups, in the order of aggregated."""
+        impacts = aggregated[['batching_impact', 'contention_impact', 'prioritization_impact', 'unavailability_impact',
+                              'extraneous_impact']].to_dict(orient='records')
+        stats = aggregated[['case_freq', 'total_freq', 'total_wt', 'batching_wt', 'prioritization_wt', 'contention_wt',
+                            'unavailability_wt', 'extraneous_wt', 'cte_impact_total']].to_dict(orient='records')
+        for group_stats, cte_impact in zip(stats, impacts):
+            group_stats['cte_impact'] = cte_impact
+        return stats
+
+    def to_json(self, filepath: Path, compress: bool = False):
+        """
+        Writes the report to a JSON file, gzip-compressed if compress is set. The report entries and per-case records
+        are serialized and written one by one, so the whole document is never held in memory.
+        """
+        header = {
+            'num_cases': self.num_cases,
+            'num_activities': self.num_activities,
+            'num_activity_instances': self.num_activity_instances,
+            'num_transitions': self.num_transitions,
+            'num_transition_instances': self.num_transition_instances,
+            'total_pt': self.total_pt,
+            'total_wt': self.total_wt,
+            'total_batching_wt': self.total_batching_wt,
+            'total_prioritization_wt': self.total_prioritization_wt,
+            'total_contention_wt': self.total_contention_wt,
+            'total_unavailability_wt': self.total_unavailability_wt,
+            'total_extraneous_wt': self.total_extraneous_wt,
+            'process_cte': self.process_cte,
+            'cte_impact': self.cte_impact.to_dict(),
+        }
+
+        with (gzip.open(filepath, 'wt') if compress else filepath.open('w')) as f:
+            f.write('{')
+            for key, value in header.items():
+                f.write(f'{_dumps(key)}: {_dumps(value)}, ')
+            f.write('"report": ')
+            _write_json_array(f, self.report)
+            f.write(', "per_case_wt": ')
+            _write_json_array(f, _records(self.per_case_wt))
+            f.write('}')
+
+
+_RECORDS_CHUNK_SIZE = 10_000
+
+
+def _dumps(value: Any) -> str:
+    return json.dumps(value, default=_json_default)
+
+
+def _json_default(o: Any) -> Any:
+    # NOTE: numpy scalars, e.g., sums of int64 columns, aren't serializable by json on their own
+    if isinstance(o, np.generic):
+        return o.item()
+    raise TypeError(f'Object of type {type(o).__name__} is not JSON serializable')
+
+
+def _write_json_array(f: IO[str], items: Iterable[Any]):
+    f.write('[')
+    for i, item in enumerate(items):
+        if i > 0:
+            f.write(', ')
+        f.write(_dumps(item))
+    f.write(']')
+
+
+def _records(df: pd.DataFrame) -> Iterator[Dict[str, Any]]:
+    """Rows of the DataFrame as dictionaries of Python values, converted a chunk of rows at a time."""
+    for chunk_start in range(0, len(df), _RECORDS_CHUNK_SIZE):
+        yield from df.iloc[chunk_start:chunk_start + _RECORDS_CHUNK_SIZE].to_dict(orient='records')
@@ -1,19 +1,37 @@
 from collections import namedtuple
-from typing import Optional, List, Tuple
+from typing import Dict, Optional, List, Tuple
 
 import pandas as pd
 
 from wta import log_ids_non_nil, EventLogIDs
+from wta.calendars.calendars import WeeklyCalendar
 from wta.calendars.intervals import Interval
+from wta.waiting_time.interval_set import IntervalSet
 from wta.waiting_time.prioritization_and_contention import detect_contention_and_prioritization_intervals
+from wta.waiting_time.resource_index import ResourceEventIndex
 from wta.waiting_time.resource_unavailability import detect_unavailability_intervals
+from wta.waiting_time.window_cache import WaitingWindowCache, window_key
 
 
 def run(case: pd.DataFrame,
         log_calendar: dict,
         log: Optional[pd.DataFrame] = None,
-        log_ids: Optional[EventLogIDs] = None) -> pd.DataFrame:
-    """Runs the waiting time analysis on transitions of the given case."""
+        log_ids: Optional[EventLogIDs] = None,
+        resource_index: Optional[ResourceEventIndex] = None,
+        weekly_calendars: Optional[Dict[str, WeeklyCalendar]] = None,
+        destinations: Optional[pd.Index] = None,
+        window_cache: Optional[WaitingWindowCache] = None) -> pd.DataFrame:
+    """
+    Runs the waiting time analysis on transitions of the given case.
+
+    If destinations is given, only the transitions to those events of the case are analyzed, so that the transitions
+    of a long case can be analyzed in parts. The transitions are reported in the same order either way.
+
+    The resource index, if given, must be built from the log and is used by the detectors to look up the events
+    processed by the same resource, instead of filtering the whole log for every transition. The weekly calendars, if
+    given, must be compiled from log_calendar and are used to find the off-duty time of the resources. The window
+    cache, if given, must be used with the same log and calendar only, see WaitingWindowCache.
+    """
 
     log_ids = log_ids_non_nil(log_ids)
 
@@ -23,6 +41,8 @@ def run(case: pd.DataFrame,
     transitions = pd.DataFrame(columns=columns)
 
     transitions_index = case[~case[log_ids.transition_source_index].isna()].index
+    if destinations is not None:
+        transitions_index = transitions_index[transitions_index.isin(destinations)]
 
     # setting NaT to zero duration
     if log_ids.wt_contention in case.columns:
@@ -35,34 +55,10 @@ def run(case: pd.DataFrame,
         source = case.loc[source_index]
 
         # NOTE: for WT analysis we take only the destination activity, the source activity is not relevant
-
         wt_total = destination[log_ids.wt_total]
-        if wt_total > pd.Timedelta(0):
-            # Perform analysis
-            wt_batching_interval = __wt_batching_interval(destination, log_ids)
-            wt_contention_intervals, wt_prioritization_intervals = \
-                __wt_contention_and_prioritization_intervals(destination_index, log, log_ids)
-            wt_unavailability_intervals = __wt_unavailability_intervals(destination_index, log, log_calendar, log_ids)
-
-            wt_analysis = __wt_durations_from_wt_intervals(
-                wt_batching_interval,
-                wt_contention_intervals,
-                wt_prioritization_intervals,
-                wt_unavailability_intervals, wt_total)
-
-            wt_batching = wt_analysis.batching
-            wt_contention = wt_analysis.contention
-            wt_prioritization = wt_analysis.prioritization
-            wt_unavailability = wt_analysis.unavailability
-            wt_extraneous = wt_analysis.extraneous
-        else:
-            # There is no WT, so don't run analysis
-            wt_batching = pd.Timedelta(0)
-            wt_contention = pd.Timedelta(0)
-            wt_prioritization = pd.Timedelta(0)
-            wt_unavailability = pd.Timedelta(0)
-            wt_extraneous = pd.Timedelta(0)
-
+        wt_batching, wt_contention, wt_prioritization, wt_unavailability, wt_extraneous = \
+            analyze_destination(destination, destination_index, log, log_calendar, log_ids, resource_index,
+                                weekly_calendars, window_cache)
 
         # appending the handoff data
         transition = pd.DataFrame({
@@ -87,10 +83,79 @@ def run(case: pd.DataFrame,
     return transitions
 
 
-def __wt_unavailability_intervals(destination_index, log, log_calendar, log_ids) -> List[Interval]:
+def run_destinations(destinations: pd.Index,
+                     log: pd.DataFrame,
+                     log_calendar: dict,
+                     log_ids: Optional[EventLogIDs] = None,
+                     resource_index: Optional[ResourceEventIndex] = None,
+                     weekly_calendars: Optional[Dict[str, WeeklyCalendar]] = None,
+                     window_cache: Optional[WaitingWindowCache] = None) -> pd.DataFrame:
+    """
+    Runs the waiting time analysis on the given destination events of the log, without the sources of their
+    transitions. Returns the waiting time components of every destination, indexed by its label in the log.
+
+    The log can be the slice of a single resource, since the analysis of an event only looks at the events of its
+    resource, and so can be the calendar. The resource index, if given, must be built from that slice.
+    """
+
+    log_ids = log_ids_non_nil(log_ids)
+    columns = [log_ids.wt_total, log_ids.wt_batching, log_ids.wt_prioritization, log_ids.wt_contention,
+               log_ids.wt_unavailability, log_ids.wt_extraneous]
+
+    rows = []
+    for loc in destinations:
+        destination = log.loc[loc]
+        wt_analysis = analyze_destination(destination, pd.Index([loc]), log, log_calendar, log_ids, resource_index,
+                                          weekly_calendars, window_cache)
+        rows.append((destination[log_ids.wt_total], wt_analysis.batching, wt_analysis.prioritization,
+                     wt_analysis.contention, wt_analysis.unavailability, wt_analysis.extraneous))
+
+    return pd.DataFrame(rows, index=destinations, columns=columns)
+
+
+def analyze_destination(destination: pd.Series,
+                        destination_index: pd.Index,
+                        log: pd.DataFrame,
+                        log_calendar: dict,
+                        log_ids: EventLogIDs,
+                        resource_index: Optional[ResourceEventIndex] = None,
+                        weekly_calendars: Optional[Dict[str, WeeklyCalendar]] = None,
+                        window_cache: Optional[WaitingWindowCache] = None) -> 'WaitingTimeDurations':
+    """
+    Splits the waiting time of the destination event into its components. The intervals found by the detectors are
+    looked up in the window cache, if given, and computed only for waiting windows not analyzed before.
+    """
+
+    wt_total = destination[log_ids.wt_total]
+    if not wt_total > pd.Timedelta(0):
+        # There is no WT, so don't run analysis
+        return WaitingTimeDurations(pd.Timedelta(0), pd.Timedelta(0), pd.Timedelta(0), pd.Timedelta(0),
+                                    pd.Timedelta(0))
+
+    wt_batching_interval = __wt_batching_interval(destination, log_ids)
+    if window_cache is None:
+        window_cache = WaitingWindowCache(maxsize=0)
+    window = window_key(destination, log_ids.resource, log_ids.enabled_time, log_ids.start_time)
+    wt_contention_intervals, wt_prioritization_intervals = window_cache.get(
+        ('contention',) + window + window_key(destination, log_ids.batch_id, log_ids.batch_instance_enabled),
+        lambda: __wt_contention_and_prioritization_intervals(destination_index, log, log_ids, resource_index))
+    wt_unavailability_intervals = window_cache.get(
+        ('unavailability',) + window,
+        lambda: __wt_unavailability_intervals(destination_index, log, log_calendar, log_ids, weekly_calendars))
+
+    return __wt_durations_from_wt_intervals(
+        wt_batching_interval,
+        wt_contention_intervals,
+        wt_prioritization_intervals,
+        wt_unavailability_intervals, wt_total)
+
+
+def __wt_unavailability_intervals(destination_index, log, log_calendar, log_ids,
+                                  weekly_calendars=None) -> List[Interval]:
     """Discovers waiting time due to unavailability of resources."""
 
-    wt_unavailability_intervals = detect_unavailability_intervals(destination_index, log, log_calendar, log_ids=log_ids)
+    wt_unavailability_intervals = detect_unavailability_intervals(destination_index, log, log_calendar, log_ids=log_ids,
+                                                                  weekly_calendars=weekly_calendars)
 
     intervals = list(filter(lambda interval: interval.length > pd.Timedelta(0), wt_unavailability_intervals))
     return None if len(intervals) == 0 else intervals
@@ -99,12 +164,14 @@ def __wt_unavailability_intervals(destination_index, log, log_calendar, log_ids)
 def __wt_contention_and_prioritization_intervals(
         destination_index: pd.Index,  # handoff pair has source and destination activities
         log: pd.DataFrame,
-        log_ids: EventLogIDs) -> Tuple[Tuple[List, List], Tuple[List, List]]:
+        log_ids: EventLogIDs,
+        resource_index: Optional[ResourceEventIndex] = None) -> Tuple[Tuple[List, List], Tuple[List, List]]:
     """Discovers waiting time due to resource contention and prioritization waiting times."""
 
     # NOTE: WT of the destination activity is relevant only
     wt_contention_intervals, wt_prioritization_intervals = \
-        detect_contention_and_prioritization_intervals(destination_index, log, log_ids=log_ids)
+        detect_contention_and_prioritization_intervals(destination_index, log, log_ids=log_ids,
+                                                       resource_index=resource_index)
 
     return wt_contention_intervals, wt_prioritization_intervals
 
@@ -140,7 +207,11 @@ def __wt_durations_from_wt_intervals(
         wt_prioritization_intervals: Optional[Tuple[List, List]],
         wt_unavailability_intervals: Optional[List[Interval]],
         wt_total: pd.Timedelta) -> WaitingTimeDurations:
-    """Computes waiting time while taking into account overlapping intervals."""
+    """
+    Computes waiting time while taking into account overlapping intervals. The components are attributed in order:
+    batching, contention, prioritization and unavailability, each one accounting only for the time not covered by the
+    previous ones.
+    """
 
     wt_batching = pd.Timedelta(0)
     wt_contention = pd.Timedelta(0)
@@ -148,81 +219,38 @@ def __wt_durations_from_wt_intervals(
     wt_unavailability = pd.Timedelta(0)
     wt_extraneous = wt_total
 
-    def make_intervals(_intervals: Tuple[List, list]) -> List[pd.Interval]:
-        _intervals = list(zip(_intervals[0], _intervals[1]))
-
-        _intervals = [
-            pd.Interval(pd.to_datetime(start, utc=True), pd.to_datetime(end, utc=True))
-            for start, end in _intervals
-        ]
-
-        _intervals = __remove_overlapping_time_from_intervals_non_recursive(_intervals)
-
-        return _intervals
-
     if not wt_batching_interval and not wt_contention_intervals and not wt_prioritization_intervals and not wt_unavailability_intervals:
         return WaitingTimeDurations(wt_batching, wt_contention, wt_prioritization, wt_unavailability, wt_extraneous)
 
     # waiting time analysis
 
-    wt_contention_pd_intervals = None
-    wt_prioritization_pd_intervals = None
+    covered = IntervalSet.from_timestamps([], [])
 
     # batching calculation
 
     if wt_batching_interval:
         wt_batching = wt_batching_interval[1] - wt_batching_interval[0]
+        covered = IntervalSet.from_timestamps([wt_batching_interval[0]], [wt_batching_interval[1]])
 
     # contention calculation
 
     if wt_contention_intervals:
-        wt_contention_pd_intervals = make_intervals(wt_contention_intervals)
-
-        if wt_batching == pd.Timedelta(0):
-            wt_contention = __duration_of_pd_intervals(wt_contention_pd_intervals)
-        else:
-            wt_batching_pd_interval = pd.Interval(wt_batching_interval[0], wt_batching_interval[1])
-            wt_contention_pd_intervals = \
-                __subtract_a_from_intervals_b(wt_batching_pd_interval, wt_contention_pd_intervals)
-
-            wt_contention = __duration_of_pd_intervals(wt_contention_pd_intervals)
+        wt_contention_set = IntervalSet.from_timestamps(*wt_contention_intervals).difference(covered)
+        wt_contention = pd.Timedelta(wt_contention_set.length)
+        covered = covered.union(wt_contention_set)
 
     # prioritization calculation
 
     if wt_prioritization_intervals:
-        wt_prioritization_pd_intervals = make_intervals(wt_prioritization_intervals)
-
-        if wt_batching > pd.Timedelta(0):
-            wt_batching_pd_interval = pd.Interval(wt_batching_interval[0], wt_batching_interval[1])
-            wt_prioritization_pd_intervals = \
-                __subtract_a_from_intervals_b(wt_batching_pd_interval, wt_prioritization_pd_intervals)
-
-        if wt_contention_pd_intervals:
-            wt_prioritization_pd_intervals = \
-                __subtract_intervals_a_from_intervals_b_non_recursive(wt_contention_pd_intervals,
-                                                                      wt_prioritization_pd_intervals)
-
-        wt_prioritization = __duration_of_pd_intervals(wt_prioritization_pd_intervals)
+        wt_prioritization_set = IntervalSet.from_timestamps(*wt_prioritization_intervals).difference(covered)
+        wt_prioritization = pd.Timedelta(wt_prioritization_set.length)
+        covered = covered.union(wt_prioritization_set)
 
     # unavailability calculation
 
     if wt_unavailability_intervals:
-        if wt_batching > pd.Timedelta(0):
-            wt_batching_pd_interval = pd.Interval(wt_batching_interval[0], wt_batching_interval[1])
-            wt_unavailability_intervals = \
-                __subtract_a_from_intervals_b(wt_batching_pd_interval, wt_unavailability_intervals)
-
-        if wt_contention_pd_intervals:
-            wt_unavailability_intervals = __subtract_intervals_a_from_intervals_b_non_recursive(
-                wt_contention_pd_intervals, wt_unavailability_intervals
-            )
-
-        if wt_prioritization_pd_intervals:
-            wt_unavailability_intervals = __subtract_intervals_a_from_intervals_b_non_recursive(
-                wt_prioritization_pd_intervals, wt_unavailability_intervals
-            )
-
-        wt_unavailability = __duration_of_pd_intervals(wt_unavailability_intervals)
+        wt_unavailability_set = IntervalSet.from_pd_intervals(wt_unavailability_intervals).difference(covered)
+        wt_unavailability = pd.Timedelta(wt_unavailability_set.length)
 
     # extraneous calculation
 
@@ -249,7 +277,7 @@ def __wt_durations_from_wt_intervals(
 
 
 # Pandas Intervals
-# TODO: move to a separate module
+# NOTE: the analysis runs on IntervalSet, these are kept for the callers working with lists of pd.Interval
 
 def __subtract_a_from_b(a: pd.Interval, b: pd.Interval) -> [pd.Interval]:
     """Subtracts the interval a from b."""
@@ -337,16 +365,3 @@ def __remove_overlapping_time_from_intervals_non_recursive(a: List[pd.Interval])
         rest = __subtract_a_from_intervals_b(interval, rest[1:])
 
     return accumulator
-
-
-def __duration_of_pd_intervals(intervals: List[pd.Interval]) -> pd.Timedelta:
-    """Returns the duration of the intervals."""
-
-    if len(intervals) == 0:
-        return pd.Timedelta(0)
-
-    result = pd.Timedelta(0)
-    for interval in intervals:
-        result += interval.right - interval.left
-
-    return result
@@ -0,0 +1,94 @@
+from typing import Iterable, List
+
+import numpy as np
+import pandas as pd
+
+
+class IntervalSet:
+    """
+    Set of time instants stored as disjoint half-open intervals [start, end) in int64 nanoseconds since the epoch,
+    sorted by start time. Adjacent intervals are merged, so two sets covering the same time have equal arrays.
+
+    Union, difference and length are computed with sorts and sweeps over the arrays, instead of subtracting
+    pd.Interval objects pairwise, which costs a Python call per pair of intervals.
+    """
+
+    starts: np.ndarray
+    ends: np.ndarray
+
+    def __init__(self, starts: np.ndarray, ends: np.ndarray):
+        """Creates the set covered by the given intervals, which may overlap, be unsorted or empty."""
+        starts = np.asarray(starts, dtype=np.int64)
+        ends = np.asarray(ends, dtype=np.int64)
+        non_empty = starts < ends
+        starts, ends = starts[non_empty], ends[non_empty]
+
+        # sweep in the order of start times: an interval opens a new piece if it starts after every previous one ended
+        order = np.argsort(starts, kind='stable')
+        starts, ends = starts[order], ends[order]
+        reached = np.maximum.accumulate(ends) if len(ends) > 0 else ends
+        opens = np.ones(len(starts), dtype=bool)
+        opens[1:] = starts[1:] > reached[:-1]
+        firsts = np.flatnonzero(opens)
+        lasts = np.append(firsts[1:] - 1, len(starts) - 1) if len(firsts) > 0 else firsts
+
+        self.starts = starts[firsts]
+        self.ends = reached[lasts]
+
+    @staticmethod
+    def from_timestamps(lefts: Iterable, rights: Iterable) -> 'IntervalSet':
+        """Creates the set from the boundaries of intervals given as timestamps, naive ones are taken as UTC."""
+        return IntervalSet(_as_nanoseconds(lefts), _as_nanoseconds(rights))
+
+    @staticmethod
+    def from_pd_intervals(intervals: Iterable[pd.Interval]) -> 'IntervalSet':
+        intervals = list(intervals)
+        return IntervalSet.from_timestamps([interval.left for interval in intervals],
+                                           [interval.right for interval in intervals])
+
+    @property
+    def length(self) -> int:
+        """Total time covered by the set in nanoseconds."""
+        return int((self.ends - self.starts).sum())
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __eq__(self, other):
+        return isinstance(other, IntervalSet) \
+            and np.array_equal(self.starts, other.starts) and np.array_equal(self.ends, other.ends)
+
+    def __repr__(self):
+        return f'IntervalSet({list(zip(self.starts.tolist(), self.ends.tolist()))})'
+
+    def union(self, other: 'IntervalSet') -> 'IntervalSet':
+        return IntervalSet(np.concatenate([self.starts, other.starts]), np.concatenate([self.ends, other.ends]))
+
+    def difference(self, other: 'IntervalSet') -> 'IntervalSet':
+        """Returns the time covered by this set and not by the other one."""
+        if len(self) == 0 or len(other) == 0:
+            return self
+
+        # NOTE: between two consecutive boundaries of either set, both sets are either covering or not covering
+        # the whole segment, so it's enough to check whether they cover its start
+        boundaries = np.unique(np.concatenate([self.starts, self.ends, other.starts, other.ends]))
+        lefts, rights = boundaries[:-1], boundaries[1:]
+        kept = self.contains(lefts) & ~other.contains(lefts)
+        return IntervalSet(lefts[kept], rights[kept])
+
+    def contains(self, instants: np.ndarray) -> np.ndarray:
+        """Whether each instant is covered by the set."""
+        current = np.searchsorted(self.starts, instants, 'right') - 1
+        return (current >= 0) & (instants < self.ends[np.maximum(current, 0)]) if len(self) > 0 \
+            else np.zeros(len(instants), dtype=bool)
+
+    def to_pd_intervals(self, tz: str = 'UTC') -> List[pd.Interval]:
+        return [pd.Interval(pd.Timestamp(start, tz='UTC').tz_convert(tz), pd.Timestamp(end, tz='UTC').tz_convert(tz))
+                for start, end in zip(self.starts.tolist(), self.ends.tolist())]
+
+
+def _as_nanoseconds(timestamps: Iterable) -> np.ndarray:
+    timestamps = list(timestamps)
+    if len(timestamps) == 0:
+        return np.array([], dtype=np.int64)
+    return pd.to_datetime(timestamps, utc=True).as_unit('ns').asi8
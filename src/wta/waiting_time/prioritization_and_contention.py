@@ -5,35 +5,52 @@ import pandas as pd
 
 from wta import log_ids_non_nil
 from wta.helpers import EventLogIDs
+from wta.waiting_time.resource_index import ResourceEventIndex
 from wta.waiting_time.resource_unavailability import other_processing_events_during_waiting_time_of_event
 
 
-def detect_intervals(processing_events: pd.DataFrame, actual_event_enabled_time: pd.Timestamp, log_ids: EventLogIDs, event: pd.DataFrame) -> Tuple[List[List], List[List]]:
-    actual_event_enabled_time_utc = pd.to_datetime(actual_event_enabled_time, utc=True)
-    events_due_to_prioritization = processing_events[processing_events[log_ids.enabled_time] > actual_event_enabled_time_utc]
-    events_due_to_contention = processing_events[processing_events[log_ids.enabled_time] <= actual_event_enabled_time_utc]
+def detect_intervals(processing_events: pd.DataFrame, actual_event_enabled_time: pd.Timestamp, log_ids: EventLogIDs,
+                     event: pd.DataFrame) -> Tuple[List[List], List[List]]:
+    """
+    Contention and prioritization intervals of the waiting time of the event, given the events its resource processed
+    meanwhile and the time from which the event is considered enabled, see _detect_intervals.
+    """
+    def timestamps(column: str) -> np.ndarray:
+        return processing_events[column].to_numpy(dtype='datetime64[ns]')
 
-    def calculate_intervals(events_due_to, actual_event_enabled_time):
-        if events_due_to.size > 0:
-            start_time = np.maximum(
-                np.array([actual_event_enabled_time], dtype='datetime64[ns]'),
-                events_due_to[log_ids.start_time].to_numpy(dtype='datetime64[ns]')
-            )
-            end_time = np.minimum(event[log_ids.start_time].values, events_due_to[log_ids.end_time].values)
-            intervals = [(start, end) for start, end in zip(start_time, end_time) if start <= end]
-            return [list(t) for t in zip(*intervals)] if intervals else ([], [])
-        return ([], [])
+    # NOTE: the timestamps of the log are normalized to UTC when it's loaded
+    return _detect_intervals(timestamps(log_ids.enabled_time), timestamps(log_ids.start_time),
+                             timestamps(log_ids.end_time), np.datetime64(actual_event_enabled_time.value, 'ns'),
+                             np.datetime64(event[log_ids.start_time].iloc[0].value, 'ns'))
 
-    wt_contention_intervals = calculate_intervals(events_due_to_contention, actual_event_enabled_time)
-    wt_prioritization_intervals = calculate_intervals(events_due_to_prioritization, actual_event_enabled_time)
 
-    return wt_contention_intervals, wt_prioritization_intervals
+def _detect_intervals(enabled_times: np.ndarray, start_times: np.ndarray, end_times: np.ndarray,
+                      actual_enabled_times: np.ndarray, event_start_time: np.datetime64) -> Tuple[List[List], List[List]]:
+    """
+    Contention and prioritization intervals of the waiting time of an event, given the enabled, start and end times of
+    the other events its resource processed meanwhile, as datetime64[ns] arrays, and the time from which the event is
+    considered enabled with respect to each of them. Events enabled after that time are prioritized, the others are
+    processed due to contention, and events with no enabled time are neither.
+    """
+    prioritized = enabled_times > actual_enabled_times
+    contended = enabled_times <= actual_enabled_times
+
+    starts = np.maximum(actual_enabled_times, start_times)
+    ends = np.minimum(event_start_time, end_times)
+    valid = starts <= ends
+
+    def intervals(mask: np.ndarray) -> Tuple[List, List]:
+        mask = mask & valid
+        return list(starts[mask]), list(ends[mask])
+
+    return intervals(contended), intervals(prioritized)
 
 
 def detect_contention_and_prioritization_intervals(
         event_index: pd.Index,
         log: pd.DataFrame,
-        log_ids: Optional[EventLogIDs] = None) -> Tuple[List, List]:
+        log_ids: Optional[EventLogIDs] = None,
+        resource_index: Optional[ResourceEventIndex] = None) -> Tuple[List, List]:
 
     log_ids = log_ids_non_nil(log_ids)
 
@@ -41,32 +58,26 @@ def detect_contention_and_prioritization_intervals(
     if isinstance(event, pd.Series):
         event = event.to_frame().T
 
-    other_processing_events = other_processing_events_during_waiting_time_of_event(event_index, log, log_ids=log_ids)
+    other_processing_events = other_processing_events_during_waiting_time_of_event(
+        event_index, log, log_ids=log_ids, resource_index=resource_index)
 
+    # events of the same batch wait since the event was enabled, the others since its batch was enabled or it started
     event_batch_instance_id = event.at[event.index[0], log_ids.batch_id]
-    other_processing_events_in_batch = other_processing_events.query(f'{log_ids.batch_id} == @event_batch_instance_id')
-
-    other_processing_events_out_batch = other_processing_events.merge(
-        other_processing_events_in_batch, indicator=True, how='outer').query('_merge == "left_only"').drop(columns='_merge')
-
-    actual_event_enabled_time = event.at[event.index[0], log_ids.enabled_time]
-    wt_contention_intervals_in_batch, wt_prioritization_intervals_in_batch = detect_intervals(
-        other_processing_events_in_batch, actual_event_enabled_time, log_ids, event)
-
-    actual_event_enabled_time = min(event.at[event.index[0], log_ids.batch_instance_enabled],
-                                    event.at[event.index[0], log_ids.start_time])
-    if pd.isna(actual_event_enabled_time):
-        actual_event_enabled_time = event.at[event.index[0], log_ids.enabled_time]
-    wt_contention_intervals_out_batch, wt_prioritization_intervals_out_batch = detect_intervals(
-        other_processing_events_out_batch, actual_event_enabled_time, log_ids, event)
-
-    wt_contention_intervals = (
-        wt_contention_intervals_in_batch[0] + wt_contention_intervals_out_batch[0],
-        wt_contention_intervals_in_batch[1] + wt_contention_intervals_out_batch[1]
-    )
-
-    wt_prioritization_intervals = (
-        wt_prioritization_intervals_in_batch[0] + wt_prioritization_intervals_out_batch[0],
-        wt_prioritization_intervals_in_batch[1] + wt_prioritization_intervals_out_batch[1]
-    )
-    return wt_contention_intervals, wt_prioritization_intervals
+    in_batch = (other_processing_events[log_ids.batch_id] == event_batch_instance_id).to_numpy(dtype=bool, na_value=False)
+
+    in_batch_enabled_time = event.at[event.index[0], log_ids.enabled_time]
+    out_batch_enabled_time = min(event.at[event.index[0], log_ids.batch_instance_enabled],
+                                 event.at[event.index[0], log_ids.start_time])
+    if pd.isna(out_batch_enabled_time):
+        out_batch_enabled_time = in_batch_enabled_time
+    # NOTE: the timestamps of the log are normalized to UTC when it's loaded
+    actual_enabled_times = np.where(in_batch,
+                                    np.datetime64(in_batch_enabled_time.value, 'ns'),
+                                    np.datetime64(out_batch_enabled_time.value, 'ns'))
+
+    def timestamps(column: str) -> np.ndarray:
+        return other_processing_events[column].to_numpy(dtype='datetime64[ns]')
+
+    return _detect_intervals(timestamps(log_ids.enabled_time), timestamps(log_ids.start_time),
+                             timestamps(log_ids.end_time), actual_enabled_times,
+                             np.datetime64(event.at[event.index[0], log_ids.start_time].value, 'ns'))
@@ -0,0 +1,91 @@
+from typing import Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from wta import log_ids_non_nil, EventLogIDs
+from wta.helpers import as_nanoseconds, NAT_NANOSECONDS
+
+
+class ResourceEventIndex:
+    """
+    Events of the log grouped by resource and sorted by start time, with a running maximum of their end times.
+
+    The events of a resource processed during a time window are the ones that started before the window ends and
+    ended after it begins. The first condition holds for a prefix of the sorted events and the running maximum of end
+    times rules out a prefix of it, so a lookup is two binary searches and a scan over the events in between, instead
+    of filtering the whole log. The index is built once per run and shared by all detectors, it refers to the events
+    by their position in the log, so it must be used with the same log it was built from.
+    """
+
+    codes: np.ndarray  # resource code of each event of the log, -1 for missing resources
+    resources: np.ndarray  # resource names by code
+    positions: np.ndarray  # positions of the events in the log sorted by resource code and start time
+    starts: np.ndarray  # start times of the sorted events in nanoseconds
+    ends: np.ndarray  # end times of the sorted events in nanoseconds
+    max_ends: np.ndarray  # running maximum of the end times of the sorted events within each resource
+    bounds: np.ndarray  # events of the resource with code c are in [bounds[c], bounds[c + 1])
+
+    def __init__(self, log: pd.DataFrame, log_ids: Optional[EventLogIDs] = None):
+        log_ids = log_ids_non_nil(log_ids)
+
+        codes, resources = pd.factorize(log[log_ids.resource])
+        starts = as_nanoseconds(log[log_ids.start_time])
+        ends = as_nanoseconds(log[log_ids.end_time])
+
+        # NOTE: events without resource or timestamps are never processed during the waiting time of other events
+        positions = np.flatnonzero((codes >= 0) & (starts != NAT_NANOSECONDS) & (ends != NAT_NANOSECONDS))
+        positions = positions[np.lexsort((starts[positions], codes[positions]))]
+
+        self.codes = codes
+        self.resources = np.asarray(resources, dtype=object)
+        self._code_by_resource = {resource: code for code, resource in enumerate(self.resources)}
+        self.positions = positions
+        self.starts = starts[positions]
+        self.ends = ends[positions]
+        self.max_ends = pd.Series(self.ends).groupby(codes[positions]).cummax().to_numpy()
+        self.bounds = np.searchsorted(codes[positions], np.arange(len(self.resources) + 1))
+
+    def code(self, resource) -> int:
+        """Returns the code of the resource, -1 if the resource has no events in the log."""
+        return self._code_by_resource.get(resource, -1)
+
+    def candidate_ranges(self, codes: np.ndarray, window_starts: np.ndarray,
+                         window_ends: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the ranges [lower, upper) of sorted events that may have been processed during each window by the
+        resource with the given code. Every event processed during a window is within its range, but events in the
+        range still have to be checked for ending after the window starts.
+        """
+        lower = np.zeros(len(codes), dtype=np.int64)
+        upper = np.zeros(len(codes), dtype=np.int64)
+        for code in np.unique(codes[codes >= 0]):
+            selected = np.flatnonzero(codes == code)
+            first, last = self.bounds[code], self.bounds[code + 1]
+            upper[selected] = first + np.searchsorted(self.starts[first:last], window_ends[selected], 'left')
+            lower[selected] = first + np.searchsorted(self.max_ends[first:last], window_starts[selected], 'right')
+        return lower, np.maximum(lower, upper)
+
+    def processed_during(self, resource, window_start: int, window_end: int,
+                         excluded_position: Optional[int] = None) -> np.ndarray:
+        """
+        Returns the sorted positions of the events of the resource that started before window_end and ended after
+        window_start, i.e., the events that were being processed during the window.
+
+        :param resource: resource name.
+        :param window_start: window start in nanoseconds.
+        :param window_end: window end in nanoseconds.
+        :param excluded_position: position of an event to leave out, usually the event the window belongs to.
+        """
+        code = self.code(resource)
+        if code < 0 or window_start == NAT_NANOSECONDS or window_end == NAT_NANOSECONDS:
+            return np.array([], dtype=np.int64)
+
+        first, last = self.bounds[code], self.bounds[code + 1]
+        upper = first + np.searchsorted(self.starts[first:last], window_end, 'left')
+        lower = first + np.searchsorted(self.max_ends[first:last], window_start, 'right')
+        candidates = self.positions[lower:upper]
+        overlapping = self.ends[lower:upper] > window_start
+        if excluded_position is not None:
+            overlapping &= candidates != excluded_position
+        return np.sort(candidates[overlapping])
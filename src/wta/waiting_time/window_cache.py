@@ -0,0 +1,68 @@
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, TypeVar
+
+import pandas as pd
+
+T = TypeVar('T')
+
+DEFAULT_WINDOW_CACHE_SIZE = 10_000
+
+
+class WaitingWindowCache:
+    """
+    Intervals found by the detectors for the waiting windows analyzed in a run, with least recently used eviction.
+
+    The events processed by a resource during the waiting time of an event depend only on the resource and the
+    window from the enabled to the start time of the event, since the event itself and the events started at the same
+    time are never among them. Destination events sharing these, e.g., the members of a batch, have the same
+    unavailability intervals, and the same contention and prioritization intervals if they also share the batch.
+    The cache is meant to live for a single run, or a chunk of a parallel run, since the intervals depend on the log
+    and the calendar.
+    """
+
+    maxsize: int
+    hits: int
+    misses: int
+
+    def __init__(self, maxsize: int = DEFAULT_WINDOW_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key: Hashable, compute: Callable[[], T]) -> T:
+        """Returns the value cached for the key, computing and caching it on a miss."""
+        if key in self._entries:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+        self.misses += 1
+        value = compute()
+        self._entries[key] = value
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+        return value
+
+    def counters(self) -> Dict[str, int]:
+        """Hits and misses of the cache, as reported in the run metrics, see profiling.add_counters."""
+        return {'window_cache_hits': self.hits, 'window_cache_misses': self.misses}
+
+
+def window_key(destination: pd.Series, *columns: str) -> tuple:
+    """
+    Key of the waiting window of the destination event made of the values of the given columns, with timestamps as
+    nanoseconds and missing values as None, so that equal windows have equal keys.
+    """
+    key = []
+    for column in columns:
+        value = destination.get(column)
+        if isinstance(value, pd.Timestamp):
+            value = value.value
+        elif value is None or pd.isna(value):
+            value = None
+        key.append(value)
+    return tuple(key)
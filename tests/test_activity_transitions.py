@@ -0,0 +1,79 @@
+import pandas as pd
+import pytest
+
+from wta import EventLogIDs
+from wta.activity_transitions import identify, mark_activity_transitions
+from wta.benchmarks import LogShape
+from wta.benchmarks.scenarios import BenchmarkLog
+
+transition_sources_test_cases = [
+    {
+        'test_case_name': 'sequence',
+        'events': [('A', '08:00', '09:00'), ('B', '09:00', '10:00'), ('C', '10:30', '11:00')],
+        'parallel_activities': {},
+        'expected': [None, 0, 1],
+    },
+    {
+        'test_case_name': 'overlapping events are skipped',
+        'events': [('A', '08:00', '09:00'), ('B', '08:30', '10:00'), ('C', '09:30', '11:00')],
+        'parallel_activities': {},
+        'expected': [None, None, 0],
+    },
+    {
+        'test_case_name': 'parallel activities are skipped',
+        'events': [('A', '08:00', '09:00'), ('B', '09:00', '10:00'), ('C', '10:00', '10:30'), ('D', '11:00', '12:00')],
+        'parallel_activities': {'D': {'B', 'C'}},
+        'expected': [None, 0, 1, 0],
+    },
+    {
+        'test_case_name': 'events without end time',
+        'events': [('A', '08:00', '09:00'), ('B', '09:00', None), ('C', '10:00', None)],
+        'parallel_activities': {'C': {'A'}},
+        'expected': [None, 0, 1],
+    },
+]
+
+
+def make_case(events) -> pd.DataFrame:
+    def timestamp(time):
+        return pd.Timestamp(f'2020-01-01 {time}', tz='UTC') if time else pd.NaT
+
+    log_ids = EventLogIDs()
+    return pd.DataFrame({
+        log_ids.activity: [activity for activity, _, _ in events],
+        log_ids.start_time: pd.to_datetime([timestamp(start) for _, start, _ in events], utc=True),
+        log_ids.end_time: pd.to_datetime([timestamp(end) for _, _, end in events], utc=True),
+    })
+
+
+@pytest.mark.parametrize('test_data', transition_sources_test_cases,
+                         ids=[test_data['test_case_name'] for test_data in transition_sources_test_cases])
+def test_mark_activity_transitions(test_data):
+    log_ids = EventLogIDs()
+    case = make_case(test_data['events'])
+
+    mark_activity_transitions(case, test_data['parallel_activities'], log_ids=log_ids)
+
+    expected = pd.Series(test_data['expected'], dtype=float, name=log_ids.transition_source_index)
+    pd.testing.assert_series_equal(case[log_ids.transition_source_index], expected)
+
+
+def test_mark_activity_transitions_not_sorted_by_end_time():
+    log_ids = EventLogIDs()
+    case = make_case([('A', '08:00', '09:00'), ('B', '09:30', '12:00'), ('C', '10:00', '11:00'),
+                      ('D', '12:00', '13:00')])
+
+    mark_activity_transitions(case, {}, log_ids=log_ids)
+
+    expected = pd.Series([None, 0, 0, 2], dtype=float, name=log_ids.transition_source_index)
+    pd.testing.assert_series_equal(case[log_ids.transition_source_index], expected)
+
+
+def test_identify_keeps_the_log_of_the_caller():
+    log = BenchmarkLog(LogShape(n_cases=10, events_per_case=4, n_resources=3))
+    dtypes = log.log.dtypes.copy()
+
+    identify(log.log, log.parallel_activities, parallel_run=False, log_ids=log.log_ids, calendar=log.calendar)
+
+    # the columns are encoded as categoricals in a copy
+    pd.testing.assert_series_equal(log.log.dtypes, dtypes)
@@ -0,0 +1,68 @@
+import pandas as pd
+import pytest
+
+from wta import EventLogIDs
+from wta.benchmarks import LogShape, generate_log, run_benchmarks
+
+
+def test_generate_log_is_seeded():
+    shape = LogShape(n_cases=50, events_per_case=5, n_resources=4, seed=7)
+
+    pd.testing.assert_frame_equal(generate_log(shape), generate_log(shape))
+    assert not generate_log(shape).equals(generate_log(LogShape(n_cases=50, events_per_case=5, n_resources=4, seed=8)))
+
+
+@pytest.mark.parametrize('calendar', ['24/7', 'office'])
+def test_generate_log_shape(calendar):
+    log_ids = EventLogIDs()
+    shape = LogShape(n_cases=200, events_per_case=4, n_resources=6, batch_rate=0.5, calendar=calendar)
+
+    log = generate_log(shape, log_ids)
+
+    assert len(log) == 200 * 4
+    assert log[log_ids.case].nunique() == 200
+    assert log[log_ids.resource].nunique() <= 6
+    assert (log[log_ids.end_time] >= log[log_ids.start_time]).all()
+    # batched events of an activity start together
+    assert log.groupby([log_ids.activity, log_ids.start_time]).size().max() > 1
+    if calendar == 'office':
+        starts = log[log_ids.start_time]
+        assert (starts.dt.dayofweek < 5).all()
+        assert starts.dt.hour.between(9, 16).all()
+
+
+def test_run_benchmarks():
+    shape = LogShape(n_cases=10, events_per_case=4, n_resources=3)
+
+    results = run_benchmarks(shape, scenarios=['calendar', 'batch_activation_times', 'transitions_vectorized'],
+                             repeats=2)
+
+    assert results['shape'] == shape.to_dict()
+    assert [scenario['name'] for scenario in results['scenarios']] == \
+           ['calendar', 'batch_activation_times', 'transitions_vectorized']
+    for scenario in results['scenarios']:
+        assert scenario['rows'] == 40
+        assert scenario['repeats'] == 2
+        assert scenario['wall_time'] > 0
+
+
+def test_run_benchmarks_unknown_scenario():
+    with pytest.raises(ValueError):
+        run_benchmarks(LogShape(n_cases=2), scenarios=['unknown'])
+
+
+def test_run_startup_benchmarks():
+    results = run_benchmarks(LogShape(n_cases=2), scenarios=['import_wta', 'cli_version'], repeats=1)
+
+    assert [scenario['name'] for scenario in results['scenarios']] == ['import_wta', 'cli_version']
+    for scenario in results['scenarios']:
+        assert scenario['rows'] == 1
+        assert scenario['wall_time'] > 0
+
+
+def test_run_batch_activation_times_sweep():
+    shape = LogShape(n_cases=2, batch_size=4)
+
+    results = run_benchmarks(shape, scenarios=['batch_activation_times_10000'], repeats=1)
+
+    assert results['scenarios'][0]['rows'] == 10_000 * 4
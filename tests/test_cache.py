@@ -0,0 +1,80 @@
+import os
+
+import pandas as pd
+
+from wta import EventLogIDs
+from wta.cache import StageCache, _dependency_versions
+from wta.main import run
+
+
+def test_stage_cache_round_trip(tmp_path):
+    cache = StageCache(tmp_path)
+    log = pd.DataFrame({'a': [1, 2, 3], 'b': ['x', 'y', 'z']})
+    key = cache.key('stage', log, {'param': 1})
+
+    assert cache.get(key) is None
+    cache.put(key, log)
+    pd.testing.assert_frame_equal(cache.get(key), log)
+
+    cache.put(cache.key('json_stage', log), {'A': ['B', 'C']})
+    assert cache.get(cache.key('json_stage', log)) == {'A': ['B', 'C']}
+
+
+def test_stage_cache_key_depends_on_content_and_params():
+    log = pd.DataFrame({'a': [1, 2, 3], 'b': ['x', 'y', 'z']})
+    key = StageCache.key('stage', log, {'param': 1})
+
+    assert key == StageCache.key('stage', log.copy(), {'param': 1})
+    assert key != StageCache.key('stage', log, {'param': 2})
+    assert key != StageCache.key('other_stage', log, {'param': 1})
+    assert key != StageCache.key('stage', log.assign(b=['x', 'y', 'w']), {'param': 1})
+    assert key != StageCache.key('stage', log.rename(columns={'b': 'c'}), {'param': 1})
+    assert key != StageCache.key('stage', log.iloc[[1, 0, 2]], {'param': 1})
+
+
+def test_stage_cache_key_depends_on_dependency_versions(monkeypatch):
+    log = pd.DataFrame({'a': [1, 2, 3]})
+    key = StageCache.key('stage', log)
+
+    versions = _dependency_versions()
+    assert set(versions) == {'batch_processing_discovery', 'start_time_estimator', 'prosimos'}
+    monkeypatch.setattr('wta.cache._dependency_versions', lambda: {**versions, 'prosimos': '0.0.0'})
+    assert key != StageCache.key('stage', log)
+
+
+def test_stage_cache_eviction(tmp_path):
+    cache = StageCache(tmp_path)
+    logs = [pd.DataFrame({'a': range(i, i + 1000)}) for i in range(3)]
+    for i, log in enumerate(logs):
+        cache.put(cache.key('stage', log), log)
+        os.utime(tmp_path / (cache.key('stage', log) + '.pkl'), (i, i))
+    entry_size = cache.size() // 3
+
+    cache.max_size_bytes = entry_size * 2
+    cache.get(cache.key('stage', logs[0]))  # the first entry becomes the most recently used one
+    cache.evict()
+
+    assert cache.get(cache.key('stage', logs[0])) is not None
+    assert cache.get(cache.key('stage', logs[1])) is None
+    assert cache.get(cache.key('stage', logs[2])) is not None
+
+
+def test_run_with_cache(assets_path, tmp_path, monkeypatch):
+    log_path = assets_path / 'icpm/handoff-logs/handoff-test.csv'
+    log_ids = EventLogIDs()
+
+    expected = run(log_path, parallel_run=False, log_ids=log_ids)
+    result = run(log_path, parallel_run=False, log_ids=log_ids, cache_dir=tmp_path)
+    pd.testing.assert_frame_equal(result, expected)
+    assert len(list(tmp_path.iterdir())) == 4
+
+    # the second run takes everything but the waiting time analysis from the cache
+    def fail(*args, **kwargs):
+        raise AssertionError('stage should have been taken from the cache')
+
+    monkeypatch.setattr('wta.main.add_enabled_timestamp', fail)
+    monkeypatch.setattr('batch_processing_discovery.discovery.discover_batches', fail)
+    monkeypatch.setattr('wta.main.parallel_activities_with_heuristic_oracle', fail)
+    monkeypatch.setattr('wta.activity_transitions.make_calendar', fail)
+    result = run(log_path, parallel_run=False, log_ids=log_ids, cache_dir=tmp_path)
+    pd.testing.assert_frame_equal(result, expected)
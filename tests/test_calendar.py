@@ -1,3 +1,4 @@
+import numpy as np
 import pandas as pd
 import pytest
 
@@ -167,3 +168,79 @@ def test_subtract():
     ]
     result = interval1.subtract(interval2)
     assert result == expected_result
+
+
+def test_weekly_calendar_off_duty():
+    weekly_calendar = calendars.WeeklyCalendar.from_prosimos([
+        {'from': 'MONDAY', 'to': 'MONDAY', 'beginTime': '09:00:00', 'endTime': '12:00:00'},
+        {'from': 'MONDAY', 'to': 'MONDAY', 'beginTime': '13:00:00', 'endTime': '17:00:00'},
+        {'from': 'TUESDAY', 'to': 'TUESDAY', 'beginTime': '09:00:00', 'endTime': '17:00:00'},
+    ])
+    assert weekly_calendar.per_week == pd.Timedelta(hours=15).value
+
+    # from Monday 11:00 until Tuesday 10:00, and the same window two weeks later
+    left = pd.Timestamp('2023-01-02 11:00:00', tz='UTC')
+    right = pd.Timestamp('2023-01-03 10:00:00', tz='UTC')
+    lefts = np.array([left.value, (left + pd.Timedelta(weeks=2)).value])
+    rights = np.array([right.value, (right + pd.Timedelta(weeks=2)).value])
+    off_duty = weekly_calendar.off_duty_time(lefts, rights)
+    assert (off_duty == pd.Timedelta(hours=17).value).all()
+
+    # from Monday 11:00 until the Tuesday of the next week
+    off_duty_intervals = weekly_calendar.off_duty_intervals(left.value, (right + pd.Timedelta(weeks=1)).value)
+    assert [(pd.Timestamp(a, tz='UTC'), pd.Timestamp(b, tz='UTC')) for a, b in off_duty_intervals] == [
+        (pd.Timestamp('2023-01-02 12:00:00', tz='UTC'), pd.Timestamp('2023-01-02 13:00:00', tz='UTC')),
+        (pd.Timestamp('2023-01-02 17:00:00', tz='UTC'), pd.Timestamp('2023-01-03 09:00:00', tz='UTC')),
+        (pd.Timestamp('2023-01-03 17:00:00', tz='UTC'), pd.Timestamp('2023-01-09 09:00:00', tz='UTC')),
+        (pd.Timestamp('2023-01-09 12:00:00', tz='UTC'), pd.Timestamp('2023-01-09 13:00:00', tz='UTC')),
+        (pd.Timestamp('2023-01-09 17:00:00', tz='UTC'), pd.Timestamp('2023-01-10 09:00:00', tz='UTC')),
+    ]
+    assert sum(b - a for a, b in off_duty_intervals) == \
+           weekly_calendar.off_duty_time(np.array([left.value]), np.array([(right + pd.Timedelta(weeks=1)).value]))[0]
+
+
+def test_compile_weekly_calendars_without_working_hours():
+    weekly_calendars = calendars.compile_weekly_calendars({UNDIFFERENTIATED_RESOURCE_POOL_KEY: []})
+    weekly_calendar = weekly_calendars[UNDIFFERENTIATED_RESOURCE_POOL_KEY]
+    assert weekly_calendar.off_duty_intervals(0, 100) == [(0, 100)]
+    assert weekly_calendar.off_duty_time(np.array([0]), np.array([100]))[0] == 100
+
+
+@pytest.mark.parametrize('parallel_run', [False, True])
+def test_calendar_make_same_as_factory(log_calendar, assets_path, parallel_run):
+    log_path = assets_path / 'PurchasingExample.csv'
+    event_log = read_csv(log_path)
+    mined_calendar = calendars.make(event_log, granularity=15, min_confidence=0.1, desired_support=0.7,
+                                    min_participation=0.4, parallel_run=parallel_run)
+    assert mined_calendar == log_calendar
+    assert list(mined_calendar) == list(log_calendar)
+
+
+def test_calendar_factory_has_expected_layout():
+    # NOTE: fails when Prosimos changes the statistics registered at once, see calendars._register_timestamps
+    assert calendars._has_expected_layout(CalendarFactory(15))
+
+
+def test_register_events_same_statistics_as_check_date_time(assets_path):
+    event_log = read_csv(assets_path / 'PurchasingExample.csv')
+    columns = [event_log[RESOURCE_KEY], event_log[ACTIVITY_KEY], event_log[START_TIMESTAMP_KEY],
+               event_log[END_TIMESTAMP_KEY]]
+
+    registered_at_once, checked = CalendarFactory(15), CalendarFactory(15)
+    calendars._register_timestamps(registered_at_once, *columns)
+    calendars._check_date_times(checked, *columns)
+
+    assert vars(registered_at_once.kpi_calendar) == vars(checked.kpi_calendar)
+    assert registered_at_once.from_datetime == checked.from_datetime
+    assert registered_at_once.to_datetime == checked.to_datetime
+
+
+@pytest.mark.parametrize('parallel_run', [False, True])
+def test_calendar_make_with_unexpected_layout(log_calendar, assets_path, monkeypatch, parallel_run):
+    event_log = read_csv(assets_path / 'PurchasingExample.csv')
+    monkeypatch.setattr(calendars, 'KPI_CALENDAR_ATTRIBUTES', calendars.KPI_CALENDAR_ATTRIBUTES | {'new_statistic'})
+
+    mined_calendar = calendars.make(event_log, granularity=15, min_confidence=0.1, desired_support=0.7,
+                                    min_participation=0.4, parallel_run=parallel_run)
+
+    assert mined_calendar == log_calendar
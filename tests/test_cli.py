@@ -2,6 +2,7 @@ import json
 import tempfile
 from pathlib import Path
 
+import pandas as pd
 import pytest
 
 from wta import cli, EventLogIDs
@@ -33,3 +34,37 @@ def test_main(assets_path, test_data):
         cli._run(log_path, parallel, log_ids, output_path)
 
         assert (output_path / (log_path.stem + '_transitions_report.csv')).exists()
+
+
+@pytest.mark.integration
+def test_main_parquet_output(assets_path):
+    pytest.importorskip('pyarrow')
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        log_path = assets_path / 'PurchasingExampleCase1.csv'
+        output_path = Path(output_dir)
+        log_ids = EventLogIDs.from_dict(test_data[0]['columns'])
+
+        cli._run(log_path, False, log_ids, output_path, output_format='parquet')
+
+        report = pd.read_parquet(output_path / (log_path.stem + '_transitions_report.parquet'))
+        assert len(report) > 0
+        assert not (output_path / (log_path.stem + '_transitions_report.csv')).exists()
+
+
+@pytest.mark.integration
+def test_main_metrics(assets_path):
+    with tempfile.TemporaryDirectory() as output_dir:
+        log_path = assets_path / 'PurchasingExampleCase1.csv'
+        output_path = Path(output_dir)
+        log_ids = EventLogIDs.from_dict(test_data[0]['columns'])
+        metrics_path = output_path / 'metrics.json'
+
+        cli._run(log_path, False, log_ids, output_path, metrics_path=metrics_path, profile_stages=['transitions'])
+
+        with metrics_path.open() as f:
+            stages = {stage['name']: stage for stage in json.load(f)['stages']}
+        assert {'read', 'preprocessing', 'enabled_times', 'batching', 'concurrency_oracle', 'calendar',
+                'transitions', 'report'} <= set(stages)
+        assert stages['read']['rows'] == len(pd.read_csv(log_path))
+        assert (output_path / 'transitions.prof').exists()
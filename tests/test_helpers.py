@@ -1,6 +1,9 @@
+import numpy as np
+import pandas as pd
 import pytest
 
-from wta import EventLogIDs
+from wta import EventLogIDs, read_csv, read_log, write_parquet, compute_batch_activation_times
+from wta.helpers import encode_categorical_columns, decode_categorical
 
 column_mapping_cases = ["""
 {
@@ -41,3 +44,94 @@ def test_EventLogIDs_from_dict(test_data):
     assert log_ids.resource == 'org:resource'
     assert log_ids.start_time == 'start_timestamp'
     assert log_ids.end_time == 'time:timestamp'
+
+
+@pytest.mark.parametrize('suffix', ['.parquet', '.feather'])
+def test_read_log_columnar(assets_path, tmp_path, suffix):
+    pytest.importorskip('pyarrow')
+
+    log_ids = EventLogIDs.from_dict(column_mapping_cases_dicts[0])
+    expected = read_csv(assets_path / 'PurchasingExampleCase1.csv', log_ids=log_ids)
+
+    # timestamps are stored as strings, like in the CSV, and an extra column should not be read
+    log = pd.read_csv(assets_path / 'PurchasingExampleCase1.csv')
+    log['unmapped'] = 1
+    log_path = tmp_path / ('log' + suffix)
+    if suffix == '.parquet':
+        write_parquet(log, log_path)
+    else:
+        log.to_feather(log_path)
+
+    result = read_log(log_path, log_ids=log_ids)
+
+    assert 'unmapped' not in result.columns
+    pd.testing.assert_frame_equal(result, expected[result.columns])
+
+
+def test_write_parquet_round_trip(assets_path, tmp_path):
+    pytest.importorskip('pyarrow')
+
+    log_ids = EventLogIDs.from_dict(column_mapping_cases_dicts[0])
+    log = read_csv(assets_path / 'PurchasingExampleCase1.csv', log_ids=log_ids)
+    log['wt_total'] = log[log_ids.start_time] - log[log_ids.end_time].shift(fill_value=log[log_ids.start_time].iloc[0])
+
+    write_parquet(log, tmp_path / 'log.parquet')
+    result = read_log(tmp_path / 'log.parquet', log_ids=log_ids)
+
+    pd.testing.assert_frame_equal(result, log[result.columns])
+
+
+def test_encode_categorical_columns():
+    log_ids = EventLogIDs()
+    log = pd.DataFrame({
+        log_ids.case: [1, 1, 2, 2],
+        log_ids.activity: ['A', 'B', 'A', 'B'],
+        log_ids.resource: ['R1', np.nan, 'R2', 'R1'],
+        log_ids.start_time: pd.date_range('2023-01-01', periods=4, freq='H', tz='UTC'),
+    })
+    expected = log.copy()
+
+    encode_categorical_columns(log, log_ids)
+
+    for column in [log_ids.case, log_ids.activity, log_ids.resource]:
+        assert isinstance(log[column].dtype, pd.CategoricalDtype)
+        pd.testing.assert_series_equal(decode_categorical(log[column]), expected[column])
+    pd.testing.assert_series_equal(log[log_ids.start_time], expected[log_ids.start_time])
+    # already encoded columns are kept, with their categories
+    categories = log[log_ids.activity].cat.categories
+    assert encode_categorical_columns(log, log_ids)[log_ids.activity].cat.categories is categories
+
+
+def _synthetic_batched_log(n_batches: int, batch_size: int = 3) -> pd.DataFrame:
+    rng = np.random.default_rng(42)
+    n_events = n_batches * batch_size
+    enabled = pd.Timestamp('2023-01-01', tz='UTC') + pd.to_timedelta(rng.integers(0, 10 ** 6, n_events), unit='s')
+    batch_ids = np.repeat(np.arange(n_batches, dtype=float), batch_size)
+    batch_ids[::batch_size + 1] = np.nan  # some events are not batched
+    return pd.DataFrame({'enabled_time': enabled, 'batch_instance_id': rng.permutation(batch_ids)})
+
+
+def test_compute_batch_activation_times():
+    log_ids = EventLogIDs()
+    log = _synthetic_batched_log(50)
+
+    result = compute_batch_activation_times(log.copy(), log_ids)
+
+    batched = log[log_ids.batch_id].notna()
+    assert result.loc[~batched, log_ids.batch_instance_enabled].isna().all()
+    for batch_id, batch in log[batched].groupby(log_ids.batch_id):
+        assert (result.loc[batch.index, log_ids.batch_instance_enabled] == batch[log_ids.enabled_time].max()).all()
+
+
+def test_compute_batch_activation_times_of_several_batches():
+    log_ids = EventLogIDs()
+    enabled = pd.to_datetime(['2023-01-02 09:00', '2023-01-02 08:00', '2023-01-02 10:00', '2023-01-02 11:00',
+                              '2023-01-02 07:00', '2023-01-02 12:00'], utc=True)
+    log = pd.DataFrame({log_ids.enabled_time: enabled, log_ids.batch_id: [0, 1, 0, None, 1, 2]})
+
+    result = compute_batch_activation_times(log, log_ids)
+
+    expected = pd.to_datetime(['2023-01-02 10:00', '2023-01-02 08:00', '2023-01-02 10:00', None,
+                               '2023-01-02 08:00', '2023-01-02 12:00'], utc=True)
+    pd.testing.assert_series_equal(result[log_ids.batch_instance_enabled],
+                                   pd.Series(expected, name=log_ids.batch_instance_enabled))
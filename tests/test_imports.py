@@ -0,0 +1,39 @@
+import json
+import subprocess
+import sys
+
+import pytest
+
+HEAVY_MODULES = ['pandas', 'numpy', 'tqdm', 'start_time_estimator', 'batch_processing_discovery',
+                 'bpdfr_simulation_engine']
+
+VERSION_COMMAND = 'from wta.cli import main\ntry:\n    main(["--version"])\nexcept SystemExit:\n    pass'
+
+
+def _loaded_heavy_modules(code: str) -> list:
+    """Runs the code in a new interpreter and returns the heavy modules it imported."""
+    report = f'import json, sys\nprint(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))'
+    output = subprocess.run([sys.executable, '-c', code + '\n' + report], capture_output=True, text=True, check=True)
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+@pytest.mark.parametrize('test_data', [
+    {'code': 'import wta', 'loaded': []},
+    {'code': 'from wta import __version__, profiling', 'loaded': []},
+    {'code': VERSION_COMMAND, 'loaded': []},
+    {'code': 'from wta import EventLogIDs', 'loaded': ['pandas', 'numpy']},
+])
+def test_heavy_modules_are_imported_lazily(test_data):
+    assert _loaded_heavy_modules(test_data['code']) == test_data['loaded']
+
+
+def test_exported_names():
+    import wta
+    from wta import helpers, cte_impact
+
+    assert wta.EventLogIDs is helpers.EventLogIDs
+    assert wta.calculate_cte_impact is cte_impact.calculate_cte_impact
+    assert wta.default_configuration is helpers.default_configuration
+    with pytest.raises(AttributeError):
+        _ = wta.unknown_name
+
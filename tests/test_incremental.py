@@ -0,0 +1,96 @@
+import pandas as pd
+import pytest
+from pandas.testing import assert_frame_equal
+
+from wta import EventLogIDs, activity_transitions, incremental
+from wta.benchmarks import LogShape, generate_log
+from wta.benchmarks.scenarios import BenchmarkLog
+from wta.calendars.calendars import make as make_calendar
+from wta.helpers import default_log_ids
+from wta.incremental import AnalysisState
+from wta.main import run
+
+
+@pytest.fixture
+def grown_log(tmp_path):
+    """A log and the same log without the events that ended last, as it was before they were appended."""
+    log_ids = default_log_ids
+    log = generate_log(LogShape(n_cases=60, events_per_case=5, n_resources=5, batch_rate=0.2, overlap=0,
+                                calendar='office'), log_ids)
+    previous_log = log[log[log_ids.end_time] <= log[log_ids.end_time].quantile(0.9)]
+
+    log.to_csv(tmp_path / 'log.csv', index=False)
+    previous_log.to_csv(tmp_path / 'previous_log.csv', index=False)
+    # NOTE: the calendar is fixed, otherwise it's discovered again from the grown log and all events are analyzed
+    calendar = make_calendar(log, granularity=60, log_ids=log_ids)
+    return tmp_path / 'log.csv', tmp_path / 'previous_log.csv', calendar
+
+
+@pytest.fixture
+def analyzed_destinations(monkeypatch):
+    """Number of destination events analyzed by every run."""
+    counts = []
+    analyze_destinations = activity_transitions.analyze_destinations
+
+    def counting(log, log_ids, calendar, destinations, *args, **kwargs):
+        counts.append(len(destinations))
+        return analyze_destinations(log, log_ids, calendar, destinations, *args, **kwargs)
+
+    monkeypatch.setattr('wta.activity_transitions.analyze_destinations', counting)
+    return counts
+
+
+@pytest.mark.integration
+@pytest.mark.parametrize('parallel_run', [False, True])
+def test_incremental_run(tmp_path, grown_log, analyzed_destinations, parallel_run):
+    log_path, previous_log_path, calendar = grown_log
+    state_dir = tmp_path / 'state'
+    log_ids = default_log_ids
+
+    previous = run(previous_log_path, parallel_run=False, log_ids=log_ids, calendar=calendar, state_dir=state_dir)
+    assert_frame_equal(previous, run(previous_log_path, parallel_run=False, log_ids=log_ids, calendar=calendar))
+
+    result = run(log_path, parallel_run=parallel_run, log_ids=log_ids, calendar=calendar, state_dir=state_dir,
+                 n_workers=2)
+    expected = run(log_path, parallel_run=False, log_ids=log_ids, calendar=calendar)
+    assert_frame_equal(result, expected)
+    # only the events affected by the appended ones were analyzed again
+    assert 0 < analyzed_destinations[1] < len(expected)
+
+    # nothing is analyzed again without new events
+    assert_frame_equal(run(log_path, parallel_run=False, log_ids=log_ids, calendar=calendar, state_dir=state_dir),
+                       expected)
+    assert analyzed_destinations[2] == 0
+
+
+def test_state_of_other_log_ids_is_ignored(tmp_path, grown_log):
+    _, previous_log_path, calendar = grown_log
+    state_dir = tmp_path / 'state'
+
+    run(previous_log_path, parallel_run=False, log_ids=default_log_ids, calendar=calendar, state_dir=state_dir)
+
+    assert AnalysisState.load(state_dir, default_log_ids) is not None
+    assert AnalysisState.load(state_dir, EventLogIDs()) is None
+    assert AnalysisState.load(tmp_path / 'missing', default_log_ids) is None
+
+
+@pytest.mark.parametrize('option', ['shared_memory', 'vectorized', 'partition_by_resource'])
+def test_incremental_run_rejects_other_engines(tmp_path, grown_log, option):
+    log_path, _, calendar = grown_log
+
+    with pytest.raises(ValueError):
+        run(log_path, log_ids=default_log_ids, calendar=calendar, state_dir=tmp_path / 'state', **{option: True})
+
+
+def test_identify_keeps_the_log_of_the_caller(tmp_path):
+    log = BenchmarkLog(LogShape(n_cases=10, events_per_case=4, n_resources=3))
+    log_ids = log.log_ids
+    for column in [log_ids.start_time, log_ids.end_time]:
+        log.log[column] = log.log[column].dt.tz_convert('Europe/Madrid')
+    dtypes = log.log.dtypes.copy()
+
+    incremental.identify(log.log, log.parallel_activities, log.calendar, tmp_path / 'state', parallel_run=False,
+                         log_ids=log_ids)
+
+    # the timestamps are normalized to UTC in a copy
+    pd.testing.assert_series_equal(log.log.dtypes, dtypes)
@@ -0,0 +1,76 @@
+import pandas as pd
+import pytest
+from pandas.testing import assert_frame_equal
+
+from bpdfr_simulation_engine.resource_calendar import CalendarFactory
+from wta import EventLogIDs, main, read_log
+from wta.benchmarks import LogShape, generate_log
+from wta.calendars import calendars
+from wta.helpers import default_log_ids, convert_timestamp_columns_to_datetime
+from wta.main import run
+from wta.out_of_core import PartitionStore, _parallel_activities, _partition_log, _partition_numbers
+
+
+@pytest.fixture
+def log_path(tmp_path):
+    log = generate_log(LogShape(n_cases=40, events_per_case=5, n_resources=5, batch_rate=0.3, overlap=0.2,
+                                calendar='office'), default_log_ids)
+    log.to_csv(tmp_path / 'log.csv', index=False)
+    return tmp_path / 'log.csv'
+
+
+@pytest.mark.integration
+@pytest.mark.parametrize('test_data', [
+    {'parallel_run': False, 'memory_budget': 10 ** 9},
+    {'parallel_run': False, 'memory_budget': 50_000},
+    {'parallel_run': True, 'memory_budget': 50_000},
+])
+def test_out_of_core_run(tmp_path, log_path, test_data):
+    spill_dir = tmp_path / 'spill'
+
+    result = run(log_path, parallel_run=test_data['parallel_run'], log_ids=default_log_ids, n_workers=2,
+                 memory_budget=test_data['memory_budget'], spill_dir=spill_dir)
+    expected = run(log_path, parallel_run=False, log_ids=default_log_ids)
+
+    assert_frame_equal(result, expected)
+    # the partitions are removed at the end of the run
+    assert list(spill_dir.iterdir()) == []
+
+
+def test_out_of_core_run_rejects_in_memory_options(log_path, tmp_path):
+    with pytest.raises(ValueError):
+        run(log_path, log_ids=default_log_ids, memory_budget=10 ** 9, cache_dir=tmp_path / 'cache')
+
+
+@pytest.mark.parametrize('option', ['shared_memory', 'partition_by_resource'])
+def test_out_of_core_run_rejects_parallel_options(log_path, option):
+    with pytest.raises(ValueError):
+        run(log_path, log_ids=default_log_ids, memory_budget=10 ** 9, **{option: True})
+
+
+@pytest.mark.parametrize('log_name', ['PurchasingExample.csv', 'Production.csv'])
+def test_parallel_activities_of_partitions(assets_path, tmp_path, log_name):
+    log_ids = default_log_ids
+    store = PartitionStore(tmp_path)
+    n_partitions = _partition_log(assets_path / log_name, log_ids, store, memory_budget=500_000)
+
+    parallel_activities = _parallel_activities(store, n_partitions, log_ids)
+
+    log = read_log(assets_path / log_name, log_ids=log_ids)
+    log = log.sort_values(by=[log_ids.end_time, log_ids.start_time, log_ids.activity])
+    assert n_partitions > 1
+    assert parallel_activities == {activity: set(parallel) for activity, parallel in
+                                   main._parallel_activities(log, log_ids).items()}
+
+
+def test_calendar_of_resource_partitions(assets_path):
+    log_ids = EventLogIDs()
+    log = convert_timestamp_columns_to_datetime(pd.read_csv(assets_path / 'icpm/handoff-logs/handoff-test.csv'),
+                                                log_ids)
+
+    calendar_factory = CalendarFactory(15)
+    partitions = _partition_numbers(log[log_ids.resource], 2)
+    for partition in range(2):
+        calendars.register_events(calendar_factory, log[partitions == partition], log_ids=log_ids)
+
+    assert calendars.build(calendar_factory) == calendars.make(log, granularity=15, log_ids=log_ids)
@@ -0,0 +1,85 @@
+import json
+import pstats
+
+import pandas as pd
+
+from wta import print_section_boundaries, profiling
+from wta.profiling import Profiler
+
+
+def test_stage_records_metrics():
+    profiler = Profiler()
+
+    with profiler.activate():
+        with profiling.stage('outer', rows=10):
+            with profiling.stage('inner') as metrics:
+                sum(range(10 ** 6))
+                metrics.rows = 5
+
+    assert [stage.name for stage in profiler.stages] == ['outer', 'inner']
+    outer, inner = profiler.stages
+    assert outer.rows == 10 and inner.rows == 5
+    assert outer.wall_time >= inner.wall_time > 0
+    assert inner.cpu_time >= 0
+    assert outer.peak_rss_bytes is None or outer.peak_rss_bytes > 0
+
+
+def test_stage_without_profiler():
+    profiler = Profiler()
+
+    with profiling.stage('not recorded'):
+        pass
+
+    assert profiler.stages == []
+
+
+def test_print_section_boundaries_records_stage(capsys):
+    @print_section_boundaries('Counting', stage='counting')
+    def count(df: pd.DataFrame) -> int:
+        return len(df)
+
+    profiler = Profiler()
+    with profiler.activate():
+        assert count(pd.DataFrame({'a': range(3)})) == 3
+
+    assert 'Counting' in capsys.readouterr().out
+    assert [(stage.name, stage.rows) for stage in profiler.stages] == [('counting', 3)]
+
+
+def test_cprofile_and_metrics_json(tmp_path):
+    profiler = Profiler(cprofile_stages=['profiled'], profile_dir=tmp_path)
+
+    with profiler.activate():
+        with profiling.stage('profiled'):
+            sorted(range(10 ** 5), key=lambda x: -x)
+        with profiling.stage('not profiled'):
+            pass
+    profiler.to_json(tmp_path / 'metrics.json')
+
+    assert (tmp_path / 'profiled.prof').exists()
+    assert not (tmp_path / 'not profiled.prof').exists()
+    assert pstats.Stats(str(tmp_path / 'profiled.prof')).total_calls > 0
+
+    with (tmp_path / 'metrics.json').open() as f:
+        metrics = json.load(f)
+    assert [stage['name'] for stage in metrics['stages']] == ['profiled', 'not profiled']
+    assert set(metrics['stages'][0]) == {'name', 'wall_time', 'cpu_time', 'peak_rss_bytes', 'rows'}
+
+
+def test_add_counters_to_innermost_stage(tmp_path):
+    profiler = Profiler()
+
+    profiling.add_counters({'hits': 1})  # no active profiler
+    with profiler.activate():
+        with profiling.stage('outer'):
+            with profiling.stage('inner'):
+                profiling.add_counters({'hits': 1, 'misses': 2})
+                profiling.add_counters({'hits': 3})
+            profiling.add_counters({'misses': 1})
+    profiler.to_json(tmp_path / 'metrics.json')
+
+    outer, inner = profiler.stages
+    assert inner.counters == {'hits': 4, 'misses': 2}
+    assert outer.counters == {'misses': 1}
+    with (tmp_path / 'metrics.json').open() as f:
+        assert json.load(f)['stages'][1]['counters'] == {'hits': 4, 'misses': 2}
@@ -2,7 +2,9 @@ import pandas as pd
 
 import wta.helpers
 from wta.calendars.intervals import pd_interval_to_interval
-from wta.waiting_time.resource_unavailability import non_processing_intervals
+from wta.waiting_time.resource_index import ResourceEventIndex
+from wta.waiting_time.resource_unavailability import non_processing_intervals, \
+    other_processing_events_during_waiting_time_of_event
 
 
 class TestResource:
@@ -33,3 +35,24 @@ class TestResource:
         result = non_processing_intervals(event_index, event_log)
         assert result == expected_result
 
+
+    def test_non_processing_intervals_with_resource_index(self, assets_path):
+        log_path = assets_path / 'non_processing_intervals_2.csv'
+        event_log = wta.helpers.read_csv(log_path)
+        event_index = pd.Index([2])
+        resource_index = ResourceEventIndex(event_log)
+
+        result = non_processing_intervals(event_index, event_log, resource_index=resource_index)
+        assert result == non_processing_intervals(event_index, event_log)
+
+    def test_other_processing_events_with_resource_index(self, assets_path):
+        log_path = assets_path / 'non_processing_intervals_2.csv'
+        event_log = wta.helpers.read_csv(log_path)
+        resource_index = ResourceEventIndex(event_log)
+
+        for index in event_log.index:
+            event_index = pd.Index([index])
+            result = other_processing_events_during_waiting_time_of_event(
+                event_index, event_log, resource_index=resource_index)
+            expected = other_processing_events_during_waiting_time_of_event(event_index, event_log)
+            pd.testing.assert_frame_equal(result, expected)
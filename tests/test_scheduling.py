@@ -0,0 +1,106 @@
+import pytest
+from pandas.testing import assert_frame_equal
+
+from wta import EventLogIDs, read_csv
+from wta.helpers import default_log_ids
+from wta.main import run
+from wta.scheduling import available_cpu_count, balanced_chunks, resolve_workers, split_large_cases
+
+
+@pytest.mark.parametrize('test_data', [
+    {'files': {}, 'limit': None},
+    {'files': {'cpu.max': 'max 100000\n'}, 'limit': None},
+    {'files': {'cpu.max': '200000 100000\n'}, 'limit': 2},
+    {'files': {'cpu.max': '50000 100000\n'}, 'limit': 1},
+    {'files': {'cpu/cpu.cfs_quota_us': '150000\n', 'cpu/cpu.cfs_period_us': '100000\n'}, 'limit': 2},
+    {'files': {'cpu/cpu.cfs_quota_us': '-1\n', 'cpu/cpu.cfs_period_us': '100000\n'}, 'limit': None},
+    {'files': {'cgroup': '0::/app.slice/wta.service\n', 'cpu.max': 'max 100000\n',
+               'app.slice/wta.service/cpu.max': '300000 100000\n'}, 'limit': 3},
+    {'files': {'cgroup': '0::/app.slice/wta.service\n', 'app.slice/cpu.max': '200000 100000\n',
+               'app.slice/wta.service/cpu.max': 'max 100000\n'}, 'limit': 2},
+    {'files': {'cgroup': '4:cpu,cpuacct:/docker/abc\n', 'cpu/docker/abc/cpu.cfs_quota_us': '100000\n',
+               'cpu/docker/abc/cpu.cfs_period_us': '100000\n'}, 'limit': 1},
+], ids=['no cgroup', 'v2 without limit', 'v2 two cores', 'v2 half core', 'v1 one and a half cores', 'v1 without limit',
+        'v2 nested limit', 'v2 ancestor limit', 'v1 nested limit'])
+def test_available_cpu_count(tmp_path, monkeypatch, test_data):
+    monkeypatch.setattr('os.sched_getaffinity', lambda pid: set(range(8)), raising=False)
+    for name, content in test_data['files'].items():
+        (tmp_path / name).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / name).write_text(content)
+
+    expected = test_data['limit'] if test_data['limit'] is not None else 8
+    assert available_cpu_count(cgroup_root=tmp_path, proc_cgroup=tmp_path / 'cgroup') == expected
+
+
+def test_resolve_workers():
+    assert resolve_workers(None) >= 1
+    assert resolve_workers(3) == 3
+    with pytest.raises(ValueError):
+        resolve_workers(0)
+
+
+@pytest.mark.parametrize('test_data', [
+    {'sizes': [], 'n_chunks': 4, 'expected_totals': []},
+    {'sizes': [5, 1, 1], 'n_chunks': 8, 'expected_totals': [5, 1, 1]},
+    {'sizes': [10, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1], 'n_chunks': 2, 'expected_totals': [10, 10]},
+    {'sizes': [7, 6, 5, 4, 3, 2, 1], 'n_chunks': 3, 'expected_totals': [10, 9, 9]},
+])
+def test_balanced_chunks(test_data):
+    sizes = test_data['sizes']
+
+    chunks = balanced_chunks(sizes, test_data['n_chunks'])
+
+    assert sorted(position for chunk in chunks for position in chunk) == list(range(len(sizes)))
+    assert [sum(sizes[position] for position in chunk) for chunk in chunks] == test_data['expected_totals']
+
+
+@pytest.mark.integration
+def test_parallel_run_with_workers(assets_path):
+    log_path = assets_path / 'icpm/handoff-logs/handoff-test.csv'
+    log_ids = EventLogIDs()
+
+    expected = run(log_path, parallel_run=False, log_ids=log_ids)
+    result = run(log_path, parallel_run=True, log_ids=log_ids, n_workers=2)
+
+    assert_frame_equal(result, expected)
+
+
+@pytest.mark.integration
+@pytest.mark.parametrize('shared_memory', [False, True])
+def test_parallel_run_splitting_long_cases(assets_path, monkeypatch, shared_memory):
+    log_path = assets_path / 'ProductionCase44.csv'
+    log_ids = default_log_ids
+    # the single case of the log is long enough to be split into parts
+    monkeypatch.setattr('wta.scheduling.MIN_SPLIT_CASE_EVENTS', 1)
+    assert split_large_cases([len(read_csv(log_path, log_ids))], n_workers=2) != {}
+
+    expected = run(log_path, parallel_run=False, log_ids=log_ids)
+    result = run(log_path, parallel_run=True, log_ids=log_ids, n_workers=2, shared_memory=shared_memory)
+
+    assert_frame_equal(result, expected)
+
+
+def test_split_large_cases(monkeypatch):
+    monkeypatch.setattr('wta.scheduling.MIN_SPLIT_CASE_EVENTS', 10)
+
+    assert split_large_cases([100, 5, 5], n_workers=1) == {}
+    # 110 events in 8 chunks give parts of 14 events
+    assert split_large_cases([100, 5, 5], n_workers=2) == {0: 8}
+    assert split_large_cases([12] * 10, n_workers=2) == {}
+
+
+@pytest.mark.integration
+@pytest.mark.parametrize('test_data', [
+    {'log': 'icpm/handoff-logs/handoff-test.csv', 'log_ids': EventLogIDs(), 'parallel_run': False},
+    {'log': 'icpm/handoff-logs/handoff-test.csv', 'log_ids': EventLogIDs(), 'parallel_run': True},
+    {'log': 'ProductionCase44.csv', 'log_ids': default_log_ids, 'parallel_run': True},
+])
+def test_resource_partitioned_run(assets_path, test_data):
+    log_path = assets_path / test_data['log']
+    log_ids = test_data['log_ids']
+
+    expected = run(log_path, parallel_run=False, log_ids=log_ids, group_results=False)
+    result = run(log_path, parallel_run=test_data['parallel_run'], log_ids=log_ids, group_results=False,
+                 n_workers=2, partition_by_resource=True)
+
+    assert_frame_equal(result, expected)
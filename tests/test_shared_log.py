@@ -0,0 +1,74 @@
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+import pytest
+from pandas.testing import assert_frame_equal
+
+from wta import EventLogIDs
+from wta.helpers import decode_categorical
+from wta.main import run
+from wta.shared_log import SharedLog
+
+
+def test_shared_log_round_trip():
+    log = pd.DataFrame({
+        'case_id': [3, 1, 2],
+        'Activity': ['A', 'B', None],
+        'Resource': pd.Categorical(['R1', 'R2', 'R1']),
+        'start_time': pd.to_datetime(['2022-01-01 10:00', '2022-01-01 11:00', None], utc=True),
+        'end_time': pd.to_datetime(['2022-01-01 10:30', '2022-01-01 11:30', '2022-01-01 12:00']),
+        'wt_total': pd.to_timedelta(['1h', None, '2h']),
+        'batch_instance_id': [1.0, None, 2.0],
+    }, index=[10, 7, 12])
+
+    shared_log = SharedLog.publish(log)
+    try:
+        attached = shared_log.attach()
+        # object columns are attached as categoricals
+        assert isinstance(attached['Activity'].dtype, pd.CategoricalDtype)
+        attached['Activity'] = decode_categorical(attached['Activity'])
+        assert_frame_equal(attached, log)
+        shared_log.close()
+    finally:
+        shared_log.unlink()
+
+
+def test_shared_log_attach_does_not_copy_columns():
+    log = pd.DataFrame({
+        'case_id': [3, 1, 2],
+        'Activity': ['A', 'B', None],
+        'start_time': pd.to_datetime(['2022-01-01 10:00', '2022-01-01 11:00', None], utc=True),
+        'end_time': pd.to_datetime(['2022-01-01 10:30', '2022-01-01 11:30', '2022-01-01 12:00'],
+                                   utc=True).tz_convert('Europe/Tallinn'),
+    }, index=[10, 7, 12])
+
+    shared_log = SharedLog.publish(log)
+    try:
+        attached = shared_log.attach()
+        # the first value of every block is overwritten with the second one, through another mapping of the block
+        for column in [shared_log.index] + shared_log.columns:
+            block = shared_memory.SharedMemory(name=column.block_name)
+            values = np.ndarray((column.length,), dtype=np.dtype(column.dtype), buffer=block.buf)
+            values[0] = values[1]
+            del values
+            block.close()
+
+        expected = log.iloc[[1, 1, 2]]
+        expected.index = pd.Index([7, 7, 12])
+        attached['Activity'] = decode_categorical(attached['Activity'])
+        assert_frame_equal(attached, expected)
+        shared_log.close()
+    finally:
+        shared_log.unlink()
+
+
+@pytest.mark.integration
+def test_shared_memory_run(assets_path):
+    log_path = assets_path / 'icpm/handoff-logs/handoff-test.csv'
+    log_ids = EventLogIDs()
+
+    expected = run(log_path, parallel_run=False, log_ids=log_ids)
+    result = run(log_path, parallel_run=True, log_ids=log_ids, shared_memory=True)
+
+    assert_frame_equal(result, expected)
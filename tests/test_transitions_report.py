@@ -77,3 +77,103 @@
 #     per_case_wt['case_id'] = per_case_wt['case_id'].astype(str)
 #
 #     assert ((report.per_case_wt == per_case_wt).all()).all()
+
+
+import gzip
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from wta import EventLogIDs
+from wta.transitions_report import TransitionsReport, _dumps
+
+
+@pytest.fixture
+def small_report():
+    log_ids = EventLogIDs()
+    start = pd.Timestamp('2023-01-02 09:00', tz='UTC')
+    log = pd.DataFrame({
+        log_ids.case: [1, 1, 2, 2, 3],
+        log_ids.activity: ['A', 'B', 'A', 'B', 'A'],
+        log_ids.resource: ['R1', 'R2', 'R1', 'R3', 'R1'],
+        log_ids.start_time: [start, start + pd.Timedelta(hours=2), start, start + pd.Timedelta(hours=3), start],
+        log_ids.end_time: [start + pd.Timedelta(hours=1), start + pd.Timedelta(hours=3), start + pd.Timedelta(hours=1),
+                           start + pd.Timedelta(hours=4), start + pd.Timedelta(hours=1)],
+        log_ids.wt_total: pd.to_timedelta([0, 1, 0, 2, 0], unit='h'),
+    })
+
+    def hours(*values):
+        return pd.to_timedelta(list(values), unit='h')
+
+    transitions = pd.DataFrame({
+        'source_activity': ['A', 'A', 'A'],
+        'source_resource': ['R1', 'R1', 'R1'],
+        'destination_activity': ['B', 'B', 'B'],
+        'destination_resource': ['R2', 'R3', 'R2'],
+        'frequency': [1, 1, 1],
+        'cases': ['1', '2', '1'],
+        log_ids.wt_total: hours(1, 2, 0),
+        log_ids.wt_batching: hours(0, 1, 0),
+        log_ids.wt_prioritization: hours(0, 0, 0),
+        log_ids.wt_contention: hours(1, 0, 0),
+        log_ids.wt_unavailability: hours(0, 1, 0),
+        log_ids.wt_extraneous: hours(0, 0, 0),
+    })
+    return TransitionsReport(transitions, log, log_ids)
+
+
+def test_transitions_report_regrouped(small_report):
+    hour = 3600.0
+    total_pt, total_wt = 5 * hour, 3 * hour
+    assert small_report.total_pt == total_pt
+    assert small_report.total_wt == total_wt
+
+    assert len(small_report.report) == 1
+    entry = small_report.report[0]
+    assert (entry['source_activity'], entry['target_activity']) == ('A', 'B')
+    assert entry['case_freq'] == pytest.approx(2 / 3)
+    assert entry['total_freq'] == 3
+    assert entry['total_wt'] == total_wt
+    assert entry['cte_impact_total'] == pytest.approx(1.0)
+    assert entry['cte_impact']['batching_impact'] == pytest.approx(total_pt / (total_pt + total_wt - hour))
+
+    by_resource = entry['wt_by_resource']
+    assert [(r['source_resource'], r['target_resource']) for r in by_resource] == [('R1', 'R2'), ('R1', 'R3')]
+    # the two transitions between R1 and R2 happened in the same case
+    assert by_resource[0]['case_freq'] == pytest.approx(1 / 3)
+    assert by_resource[0]['total_freq'] == 2
+    assert by_resource[0]['contention_wt'] == hour
+    assert by_resource[1]['cte_impact_total'] == pytest.approx(total_pt / (total_pt + total_wt - 2 * hour))
+
+
+def test_transitions_report_per_case(small_report):
+    per_case_wt = small_report.per_case_wt
+
+    assert list(per_case_wt.columns) == ['case_id', 'wt_total', 'pt_total', 'cte_impact']
+    assert per_case_wt['case_id'].tolist() == ['1', '2', '3']
+    assert per_case_wt['wt_total'].tolist() == [3600.0, 7200.0, 0.0]
+    assert per_case_wt['pt_total'].tolist() == [7200.0, 7200.0, 3600.0]
+    assert per_case_wt['cte_impact'].tolist() == pytest.approx([2 / 3, 1 / 2, 1.0])
+
+
+@pytest.mark.parametrize('compress', [False, True])
+def test_transitions_report_to_json(small_report, tmp_path, compress):
+    json_path = tmp_path / ('report.json.gz' if compress else 'report.json')
+
+    small_report.to_json(json_path, compress=compress)
+
+    with (gzip.open(json_path, 'rt') if compress else json_path.open('r')) as f:
+        data = json.load(f)
+    assert data['num_cases'] == 3
+    assert data['num_transition_instances'] == 3
+    assert data['cte_impact'] == small_report.cte_impact.to_dict()
+    assert data['report'] == json.loads(json.dumps(small_report.report))
+    assert data['per_case_wt'] == small_report.per_case_wt.to_dict(orient='records')
+
+
+def test_dumps():
+    assert _dumps({'count': np.int64(3), 'share': np.float64(0.5)}) == '{"count": 3, "share": 0.5}'
+    with pytest.raises(TypeError, match='Object of type Timestamp is not JSON serializable'):
+        _dumps(pd.Timestamp('2023-01-01'))
@@ -0,0 +1,23 @@
+import pytest
+from pandas.testing import assert_frame_equal
+
+from wta import EventLogIDs
+from wta.main import run
+
+test_data = [
+    'handoff-test.csv',
+    'manual_log_3.csv',
+    'manual_log_5.csv',
+]
+
+
+@pytest.mark.integration
+@pytest.mark.parametrize('log_name', test_data)
+def test_vectorized_run(assets_path, log_name):
+    log_path = assets_path / 'icpm/handoff-logs' / log_name
+    log_ids = EventLogIDs()
+
+    expected = run(log_path, parallel_run=False, log_ids=log_ids)
+    result = run(log_path, parallel_run=False, log_ids=log_ids, vectorized=True)
+
+    assert_frame_equal(result.reset_index(drop=True), expected.reset_index(drop=True), check_dtype=False)
@@ -8,6 +8,9 @@ from wta import WAITING_TIME_TOTAL_KEY
 from wta.helpers import START_TIMESTAMP_KEY, ENABLED_TIMESTAMP_KEY
 from wta.waiting_time.analysis import __subtract_intervals_a_from_intervals_b_non_recursive, \
     __subtract_a_from_intervals_b
+from wta.waiting_time.interval_set import IntervalSet
+from wta.waiting_time.prioritization_and_contention import detect_contention_and_prioritization_intervals, \
+    detect_intervals
 
 
 def read_event_log(log_path: Path) -> pd.DataFrame:
@@ -91,6 +94,33 @@ def test_analysis_subtract_intervals_a_from_intervals_b_non_recursive(test_case)
     assert result == test_case['expected']
 
 
+def make_interval_set(intervals) -> IntervalSet:
+    return IntervalSet([interval.left for interval in intervals], [interval.right for interval in intervals])
+
+
+@pytest.mark.parametrize('test_case', interval_test_data, ids=[test_data['name'] for test_data in interval_test_data])
+def test_interval_set_difference(test_case):
+    a = make_interval_set(test_case['a'])
+    b = make_interval_set(test_case['b'])
+    result = b.difference(a)
+    assert result == make_interval_set(test_case['expected'])
+    assert result.length == sum(interval.length for interval in test_case['expected'])
+
+
+def test_interval_set_union():
+    a = IntervalSet([0, 3, 20, 8], [5, 10, 30, 9])
+    assert a == IntervalSet([0, 20], [10, 30])
+    assert a.union(IntervalSet([10, 40], [15, 40])) == IntervalSet([0, 20], [15, 30])
+    assert a.union(IntervalSet([], [])).length == 20
+
+
+def test_interval_set_from_timestamps():
+    a = IntervalSet.from_timestamps([pd.Timestamp('2023-01-02 10:00:00+02:00')],
+                                   [pd.Timestamp('2023-01-02 09:00:00', tz='UTC')])
+    assert a.to_pd_intervals() == [pd.Interval(pd.Timestamp('2023-01-02 08:00:00', tz='UTC'),
+                                               pd.Timestamp('2023-01-02 09:00:00', tz='UTC'))]
+
+
 singular_from_intervals_test_data = [
     {
         'name': 'A',
@@ -132,3 +162,71 @@ def test_analysis_subtract_a_from_intervals_b(test_case):
     b = test_case['b']
     result = __subtract_a_from_intervals_b(a, b)
     assert result == test_case['expected']
+
+
+
+def _hours(values: list) -> pd.Series:
+    return pd.Series(pd.Timestamp('2023-01-02', tz='UTC') + pd.to_timedelta(values, unit='h'))
+
+
+def _as_hours(intervals) -> list:
+    return sorted(zip(*[((pd.to_datetime(timestamps, utc=True) - _hours([0])[0]) / pd.Timedelta(hours=1)).tolist()
+                        for timestamps in intervals]))
+
+
+@pytest.mark.parametrize('test_data', [
+    {
+        # event 2 is in the batch of event 0 and prioritized since it was enabled later, event 1 is out of the batch
+        # and processed due to contention from the batch enabled time on, event 3 has no enabled time
+        'batch_ids': [0, None, 0, None, None],
+        'batch_enabled': [10, None, 9, None, None],
+        'contention': [(10, 11)],
+        'prioritization': [(9, 10)],
+    },
+    {
+        # out of any batch, the other events are compared with the batch enabled time of event 0
+        'batch_ids': [None, None, None, None, None],
+        'batch_enabled': [10, None, None, None, None],
+        'contention': [(10, 10), (10, 11)],
+        'prioritization': [],
+    },
+    {
+        'batch_ids': [None, None, None, None, None],
+        'batch_enabled': [None, None, None, None, None],
+        'contention': [(10, 11)],
+        'prioritization': [(9, 10)],
+    },
+])
+def test_detect_contention_and_prioritization_intervals(test_data):
+    log_ids = wta.EventLogIDs()
+    # event 0 of the resource waits from 8 to 12, event 4 is processed before
+    log = pd.DataFrame({
+        log_ids.case: [1, 2, 3, 4, 5],
+        log_ids.resource: ['R1'] * 5,
+        log_ids.enabled_time: _hours([8, 7, 9, None, 5]),
+        log_ids.start_time: _hours([12, 10, 9, 11, 6]),
+        log_ids.end_time: _hours([13, 11, 10, 11.5, 7]),
+        log_ids.batch_id: pd.array(test_data['batch_ids'], dtype='Int64'),
+        log_ids.batch_instance_enabled: _hours(test_data['batch_enabled']),
+    })
+
+    contention, prioritization = detect_contention_and_prioritization_intervals(log.index[[0]], log, log_ids)
+
+    assert _as_hours(contention) == test_data['contention']
+    assert _as_hours(prioritization) == test_data['prioritization']
+
+
+def test_detect_intervals():
+    log_ids = wta.EventLogIDs()
+    # the event waits from 8 to 12, the others are enabled before, after and never
+    event = pd.DataFrame({log_ids.start_time: _hours([12])})
+    processing_events = pd.DataFrame({
+        log_ids.enabled_time: _hours([7, 9, None]),
+        log_ids.start_time: _hours([10, 9, 11]),
+        log_ids.end_time: _hours([11, 10, 11.5]),
+    })
+
+    contention, prioritization = detect_intervals(processing_events, _hours([8])[0], log_ids, event)
+
+    assert _as_hours(contention) == [(10, 11)]
+    assert _as_hours(prioritization) == [(9, 10)]
@@ -0,0 +1,73 @@
+import pandas as pd
+import pytest
+from pandas.testing import assert_frame_equal
+
+from wta import EventLogIDs
+from wta.main import run
+from wta.profiling import Profiler
+from wta.waiting_time.window_cache import WaitingWindowCache, window_key
+
+
+def test_cache_evicts_least_recently_used():
+    cache = WaitingWindowCache(maxsize=2)
+    computed = []
+
+    def get(key):
+        return cache.get(key, lambda: computed.append(key) or key.upper())
+
+    assert [get('a'), get('b'), get('a'), get('c'), get('b'), get('a')] == ['A', 'B', 'A', 'C', 'B', 'A']
+
+    # b was evicted by c, since a was used more recently, and then a by b
+    assert computed == ['a', 'b', 'c', 'b', 'a']
+    assert len(cache) == 2
+    assert cache.counters() == {'window_cache_hits': 1, 'window_cache_misses': 5}
+
+
+def test_window_key():
+    log_ids = EventLogIDs()
+    destination = pd.Series({
+        log_ids.resource: 'R1',
+        log_ids.enabled_time: pd.Timestamp('2023-01-02 08:00', tz='UTC'),
+        log_ids.start_time: pd.NaT,
+        log_ids.batch_id: float('nan'),
+    })
+
+    key = window_key(destination, log_ids.resource, log_ids.enabled_time, log_ids.start_time, log_ids.batch_id,
+                     log_ids.batch_instance_enabled)
+
+    assert key == ('R1', pd.Timestamp('2023-01-02 08:00', tz='UTC').value, None, None, None)
+    assert hash(key) == hash(window_key(destination.copy(), log_ids.resource, log_ids.enabled_time,
+                                        log_ids.start_time, log_ids.batch_id, log_ids.batch_instance_enabled))
+
+
+@pytest.mark.parametrize('test_data', [
+    {'parallel_run': False, 'partition_by_resource': False},
+    {'parallel_run': True, 'partition_by_resource': False},
+    {'parallel_run': False, 'partition_by_resource': True},
+    {'parallel_run': True, 'partition_by_resource': True},
+])
+def test_shared_waiting_windows_are_analyzed_once(assets_path, tmp_path, monkeypatch, test_data):
+    log_ids = EventLogIDs()
+    # every case has a copy, whose events have the same resources, enabled and start times
+    log = pd.read_csv(assets_path / 'icpm/handoff-logs/handoff-test.csv')
+    copies = log.assign(**{log_ids.case: log[log_ids.case] + log[log_ids.case].max() + 1})
+    pd.concat([log, copies]).to_csv(tmp_path / 'log.csv', index=False)
+
+    def analyze(profiler: Profiler) -> pd.DataFrame:
+        with profiler.activate():
+            return run(tmp_path / 'log.csv', parallel_run=test_data['parallel_run'], log_ids=log_ids,
+                       group_results=False, n_workers=2, partition_by_resource=test_data['partition_by_resource'])
+
+    profiler = Profiler()
+    result = analyze(profiler)
+    counters = next(stage.counters for stage in profiler.stages if stage.name == 'transitions')
+
+    monkeypatch.setattr('wta.activity_transitions.WaitingWindowCache', lambda: WaitingWindowCache(maxsize=0))
+    uncached_profiler = Profiler()
+    expected = analyze(uncached_profiler)
+    uncached_counters = next(stage.counters for stage in uncached_profiler.stages if stage.name == 'transitions')
+
+    assert_frame_equal(result, expected)
+    assert counters['window_cache_hits'] > 0
+    assert uncached_counters['window_cache_hits'] == 0
+    assert counters['window_cache_hits'] + counters['window_cache_misses'] == uncached_counters['window_cache_misses']